@@ -12,15 +12,8 @@ migrate = Migrate()
 cache = Cache()
 compress = Compress()
 # Socket.IO 配置
-# 注意：Flask-SocketIO 在 WSGI 环境中不支持 WebSocket，只使用 polling
-# async_mode 会在 init_app 时根据配置设置
-socketio = SocketIO(
-    cors_allowed_origins="*",
-    logger=True,  # 临时启用日志以便调试
-    engineio_logger=True,  # 临时启用引擎日志以便调试
-    ping_timeout=60,
-    ping_interval=25
-)
+# async_mode、心跳與日誌在 init_app 時依配置設定；eventlet / gevent 模式支援 WebSocket
+socketio = SocketIO(cors_allowed_origins="*")
 
 def create_app(config_class=Config):
     """應用工廠函數"""
@@ -47,37 +40,32 @@ def create_app(config_class=Config):
     # 无需手动创建 engine，Flask-SQLAlchemy 会在首次访问时自动创建
     db.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'])
+    # 設定 SOCKETIO_MESSAGE_QUEUE 時經由 pub/sub 把 emit 轉送到所有 worker；
+    # 各房間最近的事件保留在記憶體中，供斷線重連補送
+    from app.utils.socketio_queue import create_client_manager
+    client_manager = create_client_manager(app.config.get('SOCKETIO_MESSAGE_QUEUE'),
+                                           app.config.get('SOCKETIO_CHANNEL', 'flask-socketio'),
+                                           replay_size=app.config['SOCKETIO_REPLAY_BUFFER_SIZE'])
+    socketio.init_app(
+        app,
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+        ping_interval=app.config['SOCKETIO_PING_INTERVAL'],
+        ping_timeout=app.config['SOCKETIO_PING_TIMEOUT'],
+        # 逐封包日誌在每個 polling 請求上都有成本，只在除錯時開啟
+        logger=app.config['SOCKETIO_LOGGER'],
+        engineio_logger=app.config['SOCKETIO_LOGGER'],
+        client_manager=client_manager
+    )
     
     # 初始化快取和壓縮
     cache.init_app(app)
+    from app.utils.cache_tags import init_cache_tags
+    init_cache_tags(app)
     
-    # 在初始化 Flask-Compress 之前，添加 before_request 鉤子排除 Socket.IO 路徑
-    @app.before_request
-    def skip_compression_for_socketio_before():
-        """在請求處理前排除 Socket.IO 路徑，防止 Flask-Compress 壓縮"""
-        from flask import request
-        if request.path.startswith('/socket.io'):
-            # 設置標記，告訴 Flask-Compress 不要壓縮這個請求
-            request.environ['flask_compress.skip'] = True
-    
+    # /socket.io 的請求由 Flask-SocketIO 的 WSGI middleware 在進入 Flask 之前處理，
+    # 不經過 before_request / after_request，也不會被 Flask-Compress 壓縮
     compress.init_app(app)
     
-    # 使用 after_request 鉤子作為雙重保險，確保 Socket.IO 響應不被壓縮
-    @app.after_request
-    def skip_compression_for_socketio_after(response):
-        """在響應處理後移除壓縮相關的響應頭（雙重保險）"""
-        from flask import request
-        if request.path.startswith('/socket.io'):
-            # 移除壓縮相關的響應頭，確保 Socket.IO 請求不被壓縮
-            response.headers.pop('Content-Encoding', None)
-            # 不刪除 Content-Length，因為 Socket.IO 可能需要它
-            # 確保響應不被緩存
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-        return response
-    
     # 註冊藍圖（延遲導入避免循環依賴）
     with app.app_context():
         from app.routes.auth import auth_bp
@@ -102,6 +90,7 @@ def create_app(config_class=Config):
         from app.routes.api.points import points_api_bp
         from app.routes.api.tables import tables_api_bp
         from app.routes.api.payment_methods import payment_methods_api_bp
+        from app.routes.api.search import search_api_bp
         from app.routes.websocket import websocket_bp
         from app.routes.seo import seo_bp
         
@@ -128,6 +117,7 @@ def create_app(config_class=Config):
         app.register_blueprint(points_api_bp, url_prefix='/api')
         app.register_blueprint(tables_api_bp, url_prefix='/api')
         app.register_blueprint(payment_methods_api_bp, url_prefix='/api')
+        app.register_blueprint(search_api_bp, url_prefix='/api/search')
         app.register_blueprint(websocket_bp)
         
         # 靜態文件路由：提供上傳的圖片
@@ -140,26 +130,35 @@ def create_app(config_class=Config):
             uploads_dir_public = os.path.join(BASE_DIR, 'public', 'uploads')
             upload_folder = uploads_dir if os.path.exists(uploads_dir) else uploads_dir_public
             return send_from_directory(upload_folder, filename)
-        
-        # 根路径指向前台首页
-        @app.route('/')
-        @cache.cached(timeout=300)  # 快取5分鐘
-        def index():
-            from flask import render_template
-            from app.models import Shop, HomeBanner
-            shops = Shop.query.filter_by(status='active').all()
-            banners = HomeBanner.query.filter_by(is_active=True).order_by(HomeBanner.display_order).all()
-            return render_template('store/index.html', shops=shops, banners=banners)
     
     # 註冊錯誤處理器
     from app.utils.error_handlers import register_error_handlers
     register_error_handlers(app)
     
-    # 添加模板上下文：提供靜態文件版本號
+    # 交易外寄箱派送器（送出 Socket.IO 事件、稽核日誌）
+    from app.utils.outbox import init_outbox
+    init_outbox(app)
+    
+    # 訂單事件合併送出（SOCKETIO_COALESCE_WINDOW_MS）
+    from app.utils.socketio_coalesce import init_coalescing
+    init_coalescing(app)
+    
+    # 站內搜尋索引（每個 worker 背景建立）
+    from app.utils.search import init_search
+    init_search(app)
+    
+    # Socket.IO 頻道成員資格存於 session（連線時不查詢資料庫，失效時於下一個請求重新載入）
+    from app.utils.session_claims import init_session_claims
+    init_session_claims(app)
+    
+    # 前端 Socket.IO 傳輸方式（base/app.html 輸出給 socketio_client.js）
     @app.context_processor
-    def inject_static_version():
-        import time
-        return dict(static_version=int(time.time()))
+    def inject_socketio_transports():
+        return dict(socketio_transports=app.config['SOCKETIO_TRANSPORTS'])
+    
+    # 靜態文件內容雜湊網址（模板函數 static_url，帶雜湊的網址長期快取）
+    from app.utils.static_assets import init_static_assets
+    init_static_assets(app)
     
     return app
 
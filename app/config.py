@@ -54,6 +54,23 @@ class Config:
         except ImportError:
             SOCKETIO_ASYNC_MODE = 'threading'
     SOCKETIO_CORS_ALLOWED_ORIGINS = os.environ.get('SOCKETIO_CORS_ALLOWED_ORIGINS', '*')
+    # 前端傳輸方式（依序嘗試）：eventlet / gevent 支援 WebSocket，優先使用 WebSocket，無法連線時退回 polling；
+    # threading 模式（uWSGI / 開發伺服器）只用 polling
+    SOCKETIO_TRANSPORTS = os.environ.get(
+        'SOCKETIO_TRANSPORTS',
+        'websocket,polling' if SOCKETIO_ASYNC_MODE in ('eventlet', 'gevent', 'gevent_uwsgi') else 'polling'
+    ).split(',')
+    SOCKETIO_PING_INTERVAL = int(os.environ.get('SOCKETIO_PING_INTERVAL', '25'))  # 心跳間隔（秒）
+    SOCKETIO_PING_TIMEOUT = int(os.environ.get('SOCKETIO_PING_TIMEOUT', '60'))  # 心跳逾時（秒）
+    SOCKETIO_LOGGER = os.environ.get('SOCKETIO_LOGGER', 'False').lower() in ('true', '1', 't')  # 逐封包日誌（除錯用）
+    # 跨 worker 訊息佇列：多個 gunicorn worker 時必須設定，否則 emit 只送到同一個 worker 的客戶端
+    # redis://localhost:6379/1（正式環境）或 sqlite:////tmp/socketio-queue.db（本機測試）；空值表示單一行程
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    # 斷線重連補送：每個房間在記憶體中保留的事件數（超過時由外寄箱補送，再不足才重新載入頁面）
+    SOCKETIO_REPLAY_BUFFER_SIZE = int(os.environ.get('SOCKETIO_REPLAY_BUFFER_SIZE', '200'))
+    # 訂單事件合併視窗（毫秒，建議 50–200）：同一房間在視窗內的訂單事件合併為一則 orders_batch；0 表示不合併
+    SOCKETIO_COALESCE_WINDOW_MS = int(os.environ.get('SOCKETIO_COALESCE_WINDOW_MS', '0'))
     
     # SEO 配置
     BASE_URL = os.environ.get('BASE_URL') or 'https://yourdomain.com'  # 网站基础 URL，用于 SEO
@@ -70,6 +87,7 @@ class Config:
     ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
     # Flask-Caching 配置
+    # simple 為每個 worker 各自一份（快取標籤失效不跨 worker，帶標籤的快取最多保存 5 分鐘）；多 worker 部署請用 redis
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')  # simple, redis, memcached, filesystem
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', '300'))  # 默認5分鐘
     CACHE_KEY_PREFIX = 'quick_foods_'
@@ -80,12 +98,25 @@ class Config:
     CACHE_REDIS_DB = int(os.environ.get('CACHE_REDIS_DB', '0'))
     CACHE_REDIS_PASSWORD = os.environ.get('CACHE_REDIS_PASSWORD', None)
     
+    # 下單冪等（Idempotency-Key）記錄保留時間，超過後同一個 key 視為新請求
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+    
+    # 交易外寄箱派送器（每個 worker 一個背景 greenlet / 執行緒）
+    OUTBOX_DISPATCHER_ENABLED = os.environ.get('OUTBOX_DISPATCHER_ENABLED', 'True').lower() in ('true', '1', 't')
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '0.5'))  # 無待派送事件時的輪詢間隔（秒）
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))  # 超過後不再重試
+    # 已派送事件保留時數（也是斷線重連可由外寄箱補送的時間範圍），派送器每 OUTBOX_PRUNE_INTERVAL 秒清理一次
+    OUTBOX_RETENTION_HOURS = float(os.environ.get('OUTBOX_RETENTION_HOURS', '24'))
+    OUTBOX_PRUNE_INTERVAL = float(os.environ.get('OUTBOX_PRUNE_INTERVAL', '300'))
+    
     # Flask-Compress 配置
     COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/xml', 'application/json', 'application/javascript', 'text/javascript']
     COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))  # 壓縮級別 1-9，6 是平衡點
     COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))  # 最小壓縮大小（字節）
-    # 排除 Socket.IO 路徑不被壓縮（Socket.IO polling 請求不應被壓縮）
-    # 使用多種匹配方式確保 Socket.IO 路徑完全不被壓縮
+    # 串流回應（如產品匯出）不壓縮：Flask-Compress 會先把整個內容讀進記憶體再壓縮，失去串流的意義
+    COMPRESS_STREAMS = False
+    # Socket.IO 路徑（實際上在進入 Flask 之前就由 Flask-SocketIO 處理，不會被壓縮）
     COMPRESS_EXCLUDE = [
         '/socket.io',  # 精確匹配 Socket.IO 路徑
         'socket.io',   # 包含 socket.io 的路徑
@@ -64,6 +64,7 @@ class Shop(db.Model):
     max_tables = db.Column(db.Integer, default=0, nullable=False)  # 最大桌号数量
     qrcode_enabled = db.Column(db.Boolean, default=False, nullable=False)  # 是否启用桌号扫码
     status = db.Column(db.String(20), default='active', nullable=False)  # active, inactive
+    menu_version = db.Column(db.Integer, default=1, nullable=False)  # 菜單文件版本（產品、配料等異動時遞增）
     deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # 軟刪除時間戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -123,7 +124,7 @@ class Product(db.Model):
     
     deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # 軟刪除時間戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)  # 搜尋索引增量更新用
     
     # 關係
     toppings = db.relationship('Topping', secondary=product_topping, lazy='subquery',
@@ -187,9 +188,28 @@ class Order(db.Model):
     payments = db.relationship('OrderPayment', backref='order', lazy=True, cascade='all, delete-orphan')
     table = db.relationship('Table', backref='orders', foreign_keys=[table_id])
     
+    # 複合索引（支撐 (created_at, id) 游標分頁）
+    __table_args__ = (
+        Index('idx_order_user_created', 'user_id', 'created_at', 'id'),
+        Index('idx_order_shop_created', 'shop_id', 'created_at', 'id'),
+        Index('idx_order_created', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
+class OrderSequence(db.Model):
+    """訂單流水號計數器（每店每日一行，原子遞增）"""
+    __tablename__ = 'order_sequence'
+    
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), primary_key=True)
+    seq_date = db.Column(db.Date, primary_key=True)  # 流水號所屬日期
+    last_seq = db.Column(db.Integer, default=0, nullable=False)  # 最後發出的流水號
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<OrderSequence shop={self.shop_id} date={self.seq_date} seq={self.last_seq}>'
+
 class OrderItem(db.Model):
     """訂單項模型"""
     __tablename__ = 'order_item'
@@ -212,7 +232,10 @@ class OrderItem(db.Model):
                                backref=db.backref('order_items', lazy=True))
     
     def get_topping_prices(self):
-        """獲取此訂單項目中每個配料的價格"""
+        """獲取此訂單項目中每個配料的價格（若已由 order_detail 批量載入則直接使用）"""
+        preloaded = getattr(self, '_topping_prices', None)
+        if preloaded is not None:
+            return preloaded
         result = db.session.execute(
             db.select(order_item_topping.c.topping_id, order_item_topping.c.price)
             .where(order_item_topping.c.order_item_id == self.id)
@@ -345,27 +368,9 @@ class SystemSetting(db.Model):
     
     @staticmethod
     def get(key, default=None):
-        """獲取設定值"""
-        setting = SystemSetting.query.filter_by(setting_key=key).first()
-        if not setting:
-            return default
-        
-        # 根據類型轉換
-        if setting.setting_type == 'boolean':
-            return setting.setting_value.lower() in ['true', '1', 'yes']
-        elif setting.setting_type == 'number':
-            try:
-                return int(setting.setting_value)
-            except (ValueError, TypeError):
-                return default
-        elif setting.setting_type == 'json':
-            try:
-                import json
-                return json.loads(setting.setting_value)
-            except:
-                return default
-        else:
-            return setting.setting_value
+        """獲取設定值（讀取行程內的參考資料快取，設定異動後各 worker 自動重新載入）"""
+        from app.utils.reference_data import setting
+        return setting(key, default)
     
     @staticmethod
     def set(key, value, setting_type='text', description=None, category='general'):
@@ -509,3 +514,54 @@ class PointTransaction(db.Model):
     def __repr__(self):
         return f'<PointTransaction user={self.user_id} points={self.points}>'
 
+
+class IdempotencyKey(db.Model):
+    """下單請求冪等記錄（Idempotency-Key 對應的已完成回應）"""
+    __tablename__ = 'idempotency_key'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(64), nullable=False)  # 端點 + 使用者（訪客為 guest-<店鋪ID與桌號的雜湊>）
+    key = db.Column(db.String(128), nullable=False)  # 客戶端提供的 Idempotency-Key
+    request_hash = db.Column(db.String(64), nullable=False)  # 請求內容的 SHA-256
+    status_code = db.Column(db.Integer, nullable=True)  # NULL 表示處理中
+    response_body = db.Column(db.Text, nullable=True)  # 已完成回應的 JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    __table_args__ = (
+        Index('uq_idempotency_scope_key', 'scope', 'key', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope} {self.key}>'
+
+class OutboxEvent(db.Model):
+    """交易外寄箱（與業務資料同一交易寫入，由背景派送器送出 Socket.IO 事件、稽核日誌等）"""
+    __tablename__ = 'outbox_event'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # socketio, audit, ...
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # 派送失敗次數
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    dispatched_at = db.Column(db.DateTime, nullable=True)  # NULL 表示待派送
+    seq = db.Column(db.BigInteger, nullable=True)  # 派送時配發的房間事件序號（只有 socketio 事件），依派送順序遞增
+    
+    __table_args__ = (
+        Index('idx_outbox_pending', 'dispatched_at', 'id'),
+        Index('uq_outbox_seq', 'seq', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.kind}>'
+
+
+class OutboxSequence(db.Model):
+    """外寄箱派送序號（單一行；派送器以 SELECT ... FOR UPDATE 鎖定此行，依序配發 seq）"""
+    __tablename__ = 'outbox_sequence'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    last_seq = db.Column(db.BigInteger, default=0, nullable=False)  # 最後配發的序號
+    
+    def __repr__(self):
+        return f'<OutboxSequence seq={self.last_seq}>'
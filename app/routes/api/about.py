@@ -5,19 +5,23 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import About
 from app.utils.decorators import role_required
+from app.utils.conditional import conditional_get, collection_validators, row_validators
 from app.utils.update_logger import log_update
 
 about_api_bp = Blueprint('about_api', __name__)
 
+def _list_query():
+    """列表查詢（依 is_active 參數篩選），視圖與條件式 GET 驗證器共用"""
+    query = About.query
+    if request.args.get('is_active', type=str) == 'true':
+        query = query.filter_by(is_active=True)
+    return query
+
 @about_api_bp.route('', methods=['GET'])
+@conditional_get(lambda: collection_validators(_list_query()))
 def get_about_list():
     """獲取關於我們列表（公開，可篩選啟用狀態）"""
-    is_active = request.args.get('is_active', type=str)
-    
-    query = About.query
-    if is_active == 'true':
-        query = query.filter_by(is_active=True)
-    
+    query = _list_query()
     about_list = query.order_by(About.display_order, About.created_at.desc()).all()
     
     return jsonify([{
@@ -31,6 +35,7 @@ def get_about_list():
     } for about in about_list])
 
 @about_api_bp.route('/<int:about_id>', methods=['GET'])
+@conditional_get(lambda about_id: row_validators(About, about_id))
 def get_about(about_id):
     """獲取單個關於我們記錄"""
     about = About.query.get_or_404(about_id)
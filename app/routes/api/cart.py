@@ -2,8 +2,8 @@
 購物車 API 路由
 """
 from flask import Blueprint, request, jsonify, session
-from app import db
-from app.models import Product
+from app.utils.pricing import get_pricing, resolve_product_shops, normalize_id, PricingError
+from app.utils.validators import validate_integer
 from datetime import datetime
 
 cart_api_bp = Blueprint('cart_api', __name__)
@@ -31,40 +31,53 @@ def add_to_cart():
                 'message': '缺少產品 ID'
             }), 400
         
-        product_id = data['product_id']
-        quantity = data.get('quantity', 1)
+        # 計價快照以整數為鍵，"1" 與 1 視為同一產品
+        product_id = normalize_id(data['product_id'])
         toppings = data.get('toppings', [])
         drink_type = data.get('drink_type')  # 'cold', 'hot', or None
-        drink_price = data.get('drink_price', 0)
         
-        # 驗證產品
-        product = Product.query.get(product_id)
-        if not product:
+        is_valid, quantity, error_msg = validate_integer(data.get('quantity', 1), '數量', min_value=1)
+        if not is_valid:
+            return jsonify({
+                'error': 'validation_error',
+                'message': error_msg
+            }), 400
+        
+        # 驗證產品（計價快照，記憶體中；庫存於下單時原子扣減）
+        shop_id = resolve_product_shops([product_id]).get(product_id)
+        pricing = get_pricing(shop_id) if shop_id else None
+        if pricing is None:
             return jsonify({
                 'error': 'not_found',
                 'message': '產品不存在'
             }), 404
         
-        # 檢查庫存
-        if product.stock_quantity < quantity:
+        # 以伺服器端價格計算單價（產品價格 + 配料價格 + 飲品價格），不採用前端傳入的價格
+        try:
+            line = pricing.price_line(
+                product_id,
+                [normalize_id(t['id'] if isinstance(t, dict) else t) for t in toppings],
+                drink_type,
+                quantity,
+                strict=False
+            )
+        except PricingError as e:
             return jsonify({
-                'error': 'insufficient_stock',
-                'message': '庫存不足'
+                'error': 'validation_error',
+                'message': str(e)
             }), 400
         
+        unit_price = float(line.unit_price)
+        drink_type = line.drink_type
+        drink_total_price = float(line.drink_price)
+        toppings = [
+            {'id': topping_id, 'name': pricing.toppings[topping_id].name, 'price': float(price)}
+            for topping_id, price in line.toppings
+        ]
+        
         # 獲取購物車
         cart = get_cart_from_session()
         
-        # 計算配料總價
-        toppings_price = sum(t.get('price', 0) for t in toppings)
-        
-        # 計算飲品價格
-        drink_total_price = float(drink_price) if drink_type and drink_price else 0
-        
-        # 計算單價（產品價格 + 配料價格 + 飲品價格）
-        base_price = product.discounted_price if product.discounted_price else product.unit_price
-        unit_price = float(base_price) + toppings_price + drink_total_price
-        
         # 檢查購物車中是否已有相同產品、配料和飲品組合
         existing_item = None
         topping_ids = sorted([t['id'] for t in toppings])
@@ -84,8 +97,8 @@ def add_to_cart():
             # 新增項目
             cart_item = {
                 'product_id': product_id,
-                'product_name': product.name,
-                'shop_id': product.shop_id,  # 添加店鋪 ID
+                'product_name': line.product_name,
+                'shop_id': pricing.shop_id,  # 添加店鋪 ID
                 'quantity': quantity,
                 'unit_price': unit_price,
                 'toppings': toppings,
@@ -146,7 +159,7 @@ def update_cart():
                 'message': '缺少產品 ID'
             }), 400
         
-        product_id = data['product_id']
+        product_id = normalize_id(data['product_id'])
         quantity = data.get('quantity', 1)
         
         cart = get_cart_from_session()
@@ -185,7 +198,7 @@ def remove_from_cart():
                 'message': '缺少產品 ID'
             }), 400
         
-        product_id = data['product_id']
+        product_id = normalize_id(data['product_id'])
         cart = get_cart_from_session()
         
         # 移除項目
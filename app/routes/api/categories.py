@@ -2,15 +2,17 @@
 分類 API 路由
 """
 from flask import Blueprint, request, jsonify
-from app import db, cache
+from app import db
 from app.models import Category, Product
 from app.utils.decorators import login_required, role_required
 from app.utils.update_logger import log_update
+from app.utils.menu import mark_all_menus_changed
+from app.utils.cache_tags import tagged_cache, invalidate_tags
 
 categories_api_bp = Blueprint('categories_api', __name__)
 
 @categories_api_bp.route('', methods=['GET'])
-@cache.cached(timeout=600, key_prefix='categories_list')  # 快取10分鐘
+@tagged_cache(tags=['categories', 'products'])  # 含產品數量，產品異動時也失效
 def get_categories():
     """獲取所有分類"""
     categories = Category.query.order_by(Category.name).all()
@@ -30,7 +32,7 @@ def get_categories():
     return jsonify(result)
 
 @categories_api_bp.route('/<int:category_id>', methods=['GET'])
-@cache.cached(timeout=600)  # 快取10分鐘，自動包含category_id參數
+@tagged_cache(tags=['categories', 'products'])
 def get_category(category_id):
     """獲取單個分類"""
     category = Category.query.get_or_404(category_id)
@@ -80,7 +82,7 @@ def create_category():
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('categories_list')
+        invalidate_tags('categories')
         
         return jsonify({
             'id': category.id,
@@ -134,11 +136,12 @@ def update_category(category_id):
             description=f'更新分類: {category.name}'
         )
         
+        # 分類名稱出現在各店鋪的菜單文件中
+        mark_all_menus_changed()
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('categories_list')
-        cache.delete_memoized(get_category, category_id)
+        invalidate_tags('categories')
         
         return jsonify({
             'id': category.id,
@@ -178,8 +181,7 @@ def delete_category(category_id):
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('categories_list')
-        cache.delete_memoized(get_category, category_id)
+        invalidate_tags('categories')
         
         return jsonify({'message': '刪除成功'}), 200
         
@@ -7,6 +7,7 @@ from werkzeug.utils import secure_filename
 from app import db
 from app.models import HomeBanner
 from app.utils.decorators import role_required
+from app.utils.conditional import conditional_get, collection_validators, row_validators
 from app.utils.update_logger import log_update
 from app.utils.image_processor import convert_to_webp, allowed_image_file
 from app.utils.upload_path import get_upload_file_path
@@ -14,15 +15,18 @@ from datetime import datetime
 
 home_banners_api_bp = Blueprint('home_banners_api', __name__)
 
+def _list_query():
+    """列表查詢（依 is_active 參數篩選），視圖與條件式 GET 驗證器共用"""
+    query = HomeBanner.query
+    if request.args.get('is_active', type=str) == 'true':
+        query = query.filter_by(is_active=True)
+    return query
+
 @home_banners_api_bp.route('', methods=['GET'])
+@conditional_get(lambda: collection_validators(_list_query()))
 def get_home_banners():
     """獲取所有首頁 Banner（公開，可篩選啟用狀態）"""
-    is_active = request.args.get('is_active', type=str)
-    
-    query = HomeBanner.query
-    if is_active == 'true':
-        query = query.filter_by(is_active=True)
-    
+    query = _list_query()
     banners = query.order_by(HomeBanner.display_order, HomeBanner.created_at.desc()).all()
     
     return jsonify([{
@@ -39,6 +43,7 @@ def get_home_banners():
     } for banner in banners])
 
 @home_banners_api_bp.route('/<int:banner_id>', methods=['GET'])
+@conditional_get(lambda banner_id: row_validators(HomeBanner, banner_id))
 def get_home_banner(banner_id):
     """獲取單個 Banner"""
     banner = HomeBanner.query.get_or_404(banner_id)
@@ -7,6 +7,7 @@ from werkzeug.utils import secure_filename
 from app import db
 from app.models import News
 from app.utils.decorators import role_required
+from app.utils.conditional import conditional_get, collection_validators, row_validators
 from app.utils.update_logger import log_update
 from app.utils.image_processor import convert_to_webp, allowed_image_file
 from app.utils.upload_path import get_upload_file_path
@@ -14,15 +15,18 @@ from datetime import datetime
 
 news_api_bp = Blueprint('news_api', __name__)
 
+def _list_query():
+    """列表查詢（依 is_active 參數篩選），視圖與條件式 GET 驗證器共用"""
+    query = News.query
+    if request.args.get('is_active', type=str) == 'true':
+        query = query.filter_by(is_active=True)
+    return query
+
 @news_api_bp.route('', methods=['GET'])
+@conditional_get(lambda: collection_validators(_list_query()))
 def get_news_list():
     """獲取最新消息列表（公開，可篩選啟用狀態）"""
-    is_active = request.args.get('is_active', type=str)
-    
-    query = News.query
-    if is_active == 'true':
-        query = query.filter_by(is_active=True)
-    
+    query = _list_query()
     news_list = query.order_by(News.publish_date.desc(), News.created_at.desc()).all()
     
     return jsonify([{
@@ -37,6 +41,7 @@ def get_news_list():
     } for news in news_list])
 
 @news_api_bp.route('/<int:news_id>', methods=['GET'])
+@conditional_get(lambda news_id: row_validators(News, news_id))
 def get_news(news_id):
     """獲取單個最新消息"""
     news = News.query.get_or_404(news_id)
@@ -3,22 +3,38 @@
 """
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models import Order, OrderItem, Product, Shop, Topping, Table, OrderPayment, PaymentMethod, order_item_topping
-from app.routes.api.points import create_point_transaction
+from app.models import Order, OrderItem, Shop, Table, OrderPayment, PaymentMethod, order_item_topping
+from app.utils.points_ledger import apply_movements, InsufficientPointsError
 from app.utils.decorators import login_required, get_current_user, role_required
-from app.utils.validators import validate_integer, validate_order_status, validate_topping_count
-from app.utils.update_logger import log_update
+from app.utils.validators import validate_integer, validate_order_status
+from app.utils.outbox import emit_event, audit
 from app.utils.order_number import generate_order_number
+from app.utils.idempotency import idempotent
+from app.utils.stock import reserve_stock, collect_quantities, InsufficientStockError
+from app.utils.pricing import get_pricing, resolve_product_shops, normalize_id, PricingError
+from app.utils.order_detail import (
+    load_order_detail, load_orders_detail, serialize_order_detail,
+    order_detail_options, attach_topping_prices
+)
+from app.utils.pagination import keyset_paginate, split_page
 from decimal import Decimal
-from sqlalchemy import and_
-from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime
+from sqlalchemy import update
 
 orders_api_bp = Blueprint('orders_api', __name__)
 
 @orders_api_bp.route('/', methods=['GET'])
 @login_required
 def get_orders():
-    """獲取訂單列表（使用者自己的訂單，或店鋪擁有者的訂單，或管理員查看所有，支持分頁）"""
+    """
+    獲取訂單列表（使用者自己的訂單，或店鋪擁有者的訂單，或管理員查看所有，支持分頁）
+
+    兩種分頁模式：
+    - ?page=N：傳統頁碼分頁（含 total / pages）
+    - ?cursor=：游標分頁，依 (created_at, id) 定位，深頁成本與第一頁相同；
+      第一頁傳空字串，之後帶上回應中的 next_cursor。
+      total 預設不計算，需要時傳 include_total=1
+    """
     try:
         user = get_current_user()
         shop_id = request.args.get('shop_id', type=int)
@@ -28,7 +44,7 @@ def get_orders():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         # 限制每頁最大數量，防止過大請求
-        per_page = min(per_page, 100)
+        per_page = max(1, min(per_page, 100))
         
         query = Order.query
         
@@ -39,9 +55,8 @@ def get_orders():
                 query = query.filter_by(shop_id=shop_id)
         elif user.role == 'store_admin':
             # 店鋪管理者只能查看自己店鋪的訂單
-            shops = Shop.query.filter_by(owner_id=user.id).all()
-            shop_ids = [s.id for s in shops]
-            query = query.filter(Order.shop_id.in_(shop_ids))
+            owned_shop_ids = db.session.query(Shop.id).filter(Shop.owner_id == user.id)
+            query = query.filter(Order.shop_id.in_(owned_shop_ids.scalar_subquery()))
             if shop_id:
                 query = query.filter_by(shop_id=shop_id)
         else:
@@ -52,82 +67,42 @@ def get_orders():
         if status:
             query = query.filter_by(status=status)
         
-        # 獲取總數（在分頁前）
-        total = query.count()
-        
-        # 使用 joinedload 和 selectinload 优化查询，避免 N+1 问题，並添加分頁
-        orders = query.options(
-            joinedload(Order.shop),
-            selectinload(Order.items).joinedload(OrderItem.product),
-            selectinload(Order.items).selectinload(OrderItem.toppings)
-        ).order_by(Order.created_at.desc()).paginate(
+        if 'cursor' in request.args:
+            include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+            total = query.count() if include_total else None
+            try:
+                page_query, per_page = keyset_paginate(
+                    query, Order.created_at, Order.id,
+                    cursor=request.args.get('cursor'), per_page=per_page
+                )
+            except ValueError as e:
+                return jsonify({
+                    'error': 'validation_error',
+                    'message': str(e),
+                    'details': {'field': 'cursor'}
+                }), 400
+            orders, next_cursor = split_page(load_orders_detail(page_query), per_page)
+            return jsonify({
+                'orders': [serialize_order_detail(order) for order in orders],
+                'total': total,
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }), 200
+        
+        # 頁碼分頁：paginate 內部已計算總數，不再另外 count()
+        orders = query.options(*order_detail_options()).order_by(
+            Order.created_at.desc(), Order.id.desc()
+        ).paginate(
             page=page,
             per_page=per_page,
             error_out=False
         )
-        
-        # 批量获取所有订单项的 topping 价格
-        order_item_ids = []
-        for order in orders.items:
-            for item in order.items:
-                order_item_ids.append(item.id)
-        
-        # 一次性查询所有订单项的 topping 价格
-        topping_prices_map = {}
-        if order_item_ids:
-            topping_prices_query = db.session.query(
-                order_item_topping.c.order_item_id,
-                order_item_topping.c.topping_id,
-                order_item_topping.c.price
-            ).filter(order_item_topping.c.order_item_id.in_(order_item_ids)).all()
-            
-            for order_item_id, topping_id, price in topping_prices_query:
-                if order_item_id not in topping_prices_map:
-                    topping_prices_map[order_item_id] = {}
-                topping_prices_map[order_item_id][topping_id] = float(price)
-        
-        orders_data = []
-        for order in orders.items:
-            items_data = []
-            for item in order.items:
-                toppings_data = []
-                # 从预加载的数据中获取 toppings
-                item_topping_prices = topping_prices_map.get(item.id, {})
-                for topping in item.toppings:
-                    # 优先使用订单项中特定的 topping 价格，否则使用默认价格
-                    topping_price = item_topping_prices.get(topping.id, float(topping.price))
-                    
-                    toppings_data.append({
-                        'id': topping.id,
-                        'name': topping.name,
-                        'price': topping_price,
-                        'display_price': "FREE" if topping_price == 0 else f"${topping_price:.2f}"
-                    })
-                
-                items_data.append({
-                    'id': item.id,
-                    'product_id': item.product_id,
-                    'product_name': item.product.name if item.product else None,
-                    'quantity': item.quantity,
-                    'unit_price': float(item.unit_price),
-                    'toppings': toppings_data
-                })
-            
-            orders_data.append({
-                'id': order.id,
-                'user_id': order.user_id,
-                'shop_id': order.shop_id,
-                'shop_name': order.shop.name if order.shop else None,
-                'status': order.status,
-                'total_price': float(order.total_price),
-                'items': items_data,
-                'created_at': order.created_at.isoformat() if order.created_at else None,
-                'updated_at': order.updated_at.isoformat() if order.updated_at else None
-            })
+        attach_topping_prices(orders.items)
         
         return jsonify({
-            'orders': orders_data,
-            'total': total,
+            'orders': [serialize_order_detail(order) for order in orders.items],
+            'total': orders.total,
             'page': page,
             'per_page': per_page,
             'pages': orders.pages,
@@ -144,10 +119,16 @@ def get_orders():
 @orders_api_bp.route('/<int:order_id>', methods=['GET'])
 @login_required
 def get_order(order_id):
-    """獲取訂單詳情"""
+    """獲取訂單詳情（固定次數查詢載入整個訂單圖）"""
     try:
         user = get_current_user()
-        order = Order.query.get_or_404(order_id)
+        order = load_order_detail(order_id)
+        if not order:
+            return jsonify({
+                'error': 'not_found',
+                'message': '訂單不存在',
+                'details': {}
+            }), 404
         
         # 權限檢查
         if user.role == 'customer' and order.user_id != user.id:
@@ -158,54 +139,14 @@ def get_order(order_id):
             }), 403
         
         if user.role == 'store_admin':
-            shop = Shop.query.get(order.shop_id)
-            if not shop or shop.owner_id != user.id:
+            if not order.shop or order.shop.owner_id != user.id:
                 return jsonify({
                     'error': 'forbidden',
                     'message': '無權查看此訂單',
                     'details': {}
                 }), 403
         
-        items_data = []
-        for item in order.items:
-            toppings_data = []
-            for topping in item.toppings:
-                result = db.session.query(order_item_topping.c.price).filter(
-                    and_(
-                        order_item_topping.c.order_item_id == item.id,
-                        order_item_topping.c.topping_id == topping.id
-                    )
-                ).scalar()
-                topping_price = float(result) if result is not None else float(topping.price)
-                
-                toppings_data.append({
-                    'id': topping.id,
-                    'name': topping.name,
-                    'price': topping_price,
-                    'display_price': "FREE" if topping_price == 0 else f"${topping_price:.2f}"
-                })
-            
-            items_data.append({
-                'id': item.id,
-                'product_id': item.product_id,
-                'product_name': item.product.name if item.product else None,
-                'quantity': item.quantity,
-                'unit_price': float(item.unit_price),
-                'toppings': toppings_data
-            })
-        
-        return jsonify({
-            'id': order.id,
-            'user_id': order.user_id,
-            'user_name': order.user.name if order.user else None,
-            'shop_id': order.shop_id,
-            'shop_name': order.shop.name if order.shop else None,
-            'status': order.status,
-            'total_price': float(order.total_price),
-            'items': items_data,
-            'created_at': order.created_at.isoformat() if order.created_at else None,
-            'updated_at': order.updated_at.isoformat() if order.updated_at else None
-        }), 200
+        return jsonify(serialize_order_detail(order)), 200
     except Exception as e:
         return jsonify({
             'error': 'internal_error',
@@ -215,6 +156,7 @@ def get_order(order_id):
 
 @orders_api_bp.route('', methods=['POST'])
 @login_required
+@idempotent
 def create_order():
     """建立訂單（需要登入，狀態預設為pending）
     支持兩種模式：
@@ -233,7 +175,7 @@ def create_order():
             }), 400
         
         items = data.get('items', [])
-        shop_id = data.get('shop_id')  # 可選參數
+        shop_id = normalize_id(data.get('shop_id'))  # 可選參數
         
         if not items or not isinstance(items, list):
             return jsonify({
@@ -245,7 +187,7 @@ def create_order():
         # 如果沒有提供 shop_id，從商品自動分組
         if not shop_id:
             # 購物車模式：按店鋪分組商品
-            shop_groups = {}
+            product_ids = []
             for item_data in items:
                 product_id = item_data.get('product_id')
                 if not product_id:
@@ -254,26 +196,25 @@ def create_order():
                         'message': '產品ID不能為空',
                         'details': {'item_data': item_data}
                     }), 400
-                
-                # 獲取產品信息
-                product = Product.query.get(product_id)
-                if not product:
-                    # 列出所有可用產品
-                    all_products = Product.query.all()
-                    available_ids = [p.id for p in all_products]
-                    return jsonify({
-                        'error': 'validation_error',
-                        'message': f'產品ID {product_id} 不存在',
-                        'details': {
-                            'requested_id': product_id,
-                            'available_product_ids': available_ids
-                        }
-                    }), 400
-                
-                # 按店鋪分組
-                if product.shop_id not in shop_groups:
-                    shop_groups[product.shop_id] = []
-                shop_groups[product.shop_id].append(item_data)
+                # 計價快照以整數為鍵，"1" 與 1 視為同一產品
+                item_data['product_id'] = normalize_id(product_id)
+                product_ids.append(item_data['product_id'])
+            
+            product_shops = resolve_product_shops(product_ids)
+            missing_ids = [pid for pid in product_ids if pid not in product_shops]
+            if missing_ids:
+                return jsonify({
+                    'error': 'validation_error',
+                    'message': f'產品ID {missing_ids[0]} 不存在',
+                    'details': {
+                        'requested_id': missing_ids[0],
+                        'missing_product_ids': missing_ids
+                    }
+                }), 400
+            
+            shop_groups = {}
+            for item_data in items:
+                shop_groups.setdefault(product_shops[item_data['product_id']], []).append(item_data)
             
             # 為每個店鋪創建訂單
             created_orders = []
@@ -293,181 +234,44 @@ def create_order():
                 order = _create_single_order(user, order_data)
                 created_orders.append(order)
             
+            # 所有店鋪的訂單與外寄箱事件一次提交（任一失敗則全部回滾）
+            db.session.commit()
+            
             return jsonify({
                 'message': f'成功建立 {len(created_orders)} 個訂單',
                 'orders': [{'order_id': o.id, 'shop_id': o.shop_id, 'total_price': int(o.total_price)} for o in created_orders]
             }), 201
         
         # 傳統模式：單店鋪訂單
-        # 驗證店鋪是否存在
-        shop = Shop.query.get_or_404(shop_id)
-        if shop.status != 'active':
+        # 驗證店鋪是否存在（計價快照，記憶體中）
+        pricing = get_pricing(shop_id)
+        if pricing is None:
+            return jsonify({
+                'error': 'not_found',
+                'message': '店鋪不存在',
+                'details': {}
+            }), 404
+        if not pricing.is_active:
             return jsonify({
                 'error': 'validation_error',
                 'message': '店鋪不可用',
                 'details': {}
             }), 400
         
-        # 計算總價並建立訂單項
-        total_price = Decimal('0')
-        order_items = []
-        
-        # 優化：批量收集所有 topping_id 和 product_id，用於批量查詢
-        all_topping_ids = []
-        product_topping_pairs = []  # [(product_id, topping_id), ...]
-        items_with_metadata = []  # 保存每個 item 的元數據，用於後續處理
-        
-        # 第一遍循環：收集所有需要查詢的 ID 並驗證產品
-        for item_data in items:
-            product_id = item_data.get('product_id')
-            quantity = item_data.get('quantity', 1)
-            toppings = item_data.get('toppings', [])
-            
-            if not product_id:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': '產品ID不能為空',
-                    'details': {}
-                }), 400
-            
-            # 驗證產品
-            product = Product.query.get(product_id)
-            if not product:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': f'产品ID {product_id} 不存在',
-                    'details': {}
-                }), 400
-            
-            if product.shop_id != shop_id:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': f'产品 {product_id} 不属于此店铺',
-                    'details': {}
-                }), 400
-            
-            if not product.is_active:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': f'产品 {product.name} 已下架',
-                    'details': {}
-                }), 400
-            
-            # 驗證庫存
-            is_valid, qty_value, error_msg = validate_integer(quantity, '數量', min_value=1)
-            if not is_valid:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': error_msg,
-                    'details': {}
-                }), 400
-            
-            if product.stock_quantity < qty_value:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': f'产品 {product.name} 库存不足',
-                    'details': {}
-                }), 400
-            
-            # 验证topping數量
-            is_valid, error_msg = validate_topping_count(shop_id, len(toppings))
-            if not is_valid:
-                return jsonify({
-                    'error': 'validation_error',
-                    'message': error_msg,
-                    'details': {}
-                }), 400
-            
-            # 收集 topping_id 和 product-topping 配對
-            for topping_id in toppings:
-                if topping_id not in all_topping_ids:
-                    all_topping_ids.append(topping_id)
-                product_topping_pairs.append((product_id, topping_id))
-            
-            # 保存 item 元數據
-            items_with_metadata.append({
-                'item_data': item_data,
-                'product': product,
-                'qty_value': qty_value,
-                'toppings': toppings
-            })
-        
-        # 優化：批量查詢所有 Topping（一次性查詢，避免 N+1 問題）
-        topping_dict = {}
-        if all_topping_ids:
-            toppings_list = Topping.query.filter(
-                Topping.id.in_(all_topping_ids),
-                Topping.shop_id == shop_id,
-                Topping.is_active == True
-            ).all()
-            topping_dict = {t.id: t for t in toppings_list}
-        
-        # 優化：批量查詢所有 product_topping 價格（一次性查詢）
-        product_topping_price_dict = {}
-        if product_topping_pairs:
-            from app.models import product_topping
-            product_ids_list = list(set([pair[0] for pair in product_topping_pairs]))
-            topping_ids_list = list(set([pair[1] for pair in product_topping_pairs]))
-            
-            # 批量查詢 product_topping 關聯表
-            product_topping_results = db.session.query(
-                product_topping.c.product_id,
-                product_topping.c.topping_id,
-                product_topping.c.price
-            ).filter(
-                and_(
-                    product_topping.c.product_id.in_(product_ids_list),
-                    product_topping.c.topping_id.in_(topping_ids_list)
-                )
-            ).all()
-            
-            # 構建字典：{(product_id, topping_id): price}
-            for result in product_topping_results:
-                product_topping_price_dict[(result.product_id, result.topping_id)] = result.price
-        
-        # 第二遍循環：計算價格（使用批量查詢的結果）
-        for item_meta in items_with_metadata:
-            item_data = item_meta['item_data']
-            product = item_meta['product']
-            qty_value = item_meta['qty_value']
-            toppings = item_meta['toppings']
-            product_id = product.id
-            
-            # 計算產品價格（使用折扣價如果有）
-            unit_price = product.discounted_price if product.discounted_price else product.unit_price
-            item_total = unit_price * qty_value
-            
-            # 添加topping價格（使用批量查詢的結果）
-            for topping_id in toppings:
-                # 從批量查詢的字典中獲取 topping
-                topping = topping_dict.get(topping_id)
-                if not topping:
-                    return jsonify({
-                        'error': 'validation_error',
-                        'message': f'Topping ID {topping_id} 无效',
-                        'details': {}
-                    }), 400
-                
-                # 從批量查詢的字典中獲取產品特定的topping價格
-                specific_price = product_topping_price_dict.get((product_id, topping_id))
-                topping_price = Decimal(str(specific_price)) if specific_price is not None else topping.price
-                item_total += topping_price
-            
-            total_price += item_total
-            
-            # 建立訂單項物件（先不儲存，等訂單建立後再儲存）
-            order_item = OrderItem(
-                product_id=product_id,
-                quantity=qty_value,
-                unit_price=unit_price
-            )
-            order_items.append({
-                'order_item': order_item,
-                'toppings': toppings
-            })
+        # 計算總價（純記憶體計價，無效的產品、配料、飲品選項直接拒絕）
+        try:
+            lines = _price_items(pricing, items)
+        except PricingError as e:
+            return jsonify({
+                'error': 'validation_error',
+                'message': str(e),
+                'details': {}
+            }), 400
+        total_price = sum((line.line_total for line in lines), Decimal('0'))
         
         # 建立訂單
         new_order = Order(
+            order_number=generate_order_number(shop_id),
             user_id=user.id,
             shop_id=shop_id,
             status='pending',
@@ -477,59 +281,19 @@ def create_order():
         db.session.add(new_order)
         db.session.flush()  # 獲取訂單ID
         
-        # 添加訂單項和toppings
-        for item_info in order_items:
-            order_item = item_info['order_item']
-            order_item.order_id = new_order.id
-            db.session.add(order_item)
-            db.session.flush()  # 獲取訂單項ID
-            
-            # 添加toppings關聯
-            for topping_id in item_info['toppings']:
-                topping = Topping.query.get(topping_id)
-                result = db.session.execute(
-                    db.select(product_topping.c.price).where(
-                        and_(
-                            product_topping.c.product_id == order_item.product_id,
-                            product_topping.c.topping_id == topping_id
-                        )
-                    )
-                ).scalar()
-                topping_price = Decimal(str(result)) if result is not None else topping.price
-                
-                db.session.execute(
-                    order_item_topping.insert().values(
-                        order_item_id=order_item.id,
-                        topping_id=topping_id,
-                        price=topping_price
-                    )
-                )
-            
-            # 更新產品庫存
-            product = Product.query.get(order_item.product_id)
-            product.stock_quantity -= order_item.quantity
-        
-        db.session.commit()
+        # 添加訂單項和toppings，並原子扣減庫存（放在 commit 前，縮短行鎖持有時間）
+        _add_order_items(new_order, lines)
         
-        # 觸發SocketIO事件 - 新訂單通知
-        from app import socketio
-        # 發送到店鋪頻道（店主可以收到）
-        socketio.emit('new_order', {
+        # 新訂單通知寫入外寄箱，與訂單同一交易提交（店鋪頻道 + 後台管理頻道）
+        emit_event('new_order', {
             'order_id': new_order.id,
             'order_number': new_order.order_number,
             'shop_id': shop_id,
             'user_id': user.id,
             'total_price': float(total_price)
-        }, room=f'/shop/{shop_id}')
+        }, [f'/shop/{shop_id}', '/backend'])
         
-        # 發送到後台管理頻道
-        socketio.emit('new_order', {
-            'order_id': new_order.id,
-            'order_number': new_order.order_number,
-            'shop_id': shop_id,
-            'user_id': user.id,
-            'total_price': float(total_price)
-        }, room='/backend')
+        db.session.commit()
         
         return jsonify({
             'message': '訂單建立成功',
@@ -541,6 +305,21 @@ def create_order():
             }
         }), 201
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'validation_error',
+            'message': str(e),
+            'details': {'insufficient_stock': e.failures}
+        }), 400
+    except PricingError as e:
+        # 購物車模式中任一店鋪的訂單項無效
+        db.session.rollback()
+        return jsonify({
+            'error': 'validation_error',
+            'message': str(e),
+            'details': {}
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -585,33 +364,17 @@ def update_order_status(order_id):
         
         old_status = order.status
         order.status = new_status
-        db.session.commit()
+        db.session.flush()  # 取得 onupdate 後的 updated_at
         
-        # 觸發SocketIO事件 - 訂單狀態更新
-        from app import socketio
-        # 發送到店鋪頻道（店主可以收到）
-        socketio.emit('order_updated', {
+        # 訂單狀態更新通知寫入外寄箱（店鋪、顧客、後台管理頻道），與狀態變更同一交易提交
+        emit_event('order_updated', {
             'order_id': order.id,
             'status': new_status,
             'old_status': old_status,
             'updated_at': order.updated_at.isoformat() if order.updated_at else None
-        }, room=f'/shop/{order.shop_id}')
+        }, [f'/shop/{order.shop_id}', f'/user/{order.user_id}', '/backend'])
         
-        # 發送到用戶頻道（顧客可以收到）
-        socketio.emit('order_updated', {
-            'order_id': order.id,
-            'status': new_status,
-            'old_status': old_status,
-            'updated_at': order.updated_at.isoformat() if order.updated_at else None
-        }, room=f'/user/{order.user_id}')
-        
-        # 發送到後台管理頻道
-        socketio.emit('order_updated', {
-            'order_id': order.id,
-            'status': new_status,
-            'old_status': old_status,
-            'updated_at': order.updated_at.isoformat() if order.updated_at else None
-        }, room='/backend')
+        db.session.commit()
         
         return jsonify({
             'message': '訂單狀態更新成功',
@@ -629,151 +392,231 @@ def update_order_status(order_id):
             'details': {'error': str(e)}
         }), 500
 
-def _create_single_order(user, data):
-    """創建單個訂單的輔助函數
-    
-    Args:
-        user: 當前用戶
-        data: 訂單數據，包含 shop_id, items, recipient_name 等
+# 批次更新訂單狀態時單次最多處理的訂單數
+MAX_BATCH_ORDERS = 200
+
+@orders_api_bp.route('/status/batch', methods=['PUT'])
+@login_required
+def batch_update_order_status():
+    """
+    批次更新訂單狀態（僅店鋪擁有者或管理員）
+
+    請求格式：{"order_ids": [1, 2, 3], "status": "process"}
+    - 一次查詢驗證所有訂單的存在與權限（全部通過才更新）
+    - 一條 UPDATE 套用新狀態
+    - 每個受影響的頻道只送出一個 orders_updated 事件
+    """
+    try:
+        user = get_current_user()
+        data = request.get_json()
+        if not data or 'status' not in data or not data.get('order_ids'):
+            return jsonify({
+                'error': 'bad_request',
+                'message': '缺少order_ids或status參數',
+                'details': {}
+            }), 400
         
-    Returns:
-        Order: 創建的訂單對象
+        new_status = data['status']
+        is_valid, error_msg = validate_order_status(new_status)
+        if not is_valid:
+            return jsonify({
+                'error': 'validation_error',
+                'message': error_msg,
+                'details': {}
+            }), 400
+        
+        order_ids = []
+        for raw_id in data['order_ids']:
+            is_valid, order_id, error_msg = validate_integer(raw_id, '訂單ID', min_value=1)
+            if not is_valid:
+                return jsonify({
+                    'error': 'validation_error',
+                    'message': error_msg,
+                    'details': {'field': 'order_ids'}
+                }), 400
+            if order_id not in order_ids:
+                order_ids.append(order_id)
+        if len(order_ids) > MAX_BATCH_ORDERS:
+            return jsonify({
+                'error': 'validation_error',
+                'message': f'單次最多更新 {MAX_BATCH_ORDERS} 筆訂單',
+                'details': {'field': 'order_ids'}
+            }), 400
+        
+        # 一次查詢取得所有訂單及其店鋪擁有者，並鎖定這些訂單行
+        rows = db.session.query(
+            Order.id, Order.shop_id, Order.user_id, Order.status, Shop.owner_id
+        ).join(Shop, Shop.id == Order.shop_id).filter(
+            Order.id.in_(order_ids)
+        ).with_for_update(of=Order).all()
+        
+        found_ids = {row.id for row in rows}
+        missing_ids = [oid for oid in order_ids if oid not in found_ids]
+        if missing_ids:
+            db.session.rollback()
+            return jsonify({
+                'error': 'not_found',
+                'message': '部分訂單不存在',
+                'details': {'order_ids': missing_ids}
+            }), 404
+        
+        if user.role != 'admin':
+            forbidden_ids = [row.id for row in rows if row.owner_id != user.id]
+            if forbidden_ids:
+                db.session.rollback()
+                return jsonify({
+                    'error': 'forbidden',
+                    'message': '無權修改部分訂單狀態',
+                    'details': {'order_ids': forbidden_ids}
+                }), 403
+        
+        now = datetime.utcnow()
+        db.session.execute(
+            update(Order).where(Order.id.in_(order_ids)).values(
+                status=new_status,
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+        
+        # 依頻道彙整變更，每個頻道一個事件
+        updated_at = now.isoformat()
+        rooms = {}
+        for row in rows:
+            change = {
+                'order_id': row.id,
+                'status': new_status,
+                'old_status': row.status,
+                'updated_at': updated_at
+            }
+            for room in (f'/shop/{row.shop_id}', f'/user/{row.user_id}', '/backend'):
+                rooms.setdefault(room, []).append(change)
+        for room, changes in rooms.items():
+            emit_event('orders_updated', {'status': new_status, 'orders': changes}, room)
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'已更新 {len(order_ids)} 筆訂單狀態',
+            'status': new_status,
+            'order_ids': order_ids
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': '批次更新訂單狀態失敗',
+            'details': {'error': str(e)}
+        }), 500
+
+def _topping_id(topping_data):
+    """取得配料 ID（支援 {'topping_id': x} / {'id': x} 或直接傳 ID）"""
+    if isinstance(topping_data, dict):
+        return normalize_id(topping_data.get('topping_id') or topping_data.get('id'))
+    return normalize_id(topping_data)
+
+def _price_items(pricing, items, skip_foreign=False, strict=True):
     """
-    shop_id = data.get('shop_id')
-    items = data.get('items', [])
-    
-    # 驗證店鋪
-    shop = Shop.query.get(shop_id)
-    if not shop or shop.status != 'active':
-        raise ValueError(f'店鋪ID {shop_id} 不可用')
+    以店鋪計價快照計算所有訂單行（純記憶體，不查資料庫）
     
-    # 計算總價並建立訂單項
-    total_price = Decimal('0')
-    order_items_data = []
+    Args:
+        pricing: get_pricing() 返回的店鋪快照
+        items: 請求中的訂單項
+        skip_foreign: True 時略過不屬於此店鋪的產品（訪客與結帳的既有行為）
+        strict: True 時無效的配料或飲品選項拋出錯誤；False 時略過
     
-    # 優化：批量收集所有 topping_id，用於批量查詢
-    all_topping_ids = []
-    items_with_metadata = []
+    Returns:
+        list: PricedLine 列表
     
-    # 第一遍循環：收集所有需要查詢的 ID 並驗證產品
+    Raises:
+        PricingError: 產品、數量、配料或飲品選項無效
+    """
+    lines = []
     for item_data in items:
-        product_id = item_data.get('product_id')
-        quantity = item_data.get('quantity', 1)
-        toppings = item_data.get('toppings', [])
-        drink_type = item_data.get('drink_type')  # 'cold', 'hot', or None
-        drink_price = item_data.get('drink_price', 0)
-        
-        # 驗證產品
-        product = Product.query.get(product_id)
-        if not product:
-            raise ValueError(f'產品ID {product_id} 不存在')
-        
-        if product.shop_id != shop_id:
-            raise ValueError(f'產品 {product_id} 不屬於店鋪 {shop_id}')
-        
-        if not product.is_active:
-            raise ValueError(f'產品 {product.name} 已下架')
+        product_id = normalize_id(item_data.get('product_id'))
+        if not product_id:
+            raise PricingError('產品ID不能為空')
+        if product_id not in pricing.products:
+            if skip_foreign:
+                continue
+            raise PricingError(f'产品ID {product_id} 不存在或不属于此店铺')
         
-        # 驗證庫存
-        is_valid, qty_value, error_msg = validate_integer(quantity, '數量', min_value=1)
+        # 驗證數量（庫存於建立訂單時以條件式 UPDATE 原子扣減）
+        is_valid, quantity, error_msg = validate_integer(item_data.get('quantity', 1), '數量', min_value=1)
         if not is_valid:
-            raise ValueError(error_msg)
+            raise PricingError(error_msg)
         
-        if product.stock_quantity < qty_value:
-            raise ValueError(f'產品 {product.name} 庫存不足')
+        # 验证topping數量
+        topping_ids = [_topping_id(t) for t in item_data.get('toppings') or []]
+        if len(topping_ids) > pricing.max_toppings:
+            raise PricingError(f'topping數量不能超过{pricing.max_toppings}個')
         
-        # 驗證配料數量
-        is_valid, error_msg = validate_topping_count(shop_id, len(toppings))
-        if not is_valid:
-            raise ValueError(error_msg)
-        
-        # 收集 topping_id
-        for topping_data in toppings:
-            topping_id = topping_data.get('topping_id') or topping_data.get('id')
-            if topping_id and topping_id not in all_topping_ids:
-                all_topping_ids.append(topping_id)
-        
-        # 保存 item 元數據
-        items_with_metadata.append({
-            'item_data': item_data,
-            'product': product,
-            'qty_value': qty_value,
-            'toppings': toppings,
-            'drink_type': drink_type,
-            'drink_price': drink_price
-        })
+        lines.append(pricing.price_line(
+            product_id, topping_ids, item_data.get('drink_type'), quantity, strict=strict
+        ))
+    return lines
+
+def _add_order_items(order, lines):
+    """
+    寫入訂單項與配料價格，並原子扣減庫存
     
-    # 優化：批量查詢所有 Topping（一次性查詢，避免 N+1 問題）
-    topping_dict = {}
-    if all_topping_ids:
-        toppings_list = Topping.query.filter(
-            Topping.id.in_(all_topping_ids),
-            Topping.shop_id == shop_id,
-            Topping.is_active == True
-        ).all()
-        topping_dict = {t.id: t for t in toppings_list}
+    Args:
+        order: 已 flush（有 ID）的訂單
+        lines: _price_items() 返回的 PricedLine 列表
     
-    # 第二遍循環：計算價格（使用批量查詢的結果）
-    for item_meta in items_with_metadata:
-        item_data = item_meta['item_data']
-        product = item_meta['product']
-        qty_value = item_meta['qty_value']
-        toppings = item_meta['toppings']
-        drink_type = item_meta['drink_type']
-        drink_price = item_meta['drink_price']
-        
-        # 計算單價
-        unit_price = product.discounted_price if product.discounted_price else product.unit_price
-        
-        # 計算配料價格（使用批量查詢的結果）
-        topping_price = Decimal('0')
-        topping_instances = []
-        for topping_data in toppings:
-            topping_id = topping_data.get('topping_id') or topping_data.get('id')
-            if topping_id:
-                topping = topping_dict.get(topping_id)
-                if topping:
-                    topping_price += topping.price
-                    topping_instances.append((topping, topping.price))
-        
-        # 計算飲品價格
-        drink_total_price = Decimal(str(drink_price)) if drink_type and drink_price else Decimal('0')
-        
-        # 項目總價
-        item_unit_price = unit_price + topping_price + drink_total_price
-        item_total = item_unit_price * qty_value
-        total_price += item_total
-        
-        # 保存訂單項數據
-        order_items_data.append({
-            'product': product,
-            'quantity': qty_value,
-            'unit_price': item_unit_price,
-            'toppings': topping_instances,
-            'drink_type': drink_type,
-            'drink_price': drink_total_price
-        })
+    Raises:
+        InsufficientStockError: 任一產品庫存不足
+    """
+    order_items = [
+        OrderItem(
+            order_id=order.id,
+            product_id=line.product_id,
+            quantity=line.quantity,
+            unit_price=line.unit_price,
+            drink_type=line.drink_type,
+            drink_price=line.drink_price
+        )
+        for line in lines
+    ]
+    db.session.add_all(order_items)
+    db.session.flush()  # 獲取訂單項ID
     
-    # 優化：批量更新庫存（使用 SQLAlchemy 批量更新，避免逐個更新）
-    from sqlalchemy import update
-    product_stock_updates = {}  # {product_id: total_quantity_to_reduce}
-    for item_meta in items_with_metadata:
-        product = item_meta['product']
-        qty_value = item_meta['qty_value']
-        product_id = product.id
-        if product_id not in product_stock_updates:
-            product_stock_updates[product_id] = 0
-        product_stock_updates[product_id] += qty_value
+    # 配料關聯一次 executemany 寫入（價格已於計價時確定）
+    topping_rows = [
+        {'order_item_id': order_item.id, 'topping_id': topping_id, 'price': price}
+        for order_item, line in zip(order_items, lines)
+        for topping_id, price in line.toppings
+    ]
+    if topping_rows:
+        db.session.execute(order_item_topping.insert(), topping_rows)
     
-    # 批量更新庫存
-    if product_stock_updates:
-        for product_id, total_qty in product_stock_updates.items():
-            update_stmt = update(Product).where(
-                Product.id == product_id
-            ).values(
-                stock_quantity=Product.stock_quantity - total_qty
-            )
-            db.session.execute(update_stmt)
+    # 原子扣減庫存（一條條件式 UPDATE，不足時拋出 InsufficientStockError）
+    reserve_stock(collect_quantities((line.product_id, line.quantity) for line in lines))
+
+def _create_single_order(user, data):
+    """創建單個訂單的輔助函數
+    
+    Args:
+        user: 當前用戶
+        data: 訂單數據，包含 shop_id, items, recipient_name 等
+        
+    Returns:
+        Order: 創建的訂單對象（尚未提交，由呼叫者 commit）
+    
+    Raises:
+        PricingError: 店鋪不可用或訂單項無效
+    """
+    shop_id = normalize_id(data.get('shop_id'))
+    items = data.get('items', [])
+    
+    # 驗證店鋪（計價快照，記憶體中）
+    pricing = get_pricing(shop_id)
+    if pricing is None or not pricing.is_active:
+        raise PricingError(f'店鋪ID {shop_id} 不可用')
+    
+    # 計算總價（無效的配料、飲品選項略過，與購物車既有行為一致）
+    lines = _price_items(pricing, items, strict=False)
+    total_price = sum((line.line_total for line in lines), Decimal('0'))
     
     # 組合完整地址
     county = data.get('county', '')
@@ -816,30 +659,11 @@ def _create_single_order(user, data):
     if address:
         user.address = address
     
-    # 添加訂單項
-    for item_data in order_items_data:
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=item_data['product'].id,
-            quantity=item_data['quantity'],
-            unit_price=item_data['unit_price'],
-            drink_type=item_data.get('drink_type'),
-            drink_price=item_data.get('drink_price')
-        )
-        db.session.add(order_item)
-        db.session.flush()
-        
-        # 添加配料關聯
-        for topping, topping_price in item_data['toppings']:
-            stmt = order_item_topping.insert().values(
-                order_item_id=order_item.id,
-                topping_id=topping.id,
-                price=topping_price
-            )
-            db.session.execute(stmt)
+    # 添加訂單項與配料，並原子扣減庫存
+    _add_order_items(order, lines)
     
-    # 記錄日誌
-    log_update(
+    # 記錄日誌（外寄箱，與訂單同一交易提交）
+    audit(
         action='create',
         table_name='order',
         record_id=order.id,
@@ -852,27 +676,16 @@ def _create_single_order(user, data):
         description=f'創建訂單: 店鋪 {shop_id}, 用戶 {user.name}, 總價 ${order.total_price}'
     )
     
-    # 觸發SocketIO事件
-    from app import socketio
-    # 發送到店鋪頻道（店主可以收到）
-    socketio.emit('new_order', {
-        'order_id': order.id,
-        'order_number': order.order_number,
-        'shop_id': shop_id,
-        'user_id': user.id,
-        'total_price': float(total_price)
-    }, room=f'/shop/{shop_id}')
-    
-    # 發送到後台管理頻道
-    socketio.emit('new_order', {
+    # 新訂單通知（店鋪頻道 + 後台管理頻道）
+    emit_event('new_order', {
         'order_id': order.id,
         'order_number': order.order_number,
         'shop_id': shop_id,
         'user_id': user.id,
         'total_price': float(total_price)
-    }, room='/backend')
+    }, [f'/shop/{shop_id}', '/backend'])
     
-    db.session.commit()
+    # 由呼叫者 commit
     return order
 
 # =========================
@@ -880,6 +693,7 @@ def _create_single_order(user, data):
 # =========================
 
 @orders_api_bp.route('/guest', methods=['POST'])
+@idempotent
 def create_guest_order():
     """创建访客订单（桌号点餐，无需登入）"""
     try:
@@ -888,7 +702,7 @@ def create_guest_order():
         if not data:
             return jsonify({'error': '请求数据不能为空'}), 400
         
-        shop_id = data.get('shop_id')
+        shop_id = normalize_id(data.get('shop_id'))
         table_number = data.get('table_number')
         items = data.get('items', [])
         payment_splits = data.get('payment_splits', [])  # 组合支付
@@ -900,12 +714,12 @@ def create_guest_order():
         if not items:
             return jsonify({'error': '订单项不能为空'}), 400
         
-        # 获取店铺
-        shop = Shop.query.get(shop_id)
-        if not shop:
+        # 获取店铺（计价快照，内存中）
+        pricing = get_pricing(shop_id)
+        if not pricing:
             return jsonify({'error': '店铺不存在'}), 404
         
-        if not shop.qrcode_enabled:
+        if not pricing.qrcode_enabled:
             return jsonify({'error': '此店铺未启用桌号点餐'}), 400
         
         # 获取或创建桌号
@@ -915,58 +729,14 @@ def create_guest_order():
         
         # 创建临时用户或使用访客用户（user_id = 1 假设为系统访客账号）
         # 这里简化处理，使用 shop owner 作为订单用户
-        guest_user_id = shop.owner_id
+        guest_user_id = pricing.owner_id
         
-        # 计算订单总价
-        total_price = Decimal('0.00')
-        order_items_data = []
-        
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity', 1)
-            toppings_ids = item.get('toppings', [])
-            drink_type = item.get('drink_type')
-            
-            product = Product.query.get(product_id)
-            if not product or product.shop_id != shop_id:
-                continue
-            
-            # 计算单价（使用折扣价或原价）
-            if product.discounted_price and product.discounted_price > 0:
-                unit_price = product.discounted_price
-            else:
-                unit_price = product.unit_price
-            
-            item_total = unit_price * quantity
-            
-            # 添加饮品价格
-            drink_price = Decimal('0.00')
-            if drink_type == 'cold' and product.has_cold_drink:
-                drink_price = product.cold_drink_price or Decimal('0.00')
-            elif drink_type == 'hot' and product.has_hot_drink:
-                drink_price = product.hot_drink_price or Decimal('0.00')
-            
-            item_total += drink_price * quantity
-            
-            # 处理配料
-            toppings_list = []
-            for topping_id in toppings_ids:
-                topping = Topping.query.get(topping_id)
-                if topping and topping.shop_id == shop_id:
-                    topping_price = topping.price or Decimal('0.00')
-                    toppings_list.append((topping, topping_price))
-                    item_total += topping_price * quantity
-            
-            total_price += item_total
-            
-            order_items_data.append({
-                'product': product,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'drink_type': drink_type,
-                'drink_price': drink_price,
-                'toppings': toppings_list
-            })
+        # 计算订单总价（纯内存计价；不属于此店铺的产品与无效配料略过）
+        try:
+            lines = _price_items(pricing, items, skip_foreign=True, strict=False)
+        except PricingError as e:
+            return jsonify({'error': str(e)}), 400
+        total_price = sum((line.line_total for line in lines), Decimal('0.00'))
         
         if total_price <= 0:
             return jsonify({'error': '订单总价必须大于0'}), 400
@@ -999,28 +769,6 @@ def create_guest_order():
         db.session.add(order)
         db.session.flush()
         
-        # 添加订单项
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product'].id,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                drink_type=item_data.get('drink_type'),
-                drink_price=item_data.get('drink_price')
-            )
-            db.session.add(order_item)
-            db.session.flush()
-            
-            # 添加配料
-            for topping, topping_price in item_data['toppings']:
-                stmt = order_item_topping.insert().values(
-                    order_item_id=order_item.id,
-                    topping_id=topping.id,
-                    price=topping_price
-                )
-                db.session.execute(stmt)
-        
         # 处理组合支付
         if payment_splits:
             for payment in payment_splits:
@@ -1032,18 +780,20 @@ def create_guest_order():
                 )
                 db.session.add(order_payment)
         
-        db.session.commit()
+        # 添加订单项与配料，并原子扣減庫存
+        _add_order_items(order, lines)
         
-        # 触发 SocketIO 事件
-        from app import socketio
-        socketio.emit('new_order', {
+        # 新订单通知写入外寄箱，与订单同一交易提交
+        emit_event('new_order', {
             'order_id': order.id,
             'order_number': order.order_number,
             'shop_id': shop_id,
             'table_number': table_number,
             'is_guest_order': True,
             'total_price': float(total_price)
-        }, room=f'/shop/{shop_id}')
+        }, f'/shop/{shop_id}')
+        
+        db.session.commit()
         
         return jsonify({
             'message': '访客订单创建成功',
@@ -1054,19 +804,23 @@ def create_guest_order():
             'is_guest_order': True
         }), 201
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'insufficient_stock': e.failures}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @orders_api_bp.route('/checkout', methods=['POST'])
 @login_required
+@idempotent
 def checkout_with_points_and_payment():
     """增强结账（支持回馈金使用和组合支付）"""
     try:
         user = get_current_user()
         data = request.get_json()
         
-        shop_id = data.get('shop_id')
+        shop_id = normalize_id(data.get('shop_id'))
         items = data.get('items', [])
         points_to_use = data.get('points_to_use', 0)  # 使用的回馈金
         payment_splits = data.get('payment_splits', [])  # 组合支付
@@ -1075,102 +829,24 @@ def checkout_with_points_and_payment():
         if not shop_id or not items:
             return jsonify({'error': '缺少必要参数'}), 400
         
-        # 获取店铺
-        shop = Shop.query.get(shop_id)
-        if not shop:
+        # 获取店铺（计价快照，内存中）
+        pricing = get_pricing(shop_id)
+        if not pricing:
             return jsonify({'error': '店铺不存在'}), 404
         
-        # 验证回馈金余额
-        if points_to_use > 0:
-            if points_to_use > user.points:
-                return jsonify({'error': '回馈金余额不足'}), 400
-        
-        # 计算订单总价
-        total_price = Decimal('0.00')
-        order_items_data = []
-        
-        # 優化：批量收集所有 topping_id，用於批量查詢
-        all_topping_ids = []
-        items_with_metadata = []
-        
-        # 第一遍循環：收集所有需要查詢的 ID 並驗證產品
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity', 1)
-            toppings_ids = item.get('toppings', [])
-            drink_type = item.get('drink_type')
-            
-            product = Product.query.get(product_id)
-            if not product or product.shop_id != shop_id:
-                continue
-            
-            # 收集 topping_id
-            for topping_id in toppings_ids:
-                if topping_id not in all_topping_ids:
-                    all_topping_ids.append(topping_id)
-            
-            # 保存 item 元數據
-            items_with_metadata.append({
-                'item': item,
-                'product': product,
-                'quantity': quantity,
-                'toppings_ids': toppings_ids,
-                'drink_type': drink_type
-            })
-        
-        # 優化：批量查詢所有 Topping（一次性查詢，避免 N+1 問題）
-        topping_dict = {}
-        if all_topping_ids:
-            toppings_list = Topping.query.filter(
-                Topping.id.in_(all_topping_ids),
-                Topping.shop_id == shop_id
-            ).all()
-            topping_dict = {t.id: t for t in toppings_list}
-        
-        # 第二遍循環：計算價格（使用批量查詢的結果）
-        for item_meta in items_with_metadata:
-            item = item_meta['item']
-            product = item_meta['product']
-            quantity = item_meta['quantity']
-            toppings_ids = item_meta['toppings_ids']
-            drink_type = item_meta['drink_type']
-            
-            # 计算单价
-            if product.discounted_price and product.discounted_price > 0:
-                unit_price = product.discounted_price
-            else:
-                unit_price = product.unit_price
-            
-            item_total = unit_price * quantity
-            
-            # 添加饮品价格
-            drink_price = Decimal('0.00')
-            if drink_type == 'cold' and product.has_cold_drink:
-                drink_price = product.cold_drink_price or Decimal('0.00')
-            elif drink_type == 'hot' and product.has_hot_drink:
-                drink_price = product.hot_drink_price or Decimal('0.00')
-            
-            item_total += drink_price * quantity
-            
-            # 处理配料（使用批量查詢的結果）
-            toppings_list = []
-            for topping_id in toppings_ids:
-                topping = topping_dict.get(topping_id)
-                if topping:
-                    topping_price = topping.price or Decimal('0.00')
-                    toppings_list.append((topping, topping_price))
-                    item_total += topping_price * quantity
-            
-            total_price += item_total
-            
-            order_items_data.append({
-                'product': product,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'drink_type': drink_type,
-                'drink_price': drink_price,
-                'toppings': toppings_list
-            })
+        # 验证回馈金（负数会变成加点）；余额在扣点时由原子 UPDATE 再次确认
+        is_valid, points_to_use, error_msg = validate_integer(points_to_use, '使用的回馈金', min_value=0)
+        if not is_valid:
+            return jsonify({'error': error_msg}), 400
+        if points_to_use > user.points:
+            return jsonify({'error': '回馈金余额不足'}), 400
+        
+        # 计算订单总价（纯内存计价；不属于此店铺的产品与无效配料略过）
+        try:
+            lines = _price_items(pricing, items, skip_foreign=True, strict=False)
+        except PricingError as e:
+            return jsonify({'error': str(e)}), 400
+        total_price = sum((line.line_total for line in lines), Decimal('0.00'))
         
         if total_price <= 0:
             return jsonify({'error': '订单总价必须大于0'}), 400
@@ -1195,7 +871,7 @@ def checkout_with_points_and_payment():
         order_number = generate_order_number(shop_id)
         
         # 计算本次可赚取的回馈金（基于应付金额，不含回馈金抵扣部分）
-        points_rate = shop.points_rate or 30
+        points_rate = pricing.points_rate
         points_earned = int(float(amount_due) / points_rate)
         
         # 创建订单
@@ -1217,28 +893,6 @@ def checkout_with_points_and_payment():
         db.session.add(order)
         db.session.flush()
         
-        # 添加订单项
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product'].id,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                drink_type=item_data.get('drink_type'),
-                drink_price=item_data.get('drink_price')
-            )
-            db.session.add(order_item)
-            db.session.flush()
-            
-            # 添加配料
-            for topping, topping_price in item_data['toppings']:
-                stmt = order_item_topping.insert().values(
-                    order_item_id=order_item.id,
-                    topping_id=topping.id,
-                    price=topping_price
-                )
-                db.session.execute(stmt)
-        
         # 处理组合支付记录
         for payment in payment_splits:
             order_payment = OrderPayment(
@@ -1249,33 +903,29 @@ def checkout_with_points_and_payment():
             )
             db.session.add(order_payment)
         
-        # 处理回馈金使用
-        if points_to_use > 0:
-            create_point_transaction(
-                user_id=user.id,
-                transaction_type='use',
-                points=-points_to_use,  # 负数表示使用
-                order_id=order.id,
-                shop_id=shop_id,
-                description=f'订单 {order_number} 使用回馈金'
-            )
-        
-        # 处理回馈金赚取
-        if points_earned > 0:
-            create_point_transaction(
-                user_id=user.id,
-                transaction_type='earn',
-                points=points_earned,
-                order_id=order.id,
-                shop_id=shop_id,
-                description=f'订单 {order_number} 赚取回馈金'
-            )
-        
-        db.session.commit()
+        # 添加订单项与配料，并原子扣減庫存
+        _add_order_items(order, lines)
+        
+        # 回馈金使用与赚取：一条原子 UPDATE 调整余额，与订单同一交易提交
+        apply_movements(user.id, [
+            {
+                'type': 'use',
+                'points': -points_to_use,  # 负数表示使用
+                'order_id': order.id,
+                'shop_id': shop_id,
+                'description': f'订单 {order_number} 使用回馈金'
+            },
+            {
+                'type': 'earn',
+                'points': points_earned,
+                'order_id': order.id,
+                'shop_id': shop_id,
+                'description': f'订单 {order_number} 赚取回馈金'
+            }
+        ])
         
-        # 触发 SocketIO 事件
-        from app import socketio
-        socketio.emit('new_order', {
+        # 新订单通知写入外寄箱
+        emit_event('new_order', {
             'order_id': order.id,
             'order_number': order.order_number,
             'shop_id': shop_id,
@@ -1283,7 +933,9 @@ def checkout_with_points_and_payment():
             'total_price': float(total_price),
             'points_used': points_to_use,
             'points_earned': points_earned
-        }, room=f'/shop/{shop_id}')
+        }, f'/shop/{shop_id}')
+        
+        db.session.commit()
         
         return jsonify({
             'message': '订单创建成功',
@@ -1295,6 +947,12 @@ def checkout_with_points_and_payment():
             'amount_paid': float(amount_due)
         }), 201
         
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'insufficient_stock': e.failures}), 400
+    except InsufficientPointsError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -5,6 +5,9 @@ from flask import Blueprint, request, jsonify
 from app.models import PaymentMethod, ShopPaymentMethod, Shop
 from app.utils.decorators import login_required, role_required, get_current_user
 from app import db
+from app.utils.menu import mark_menu_changed, mark_all_menus_changed
+from app.utils.cache_tags import invalidate_on_commit
+from app.utils.reference_data import PAYMENT_METHODS_TAG, shop_payment_methods
 from datetime import datetime
 
 payment_methods_api_bp = Blueprint('payment_methods_api', __name__)
@@ -64,6 +67,7 @@ def create_payment_method():
     )
     
     db.session.add(payment_method)
+    mark_all_menus_changed()
     db.session.commit()
     
     return jsonify({
@@ -99,6 +103,7 @@ def update_payment_method(method_id):
     if 'is_active' in data:
         payment_method.is_active = data['is_active']
     
+    mark_all_menus_changed()
     db.session.commit()
     
     return jsonify({
@@ -123,6 +128,7 @@ def delete_payment_method(method_id):
         return jsonify({'error': '现金支付不能删除'}), 400
     
     db.session.delete(payment_method)
+    mark_all_menus_changed()
     db.session.commit()
     
     return jsonify({'message': '支付方式删除成功'}), 200
@@ -191,8 +197,9 @@ def update_shop_payment_methods(shop_id):
     if cash_method and cash_method.id not in enabled_method_ids:
         return jsonify({'error': '现金支付是必需的，不能禁用'}), 400
     
-    # 删除所有现有设置
+    # 删除所有现有设置（批次刪除不會觸發 before_flush，手動使參考資料快取失效）
     ShopPaymentMethod.query.filter_by(shop_id=shop_id).delete()
+    invalidate_on_commit(PAYMENT_METHODS_TAG)
     
     # 创建新设置
     for method_id in enabled_method_ids:
@@ -208,6 +215,7 @@ def update_shop_payment_methods(shop_id):
         )
         db.session.add(shop_method)
     
+    mark_menu_changed(shop_id)
     db.session.commit()
     
     return jsonify({
@@ -224,22 +232,8 @@ def get_shop_payment_methods_public(shop_id):
     """获取店家启用的支付方式（公开接口，用于前台结账）"""
     shop = Shop.query.get_or_404(shop_id)
     
-    # 获取店铺启用的支付方式
-    shop_methods = ShopPaymentMethod.query.filter_by(
-        shop_id=shop_id,
-        is_enabled=True
-    ).all()
-    
-    if not shop_methods:
-        # 如果店铺未设置，返回所有可用支付方式
-        all_methods = PaymentMethod.query.filter_by(is_active=True).order_by(PaymentMethod.display_order).all()
-    else:
-        # 返回店铺启用的支付方式
-        method_ids = [sm.payment_method_id for sm in shop_methods]
-        all_methods = PaymentMethod.query.filter(
-            PaymentMethod.id.in_(method_ids),
-            PaymentMethod.is_active == True
-        ).order_by(PaymentMethod.display_order).all()
+    # 获取店铺启用的支付方式（如果店铺未设置，返回所有可用支付方式）
+    all_methods = shop_payment_methods(shop_id, fallback=True)
     
     methods_data = []
     for pm in all_methods:
@@ -2,9 +2,11 @@
 回馈金 API
 """
 from flask import Blueprint, request, jsonify, session
-from app.models import User, PointTransaction, Order, Shop
-from app.utils.decorators import login_required, get_current_user
+from app.models import PointTransaction, Order, Shop
+from app.utils.decorators import login_required, role_required, get_current_user
+from app.utils.validators import validate_integer
 from app import db
+from app.utils.points_ledger import credit_users
 from datetime import datetime
 
 points_api_bp = Blueprint('points_api', __name__)
@@ -112,45 +114,34 @@ def calculate_points():
         'description': f'每消费 {points_rate} 元可获得 1 点回馈金'
     }), 200
 
-def create_point_transaction(user_id, transaction_type, points, order_id=None, shop_id=None, description=None):
-    """
-    创建回馈金交易记录（内部函数）
-    
-    Args:
-        user_id: 用户ID
-        transaction_type: 交易类型 (earn/use/expire)
-        points: 点数（正数=赚取，负数=使用）
-        order_id: 关联订单ID（可选）
-        shop_id: 关联店铺ID（可选）
-        description: 描述（可选）
-    
-    Returns:
-        PointTransaction对象
-    """
-    user = User.query.get(user_id)
-    if not user:
-        raise ValueError('用户不存在')
-    
-    # 如果是使用回馈金，检查余额
-    if transaction_type == 'use' and abs(points) > user.points:
-        raise ValueError('回馈金余额不足')
-    
-    # 更新用户余额
-    user.points += points
-    
-    # 创建交易记录
-    transaction = PointTransaction(
-        user_id=user_id,
-        order_id=order_id,
-        shop_id=shop_id,
-        type=transaction_type,
-        points=points,
-        balance=user.points,
-        description=description
-    )
-    
-    db.session.add(transaction)
-    db.session.commit()
-    
-    return transaction
-
+@points_api_bp.route('/points/bulk-credit', methods=['POST'])
+@role_required('admin')
+def bulk_credit_points():
+    """批量赠送回馈金（活动赠点，仅管理员）"""
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids') or []
+    description = data.get('description') or '活动赠送回馈金'
+    
+    is_valid, points, error_msg = validate_integer(data.get('points'), '赠送点数', min_value=1)
+    if not is_valid:
+        return jsonify({'error': error_msg}), 400
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'error': '缺少用户ID列表'}), 400
+    
+    try:
+        amounts = {int(uid): points for uid in user_ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': '用户ID格式错误'}), 400
+    
+    try:
+        credited = credit_users(amounts, transaction_type='earn', description=description)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'message': f'已为 {credited} 位用户赠送 {points} 点回馈金',
+        'credited_users': credited,
+        'points': points
+    }), 200
@@ -8,6 +8,7 @@ from app import db
 from app.models import Product, ProductImage
 from app.utils.decorators import login_required, role_required
 from app.utils.update_logger import log_update
+from app.utils.menu import mark_menu_changed
 from app.utils.image_processor import convert_to_webp, allowed_image_file
 from app.utils.upload_path import get_upload_file_path
 from datetime import datetime
@@ -78,6 +79,7 @@ def upload_product_image(product_id):
             description=f'上傳產品圖片: {product.name}'
         )
         
+        mark_menu_changed(product.shop_id)
         db.session.commit()
         
         return jsonify({
@@ -137,6 +139,7 @@ def delete_product_image(image_id):
         )
         
         db.session.delete(product_image)
+        mark_menu_changed(product.shop_id)
         db.session.commit()
         
         return jsonify({'message': '刪除成功'}), 200
@@ -182,6 +185,7 @@ def reorder_product_images(product_id):
             description=f'重新排序產品圖片: {product.name}'
         )
         
+        mark_menu_changed(product.shop_id)
         db.session.commit()
         
         return jsonify({'message': '排序成功'}), 200
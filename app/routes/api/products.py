@@ -2,18 +2,22 @@
 產品API路由
 """
 from flask import Blueprint, request, jsonify
-from app import db, cache
-from app.models import Product, Shop, Category, Topping, product_topping
+from app import db
+from app.models import Product, Shop, Topping, product_topping
 from app.utils.decorators import login_required, get_current_user, role_required
 from app.utils.validators import validate_decimal, validate_integer
 from app.utils.update_logger import log_update
-from sqlalchemy import and_
+from app.utils.menu import mark_menu_changed
+from app.utils.cache_tags import tagged_cache, add_cache_tags, invalidate_tags, invalidate_on_commit
+from app.utils.outbox import emit_event
+from app.utils.reference_data import get_category
+from sqlalchemy import and_, case, update
 from sqlalchemy.orm import joinedload, selectinload
 
 products_api_bp = Blueprint('products_api', __name__)
 
 @products_api_bp.route('/', methods=['GET'])
-@cache.cached(timeout=300, query_string=True)  # 快取5分鐘，根據查詢參數區分
+@tagged_cache(tags=['products', 'categories'], query_string=True)  # 根據查詢參數區分，產品、店鋪、庫存異動時失效
 def get_products():
     """獲取產品列表（公開，可篩選，預設只顯示is_active=true且未刪除的產品，支持分頁）"""
     try:
@@ -57,6 +61,7 @@ def get_products():
         
         # 批量获取所有产品的 topping 价格
         product_ids = [p.id for p in products.items]
+        add_cache_tags(*{f'shop:{p.shop_id}' for p in products.items}, *(f'stock:{pid}' for pid in product_ids))
         topping_prices_map = {}
         if product_ids:
             topping_prices_query = db.session.query(
@@ -123,7 +128,7 @@ def get_products():
         }), 500
 
 @products_api_bp.route('/<int:product_id>', methods=['GET'])
-@cache.cached(timeout=300)  # 快取5分鐘，自動包含product_id參數
+@tagged_cache(tags=lambda product_id: [f'product:{product_id}', f'stock:{product_id}', 'categories'])
 def get_product(product_id):
     """獲取產品詳情（公開）"""
     try:
@@ -133,6 +138,7 @@ def get_product(product_id):
             selectinload(Product.toppings),
             selectinload(Product.images)
         ).get_or_404(product_id)
+        add_cache_tags(f'shop:{product.shop_id}')
         
         # 批量获取产品的 topping 价格
         topping_prices_map = {}
@@ -227,7 +233,7 @@ def create_product():
                 }), 403
         
         # 驗證分類存在
-        category = Category.query.get(data['category_id'])
+        category = get_category(data['category_id'])
         if not category:
             return jsonify({'error': '分類不存在'}), 400
         
@@ -287,11 +293,11 @@ def create_product():
             description=f'新增產品: {product.name}'
         )
         
+        mark_menu_changed(product.shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete_memoized(get_products)
-        cache.delete_memoized(get_product, product.id)
+        invalidate_tags('products')
         
         return jsonify({
             'id': product.id,
@@ -318,6 +324,7 @@ def update_product(product_id):
         user = get_current_user()
         product = Product.query.get_or_404(product_id)
         shop = Shop.query.get_or_404(product.shop_id)
+        old_shop_id = product.shop_id
         
         # 權限檢查
         if user.role != 'admin' and shop.owner_id != user.id:
@@ -341,7 +348,7 @@ def update_product(product_id):
         if 'description' in data:
             product.description = data['description'].strip()
         if 'category_id' in data:
-            category = Category.query.get(data['category_id'])
+            category = get_category(data['category_id'])
             if not category:
                 return jsonify({
                     'error': 'validation_error',
@@ -417,11 +424,11 @@ def update_product(product_id):
             description=f'更新產品: {product.name}'
         )
         
+        mark_menu_changed(old_shop_id, product.shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete_memoized(get_products)
-        cache.delete_memoized(get_product, product_id)
+        invalidate_tags('products', f'product:{product_id}')
         
         # 觸發SocketIO事件 - 产品更新
         from app import socketio
@@ -494,11 +501,11 @@ def delete_product(product_id):
             description=f'軟刪除產品: {product.name}'
         )
         
+        mark_menu_changed(product.shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete_memoized(get_products)
-        cache.delete_memoized(get_product, product_id)
+        invalidate_tags('products', f'product:{product_id}')
         
         return jsonify({
             'message': '產品刪除成功（可在後台恢復）'
@@ -550,6 +557,7 @@ def update_stock(product_id):
         
         product.stock_quantity = stock_value
         db.session.commit()
+        invalidate_tags(f'stock:{product_id}')
         
         # 觸發SocketIO事件
         from app import socketio
@@ -604,7 +612,9 @@ def update_status(product_id):
         
         old_status = product.is_active
         product.is_active = bool(data['is_active'])
+        mark_menu_changed(product.shop_id)
         db.session.commit()
+        invalidate_tags('products', f'product:{product_id}')
         
         # 觸發SocketIO事件
         from app import socketio
@@ -638,3 +648,202 @@ def update_status(product_id):
             'message': '更新產品狀態失敗',
             'details': {'error': str(e)}
         }), 500
+
+# 批次更新庫存／上架狀態時單次最多處理的產品數
+MAX_BATCH_PRODUCTS = 1000
+
+def _parse_batch_items(data, field, parse_value):
+    """
+    解析批次更新的項目列表
+
+    請求格式：{"items": [{"product_id": 1, "<field>": ...}, ...]}（也接受直接傳列表）
+
+    Returns:
+        (dict {product_id: value}, None) 或 (None, 錯誤回應)
+    """
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({
+            'error': 'bad_request',
+            'message': '缺少items參數',
+            'details': {}
+        }), 400)
+    if len(items) > MAX_BATCH_PRODUCTS:
+        return None, (jsonify({
+            'error': 'validation_error',
+            'message': f'單次最多更新 {MAX_BATCH_PRODUCTS} 個產品',
+            'details': {'field': 'items'}
+        }), 400)
+    
+    values = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or field not in item:
+            return None, (jsonify({
+                'error': 'validation_error',
+                'message': f'第 {index + 1} 項缺少product_id或{field}',
+                'details': {'index': index}
+            }), 400)
+        is_valid, product_id, error_msg = validate_integer(item.get('product_id'), '產品ID', min_value=1)
+        if is_valid:
+            is_valid, value, error_msg = parse_value(item[field])
+        if not is_valid:
+            return None, (jsonify({
+                'error': 'validation_error',
+                'message': f'第 {index + 1} 項：{error_msg}',
+                'details': {'index': index}
+            }), 400)
+        if product_id in values:
+            return None, (jsonify({
+                'error': 'validation_error',
+                'message': f'產品 {product_id} 重複出現',
+                'details': {'index': index}
+            }), 400)
+        values[product_id] = value
+    return values, None
+
+def _authorize_batch_products(user, product_ids, column):
+    """
+    一次查詢取得所有產品及其店鋪擁有者，驗證存在與權限（全部通過才更新）
+
+    Returns:
+        (rows, None) 或 (None, 錯誤回應)
+    """
+    rows = db.session.query(
+        Product.id, Product.shop_id, column.label('old_value'), Shop.owner_id
+    ).join(Shop, Shop.id == Product.shop_id).filter(
+        Product.id.in_(product_ids),
+        Product.deleted_at.is_(None)
+    ).all()
+    
+    found_ids = {row.id for row in rows}
+    missing_ids = [pid for pid in product_ids if pid not in found_ids]
+    if missing_ids:
+        return None, (jsonify({
+            'error': 'not_found',
+            'message': '部分產品不存在',
+            'details': {'product_ids': missing_ids}
+        }), 404)
+    
+    if user.role != 'admin':
+        forbidden_ids = [row.id for row in rows if row.owner_id != user.id]
+        if forbidden_ids:
+            return None, (jsonify({
+                'error': 'forbidden',
+                'message': '無權修改部分產品',
+                'details': {'product_ids': forbidden_ids}
+            }), 403)
+    return rows, None
+
+def _emit_products_updated(rows, field, values):
+    """依店鋪彙整變更，每個店鋪一個 products_updated 事件（外寄箱，commit 後送出）"""
+    shops = {}
+    for row in rows:
+        shops.setdefault(row.shop_id, []).append({
+            'product_id': row.id,
+            field: values[row.id],
+            f'old_{field}': row.old_value
+        })
+    for shop_id, changes in shops.items():
+        emit_event('products_updated', {'shop_id': shop_id, 'field': field, 'products': changes},
+                   ['/public', f'/shop/{shop_id}'])
+    return sorted(shops)
+
+@products_api_bp.route('/stock/batch', methods=['PUT'])
+@login_required
+def batch_update_stock():
+    """
+    批次更新庫存（僅店鋪擁有者或管理員）
+
+    請求格式：{"items": [{"product_id": 1, "stock_quantity": 20}, ...]}
+    - 一次查詢驗證所有產品的存在與權限
+    - 一條 UPDATE ... CASE 套用新庫存
+    - 每個店鋪只使快取失效一次、送出一個 products_updated 事件
+    """
+    try:
+        user = get_current_user()
+        values, error = _parse_batch_items(
+            request.get_json(silent=True), 'stock_quantity',
+            lambda value: validate_integer(value, '库存數量', min_value=0)
+        )
+        if error:
+            return error
+        
+        product_ids = list(values)
+        rows, error = _authorize_batch_products(user, product_ids, Product.stock_quantity)
+        if error:
+            db.session.rollback()
+            return error
+        
+        db.session.execute(
+            update(Product).where(Product.id.in_(product_ids)).values(
+                stock_quantity=case(values, value=Product.id)
+            ).execution_options(synchronize_session=False)
+        )
+        shop_ids = _emit_products_updated(rows, 'stock_quantity', values)
+        # 產品詳情與列表快取都帶有 shop:<id> 標籤；菜單文件不含庫存，不需遞增版本
+        invalidate_on_commit(*(f'shop:{shop_id}' for shop_id in shop_ids))
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'已更新 {len(product_ids)} 個產品的庫存',
+            'products': [{'id': pid, 'stock_quantity': values[pid]} for pid in product_ids]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': '批次更新庫存失敗',
+            'details': {'error': str(e)}
+        }), 500
+
+def _parse_is_active(value):
+    if not isinstance(value, bool):
+        return False, None, 'is_active必須是true或false'
+    return True, value, None
+
+@products_api_bp.route('/status/batch', methods=['PUT'])
+@login_required
+def batch_update_status():
+    """
+    批次更新上架/下架狀態（僅店鋪擁有者或管理員）
+
+    請求格式：{"items": [{"product_id": 1, "is_active": false}, ...]}
+    - 一次查詢驗證所有產品的存在與權限
+    - 一條 UPDATE ... CASE 套用新狀態
+    - 每個店鋪只遞增一次菜單版本、送出一個 products_updated 事件
+    """
+    try:
+        user = get_current_user()
+        values, error = _parse_batch_items(request.get_json(silent=True), 'is_active', _parse_is_active)
+        if error:
+            return error
+        
+        product_ids = list(values)
+        rows, error = _authorize_batch_products(user, product_ids, Product.is_active)
+        if error:
+            db.session.rollback()
+            return error
+        
+        db.session.execute(
+            update(Product).where(Product.id.in_(product_ids)).values(
+                is_active=case(values, value=Product.id)
+            ).execution_options(synchronize_session=False)
+        )
+        shop_ids = _emit_products_updated(rows, 'is_active', values)
+        mark_menu_changed(*shop_ids)
+        db.session.commit()
+        invalidate_tags('products')
+        
+        return jsonify({
+            'message': f'已更新 {len(product_ids)} 個產品的狀態',
+            'products': [{'id': pid, 'is_active': values[pid]} for pid in product_ids]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': '批次更新產品狀態失敗',
+            'details': {'error': str(e)}
+        }), 500
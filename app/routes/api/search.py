@@ -0,0 +1,44 @@
+"""
+搜尋API路由
+"""
+from flask import Blueprint, request, jsonify
+from app.utils.search import search
+
+search_api_bp = Blueprint('search_api', __name__)
+
+# 單次查詢最多返回筆數
+MAX_SEARCH_LIMIT = 50
+# 查詢字串長度上限（過長的查詢只會產生大量無用的詞）
+MAX_QUERY_LENGTH = 100
+
+
+def serialize_result(score, document):
+    """把搜尋結果轉成 JSON 可序列化的 dict"""
+    return {
+        'kind': document.kind,
+        'id': document.id,
+        'name': document.name,
+        'shop_id': document.shop_id,
+        'shop_name': document.shop_name,
+        'unit_price': document.unit_price,
+        'discounted_price': document.discounted_price,
+        'description': document.description,
+        'score': round(score, 4)
+    }
+
+
+@search_api_bp.route('', methods=['GET'])
+def search_catalog():
+    """搜尋店鋪與產品（公開，q 為關鍵字，kind 可為 product / shop）"""
+    query = (request.args.get('q') or '').strip()[:MAX_QUERY_LENGTH]
+    kind = request.args.get('kind') or None
+    if kind not in (None, 'product', 'shop'):
+        return jsonify({'error': 'kind 只能是 product 或 shop'}), 400
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+    results = search(query, limit=limit, kind=kind)
+    return jsonify({
+        'query': query,
+        'results': [serialize_result(score, document) for score, document in results]
+    })
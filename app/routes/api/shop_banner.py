@@ -8,6 +8,7 @@ from app import db
 from app.models import Shop
 from app.utils.decorators import role_required
 from app.utils.update_logger import log_update
+from app.utils.menu import mark_menu_changed
 from app.utils.image_processor import convert_to_webp, allowed_image_file
 from app.utils.upload_path import get_upload_file_path
 from datetime import datetime
@@ -74,6 +75,7 @@ def upload_shop_banner(shop_id):
             description=f'上傳店鋪 Banner: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({
@@ -120,6 +122,7 @@ def delete_shop_banner(shop_id):
             description=f'刪除店鋪 Banner: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({'message': '刪除成功'}), 200
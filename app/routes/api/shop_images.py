@@ -8,6 +8,7 @@ from app import db
 from app.models import Shop, ShopImage
 from app.utils.decorators import login_required, role_required
 from app.utils.update_logger import log_update
+from app.utils.menu import mark_menu_changed
 from app.utils.image_processor import convert_to_webp, allowed_image_file
 from app.utils.upload_path import get_upload_file_path
 from datetime import datetime
@@ -76,6 +77,7 @@ def upload_shop_image(shop_id):
             description=f'上傳店鋪圖片: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({
@@ -133,6 +135,7 @@ def delete_shop_image(image_id):
         )
         
         db.session.delete(shop_image)
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({'message': '刪除成功'}), 200
@@ -176,6 +179,7 @@ def reorder_shop_images(shop_id):
             description=f'重新排序店鋪圖片: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({'message': '排序成功'}), 200
@@ -1,12 +1,20 @@
 """
 店鋪API路由
 """
-from flask import Blueprint, request, jsonify
-from app import db, cache
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app import db
 from app.models import Shop, User, Topping
 from app.utils.decorators import login_required, role_required, shop_access_required, get_current_user
 from app.utils.validators import validate_integer, validate_decimal
 from app.utils.update_logger import log_update
+from app.utils.order_number import clear_order_number_cache
+from app.utils.menu import mark_menu_changed, menu_response
+from app.utils.cache_tags import tagged_cache, invalidate_tags
+from app.utils.reference_data import get_category
+from app.utils.outbox import audit
+from app.utils.catalog_io import (
+    CATALOG_MIMETYPES, CatalogImportError, detect_format, iter_records, import_products, export_products
+)
 
 shops_api_bp = Blueprint('shops_api', __name__)
 
@@ -53,7 +61,7 @@ def get_my_shops():
         }), 500
 
 @shops_api_bp.route('/', methods=['GET'])
-@cache.cached(timeout=300, key_prefix='shops_list')  # 快取5分鐘
+@tagged_cache(tags=['shops'])
 def get_shops():
     """獲取店鋪列表（公開，排除已刪除）"""
     try:
@@ -83,7 +91,7 @@ def get_shops():
         }), 500
 
 @shops_api_bp.route('/<int:shop_id>', methods=['GET'])
-@cache.cached(timeout=300)  # 快取5分鐘，自動包含shop_id參數
+@tagged_cache(tags=lambda shop_id: [f'shop:{shop_id}'])
 def get_shop(shop_id):
     """獲取店鋪詳情（公開）"""
     try:
@@ -106,6 +114,25 @@ def get_shop(shop_id):
             'details': {}
         }), 404
 
+@shops_api_bp.route('/<int:shop_id>/menu', methods=['GET'])
+def get_shop_menu(shop_id):
+    """獲取店鋪菜單文件（公開；產品、配料、圖片、分類、飲品選項、支付方式一次返回，支援 ETag / 304）"""
+    try:
+        response = menu_response(shop_id)
+        if response is None:
+            return jsonify({
+                'error': 'not_found',
+                'message': '店鋪不存在',
+                'details': {}
+            }), 404
+        return response
+    except Exception as e:
+        return jsonify({
+            'error': 'internal_error',
+            'message': '獲取店鋪菜單失敗',
+            'details': {'error': str(e)}
+        }), 500
+
 @shops_api_bp.route('/', methods=['POST'])
 @role_required('store_admin', 'admin')
 def create_shop():
@@ -216,7 +243,7 @@ def create_shop():
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('shops_list')
+        invalidate_tags('shops')
         
         return jsonify({
             'message': '店鋪建立成功',
@@ -381,12 +408,12 @@ def update_shop(shop_id):
             description=f'更新店鋪: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('shops_list')
-        cache.delete_memoized(get_shop, shop_id)
-        cache.delete_memoized(get_shop_toppings, shop_id)
+        invalidate_tags('shops', f'shop:{shop_id}')
+        clear_order_number_cache(shop_id)
         
         return jsonify({
             'message': '店鋪更新成功',
@@ -455,12 +482,11 @@ def delete_shop(shop_id):
             description=f'軟刪除店鋪: {shop.name}'
         )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete('shops_list')
-        cache.delete_memoized(get_shop, shop_id)
-        cache.delete_memoized(get_shop_toppings, shop_id)
+        invalidate_tags('shops', f'shop:{shop_id}', 'products')
         
         return jsonify({
             'message': '店鋪刪除成功（可在後台恢復）'
@@ -475,7 +501,7 @@ def delete_shop(shop_id):
         }), 500
 
 @shops_api_bp.route('/<int:shop_id>/toppings', methods=['GET'])
-@cache.cached(timeout=300)  # 快取5分鐘，自動包含shop_id參數
+@tagged_cache(tags=lambda shop_id: [f'shop:{shop_id}'])
 def get_shop_toppings(shop_id):
     """獲取店鋪toppings列表（僅顯示is_active=true的）"""
     try:
@@ -558,10 +584,11 @@ def create_topping(shop_id):
         )
         
         db.session.add(new_topping)
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         # 清除相關快取
-        cache.delete_memoized(get_shop_toppings, shop_id)
+        invalidate_tags(f'shop:{shop_id}')
         
         return jsonify({
             'message': '配料建立成功',
@@ -587,7 +614,7 @@ def create_topping(shop_id):
 def create_product(shop_id):
     """建立產品（僅店鋪擁有者或管理員）"""
     try:
-        from app.models import Product, Category
+        from app.models import Product
         from app.utils.validators import validate_decimal, validate_integer
         
         user = get_current_user()
@@ -633,7 +660,7 @@ def create_product(shop_id):
             }), 400
         
         # 驗證分類是否存在
-        category = Category.query.get(category_id)
+        category = get_category(category_id)
         if not category:
             return jsonify({
                 'error': 'validation_error',
@@ -721,7 +748,9 @@ def create_product(shop_id):
                                     )
                                 )
         
+        mark_menu_changed(shop_id)
         db.session.commit()
+        invalidate_tags('products')
         
         return jsonify({
             'message': '產品建立成功',
@@ -743,3 +772,115 @@ def create_product(shop_id):
             'message': '建立產品失敗',
             'details': {'error': str(e)}
         }), 500
+
+@shops_api_bp.route('/<int:shop_id>/products/import', methods=['POST'])
+@login_required
+def import_shop_products(shop_id):
+    """
+    批次匯入產品（僅店鋪擁有者或管理員）
+
+    以 multipart 上傳 file（.csv / .jsonl / .json），或直接以 text/csv、application/x-ndjson、
+    application/json 作為請求內容；可用 ?format= 指定格式。整批在同一個交易中寫入。
+    """
+    user = get_current_user()
+    shop = Shop.query.filter_by(id=shop_id).filter(Shop.deleted_at.is_(None)).first_or_404()
+
+    # 權限檢查
+    if user.role != 'admin' and shop.owner_id != user.id:
+        return jsonify({
+            'error': 'forbidden',
+            'message': '無權為此店鋪匯入產品',
+            'details': {}
+        }), 403
+
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    if upload is not None:
+        stream = upload.stream
+        fmt = detect_format(upload.filename, upload.mimetype, request.args.get('format'))
+    else:
+        stream = request.stream
+        fmt = detect_format(mimetype=request.mimetype, requested=request.args.get('format'))
+    if fmt is None:
+        return jsonify({
+            'error': 'bad_request',
+            'message': '不支援的檔案格式（支援 csv、jsonl、json）',
+            'details': {}
+        }), 400
+
+    try:
+        product_ids = import_products(shop_id, iter_records(stream, fmt))
+        if not product_ids:
+            db.session.rollback()
+            return jsonify({
+                'error': 'validation_error',
+                'message': '沒有可匯入的資料',
+                'details': {}
+            }), 400
+
+        # 一筆彙總的稽核日誌（外寄箱，與產品同一交易提交）
+        audit(
+            action='import',
+            table_name='product',
+            new_data={
+                'shop_id': shop_id,
+                'format': fmt,
+                'count': len(product_ids),
+                'first_id': product_ids[0],
+                'last_id': product_ids[-1]
+            },
+            description=f'批次匯入產品 {len(product_ids)} 筆: {shop.name}'
+        )
+        mark_menu_changed(shop_id)
+        db.session.commit()
+        invalidate_tags('products')
+    except CatalogImportError as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'validation_error',
+            'message': str(e),
+            'details': {'errors': e.errors, 'error_count': e.total}
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': '匯入產品失敗',
+            'details': {'error': str(e)}
+        }), 500
+
+    return jsonify({
+        'message': '產品匯入成功',
+        'count': len(product_ids),
+        'product_ids': product_ids
+    }), 201
+
+@shops_api_bp.route('/<int:shop_id>/products/export', methods=['GET'])
+@login_required
+def export_shop_products(shop_id):
+    """匯出店鋪產品（僅店鋪擁有者或管理員；?format=csv|jsonl|json，預設 csv，串流輸出）"""
+    user = get_current_user()
+    shop = Shop.query.filter_by(id=shop_id).filter(Shop.deleted_at.is_(None)).first_or_404()
+
+    # 權限檢查
+    if user.role != 'admin' and shop.owner_id != user.id:
+        return jsonify({
+            'error': 'forbidden',
+            'message': '無權匯出此店鋪的產品',
+            'details': {}
+        }), 403
+
+    fmt = detect_format(requested=request.args.get('format', 'csv'))
+    if fmt is None:
+        return jsonify({
+            'error': 'bad_request',
+            'message': '不支援的檔案格式（支援 csv、jsonl、json）',
+            'details': {}
+        }), 400
+
+    response = Response(
+        stream_with_context(export_products(shop_id, fmt)),
+        mimetype=CATALOG_MIMETYPES[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=shop-{shop_id}-products.{fmt}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
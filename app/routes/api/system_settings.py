@@ -5,6 +5,7 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import SystemSetting
 from app.utils.decorators import role_required
+from app.utils.order_number import clear_order_number_cache
 
 system_settings_api_bp = Blueprint('system_settings_api', __name__)
 
@@ -124,6 +125,9 @@ def create_setting():
         db.session.add(new_setting)
         db.session.commit()
         
+        # 訂單前綴可能被修改，清除訂單編號快取
+        clear_order_number_cache()
+        
         return jsonify({
             'message': '設定創建成功',
             'setting': {
@@ -170,6 +174,9 @@ def update_setting(setting_id):
         
         db.session.commit()
         
+        # 訂單前綴可能被修改，清除訂單編號快取
+        clear_order_number_cache()
+        
         return jsonify({
             'message': '設定更新成功',
             'setting': {
@@ -233,6 +240,9 @@ def batch_update_settings():
         
         db.session.commit()
         
+        # 訂單前綴可能被修改，清除訂單編號快取
+        clear_order_number_cache()
+        
         return jsonify({
             'message': f'成功更新 {updated_count} 個設定',
             'updated_count': updated_count
@@ -257,6 +267,9 @@ def delete_setting(setting_id):
         db.session.delete(setting)
         db.session.commit()
         
+        # 訂單前綴可能被修改，清除訂單編號快取
+        clear_order_number_cache()
+        
         return jsonify({
             'message': '設定刪除成功'
         }), 200
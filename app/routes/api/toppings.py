@@ -6,6 +6,7 @@ from app import db
 from app.models import Topping, Shop
 from app.utils.decorators import login_required, get_current_user
 from app.utils.validators import validate_decimal
+from app.utils.menu import mark_menu_changed
 
 toppings_api_bp = Blueprint('toppings_api', __name__)
 
@@ -93,6 +94,7 @@ def update_topping(topping_id):
         if 'is_active' in data:
             topping.is_active = bool(data['is_active'])
         
+        mark_menu_changed(topping.shop_id)
         db.session.commit()
         
         return jsonify({
@@ -131,7 +133,9 @@ def delete_topping(topping_id):
                 'details': {}
             }), 403
         
+        shop_id = topping.shop_id
         db.session.delete(topping)
+        mark_menu_changed(shop_id)
         db.session.commit()
         
         return jsonify({
@@ -8,6 +8,7 @@ from app.utils.password import hash_password, check_password
 from app.utils.validators import validate_email
 from app.utils.decorators import login_required, get_current_user
 from app.utils.password_strength import validate_password_strength
+from app.utils.session_claims import store_claims
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -145,6 +146,8 @@ def login():
         session['user_name'] = user.name
         session['user_role'] = user.role
         session.permanent = True
+        # 角色與擁有的店鋪存入 session，Socket.IO 連線時不需查詢資料庫
+        store_claims(user.id)
         
         return jsonify({
             'message': '登入成功',
@@ -1,10 +1,12 @@
 """
 Backend後台路由
 """
-from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, abort
 from app.models import User, Shop, Product, Order, UpdateLog, PaymentMethod
 from app.utils.decorators import login_required, role_required, get_current_user
+from app.utils.order_detail import load_order_detail
 from app import db
+from app.utils.reference_data import categories as reference_categories
 
 backend_bp = Blueprint('backend', __name__)
 
@@ -119,10 +121,9 @@ def shop_edit(shop_id):
 @role_required('admin')
 def products():
     """產品管理頁面"""
-    from app.models import Category
     products_list = Product.query.order_by(Product.created_at.desc()).all()
     shops_list = Shop.query.all()
-    categories_list = Category.query.all()
+    categories_list = reference_categories()
     
     products_data = []
     for p in products_list:
@@ -151,19 +152,17 @@ def products():
 @role_required('admin')
 def product_add():
     """新增產品頁面"""
-    from app.models import Category
     shops_list = Shop.query.filter_by(status='active').all()
-    categories_list = Category.query.all()
+    categories_list = reference_categories()
     return render_template('backend/products/add.html', shops=shops_list, categories=categories_list)
 
 @backend_bp.route('/products/<int:product_id>/edit')
 @role_required('admin')
 def product_edit(product_id):
     """編輯產品頁面"""
-    from app.models import Category
     product = Product.query.get_or_404(product_id)
     shops_list = Shop.query.all()
-    categories_list = Category.query.all()
+    categories_list = reference_categories()
     return render_template('backend/products/edit.html', product=product, shops=shops_list, categories=categories_list)
 
 @backend_bp.route('/orders')
@@ -223,7 +222,9 @@ def product_detail(product_id):
 @role_required('admin')
 def order_detail(order_id):
     """訂單詳情頁面"""
-    order = Order.query.get_or_404(order_id)
+    order = load_order_detail(order_id)
+    if not order:
+        abort(404)
     return render_template('backend/order_detail.html', order=order)
 
 @backend_bp.route('/users-test')
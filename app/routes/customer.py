@@ -1,15 +1,21 @@
 """
 商城使用者路由
 """
-from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
-from app.models import Shop, Product, Order, Category, About, News, Table, PointTransaction
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, abort
+from app.models import Shop, Product, Order, About, News, Table, PointTransaction
 from app.utils.decorators import login_required, get_current_user
+from app.utils.order_detail import load_order_detail
+from app.utils.pagination import keyset_paginate, split_page
+from app.utils.reference_data import categories as reference_categories
+from app.utils.page_cache import page_cache, STOCK_PAGE_TIMEOUT
+from app.utils.cache_tags import add_cache_tags
 from app import db
 from sqlalchemy.orm import joinedload
 
 customer_bp = Blueprint('customer', __name__)
 
 @customer_bp.route('/')
+@page_cache(tags=['shops', 'home_banners'])
 def index():
     """商城首頁（排除已刪除的店鋪）"""
     from app.models import HomeBanner
@@ -18,12 +24,14 @@ def index():
     return render_template('store/index.html', shops=shops, banners=banners)
 
 @customer_bp.route('/about')
+@page_cache(tags=['about'])
 def about():
     """關於我們頁面"""
     about_list = About.query.filter_by(is_active=True).order_by(About.display_order).all()
     return render_template('store/about.html', about_list=about_list)
 
 @customer_bp.route('/news')
+@page_cache(tags=['news'])
 def news():
     """最新消息列表頁面（支持分頁）"""
     page = request.args.get('page', 1, type=int)
@@ -42,6 +50,7 @@ def news():
                          pagination=news_pagination)
 
 @customer_bp.route('/news/<int:news_id>')
+@page_cache(tags=lambda news_id: [f'news:{news_id}'])
 def news_detail(news_id):
     """最新消息詳情頁面"""
     news = News.query.get_or_404(news_id)
@@ -68,7 +77,9 @@ def register():
 def order_detail(order_id):
     """訂單詳情頁面"""
     user = get_current_user()
-    order = Order.query.get_or_404(order_id)
+    order = load_order_detail(order_id)
+    if not order:
+        abort(404)
     
     # 權限檢查
     if order.user_id != user.id:
@@ -77,6 +88,7 @@ def order_detail(order_id):
     return render_template('store/order_detail.html', order=order)
 
 @customer_bp.route('/shop/<int:shop_id>')
+@page_cache(tags=lambda shop_id: [f'shop:{shop_id}', 'categories'], timeout=STOCK_PAGE_TIMEOUT)
 def shop(shop_id):
     """店鋪詳情頁（排除已刪除）"""
     from app.utils.seo import generate_structured_data_shop
@@ -85,7 +97,7 @@ def shop(shop_id):
     products = Product.query.options(
         joinedload(Product.category)
     ).filter_by(shop_id=shop_id, is_active=True).filter(Product.deleted_at.is_(None)).all()
-    categories = Category.query.all()
+    categories = reference_categories()
     
     # 生成 SEO 结构化数据
     shop_schema = generate_structured_data_shop(shop)
@@ -96,13 +108,26 @@ def shop(shop_id):
                          categories=categories,
                          shop_schema=shop_schema)
 
+@customer_bp.route('/search')
+def search():
+    """搜尋結果頁（店鋪與產品）"""
+    from app.utils.search import search as search_catalog
+    query = (request.args.get('q') or '').strip()[:100]
+    results = search_catalog(query, limit=50) if query else []
+    shops = [document for _, document in results if document.kind == 'shop']
+    products = [document for _, document in results if document.kind == 'product']
+    return render_template('store/search.html', query=query, shops=shops, products=products)
+
 @customer_bp.route('/product/<int:product_id>')
+@page_cache(tags=lambda product_id: [f'product:{product_id}'], timeout=STOCK_PAGE_TIMEOUT)
 def product(product_id):
     """產品詳情頁"""
     from app.utils.seo import generate_structured_data_product, generate_breadcrumb_list
     product = Product.query.get_or_404(product_id)
     if not product.is_active:
         return redirect(url_for('customer.index'))
+    # 頁面含店鋪名稱與配料，店鋪資料異動時也要失效
+    add_cache_tags(f'shop:{product.shop_id}')
     
     # 獲取店鋪的toppings
     toppings = [t for t in product.shop.toppings if t.is_active]
@@ -141,18 +166,33 @@ def checkout():
 @customer_bp.route('/orders')
 @login_required
 def orders():
-    """我的訂單頁面（支持分頁）"""
+    """我的訂單頁面（支持頁碼分頁，或 ?cursor= 游標分頁）"""
     user = get_current_user()
     page = request.args.get('page', 1, type=int)
     per_page = 10  # 每頁顯示10條
-    
-    orders_pagination = Order.query.filter_by(user_id=user.id)\
-                                  .order_by(Order.created_at.desc())\
-                                  .paginate(
-                                      page=page,
-                                      per_page=per_page,
-                                      error_out=False
-                                  )
+    query = Order.query.filter_by(user_id=user.id)
+    
+    if 'cursor' in request.args:
+        # 游標分頁：不計算總數，深頁成本與第一頁相同
+        try:
+            page_query, per_page = keyset_paginate(
+                query, Order.created_at, Order.id,
+                cursor=request.args.get('cursor'), per_page=per_page
+            )
+        except ValueError:
+            abort(400)
+        orders_list, next_cursor = split_page(page_query.all(), per_page)
+        return render_template('store/orders.html',
+                             orders=orders_list,
+                             pagination=None,
+                             next_cursor=next_cursor)
+    
+    orders_pagination = query.order_by(Order.created_at.desc(), Order.id.desc())\
+                             .paginate(
+                                 page=page,
+                                 per_page=per_page,
+                                 error_out=False
+                             )
     
     return render_template('store/orders.html', 
                          orders=orders_pagination.items,
@@ -186,7 +226,7 @@ def guest_order(shop_id, table_number):
     
     # 获取产品
     products = Product.query.filter_by(shop_id=shop_id, is_active=True).filter(Product.deleted_at.is_(None)).all()
-    categories = Category.query.all()
+    categories = reference_categories()
     
     return render_template('store/guest_order.html', 
                          shop=shop,
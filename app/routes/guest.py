@@ -2,8 +2,9 @@
 訪客路由（不需登入）
 """
 from flask import Blueprint, render_template, session, request
-from app.models import Shop, Product, Category, Table
+from app.models import Shop, Product, Table
 from app import db
+from app.utils.reference_data import categories as reference_categories, shop_payment_methods
 
 guest_bp = Blueprint('guest', __name__)
 
@@ -33,7 +34,7 @@ def order(shop_id, table_number):
     
     # 獲取產品和分類
     products = Product.query.filter_by(shop_id=shop_id, is_active=True).filter(Product.deleted_at.is_(None)).all()
-    categories = Category.query.all()
+    categories = reference_categories()
     
     # 序列化產品數據
     products_data = []
@@ -78,15 +79,8 @@ def checkout(shop_id, table_number):
     shop = Shop.query.filter_by(id=shop_id).filter(Shop.deleted_at.is_(None)).first_or_404()
     table = Table.query.filter_by(shop_id=shop_id, table_number=table_number).first_or_404()
     
-    # 獲取支付方式
-    from app.models import PaymentMethod, ShopPaymentMethod
-    enabled_methods = db.session.query(PaymentMethod)\
-        .join(ShopPaymentMethod, PaymentMethod.id == ShopPaymentMethod.payment_method_id)\
-        .filter(ShopPaymentMethod.shop_id == shop_id, 
-                ShopPaymentMethod.is_enabled == True, 
-                PaymentMethod.is_active == True)\
-        .order_by(PaymentMethod.display_order)\
-        .all()
+    # 獲取支付方式（參考資料快取，不查資料庫）
+    enabled_methods = shop_payment_methods(shop_id)
     
     methods_data = []
     for pm in enabled_methods:
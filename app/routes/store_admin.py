@@ -1,13 +1,19 @@
 """
 商店管理者路由
 """
-from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
-from app.models import Shop, Product, Order, Category, Topping, Table, PaymentMethod, ShopPaymentMethod
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify, abort
+from app.models import Shop, Product, Order, Topping, Table
 from app.utils.decorators import login_required, role_required, get_current_user
+from app.utils.order_detail import load_orders_detail
+from app.utils.pagination import keyset_paginate, split_page
+from app.utils.reference_data import categories as reference_categories, payment_methods, shop_payment_methods
 from app import db
 
 store_admin_bp = Blueprint('store_admin', __name__)
 
+# 訂單頁游標分頁每頁數量
+ORDERS_PAGE_SIZE = 50
+
 @store_admin_bp.route('/')
 @role_required('store_admin')
 def index():
@@ -111,7 +117,7 @@ def products():
     # 獲取所有自己店鋪的產品
     shop_ids = [s.id for s in shops_list]
     products_list = Product.query.filter(Product.shop_id.in_(shop_ids)).filter(Product.deleted_at.is_(None)).order_by(Product.created_at.desc()).all()
-    categories_list = Category.query.all()
+    categories_list = reference_categories()
     
     # 序列化為字典（供 JavaScript 使用）
     products_data = []
@@ -147,7 +153,7 @@ def product_add():
     shops = Shop.query.filter_by(owner_id=user.id).filter(Shop.deleted_at.is_(None)).all()
     if not shops:
         return render_template('shop/no_shop.html')
-    categories = Category.query.all()
+    categories = reference_categories()
     return render_template('shop/products/add.html', shops=shops, categories=categories, user=user)
 
 @store_admin_bp.route('/products/<int:product_id>/edit')
@@ -163,7 +169,7 @@ def product_edit(product_id):
     # 檢查產品是否屬於自己的店鋪
     shop_ids = [s.id for s in shops]
     product = Product.query.filter(Product.id == product_id, Product.shop_id.in_(shop_ids)).filter(Product.deleted_at.is_(None)).first_or_404()
-    categories = Category.query.all()
+    categories = reference_categories()
     return render_template('shop/products/edit.html', product=product, shops=shops, categories=categories, user=user)
 
 @store_admin_bp.route('/orders')
@@ -172,7 +178,25 @@ def orders():
     """訂單管理頁面"""
     user = get_current_user()
     shop = Shop.query.filter_by(owner_id=user.id).filter(Shop.deleted_at.is_(None)).first_or_404()
-    orders_list = Order.query.filter_by(shop_id=shop.id).order_by(Order.created_at.desc()).all()
+    query = Order.query.filter_by(shop_id=shop.id)
+    
+    if 'cursor' in request.args:
+        # 游標分頁：每頁 ORDERS_PAGE_SIZE 筆，依 (created_at, id) 定位
+        try:
+            page_query, per_page = keyset_paginate(
+                query, Order.created_at, Order.id,
+                cursor=request.args.get('cursor'), per_page=ORDERS_PAGE_SIZE
+            )
+        except ValueError:
+            abort(400)
+        orders_list, next_cursor = split_page(load_orders_detail(page_query), per_page)
+        return render_template('shop/orders.html', orders=orders_list, shop=shop,
+                               next_cursor=next_cursor, cursor_mode=True)
+    
+    # 一次載入訂單、客戶、桌號、訂單項、產品、配料與配料價格
+    orders_list = load_orders_detail(
+        query.order_by(Order.created_at.desc(), Order.id.desc())
+    )
     return render_template('shop/orders.html', orders=orders_list, shop=shop)
 
 @store_admin_bp.route('/statistics')
@@ -272,11 +296,10 @@ def shop_payment_settings(shop_id):
         return redirect(url_for('store_admin.shops'))
     
     # 获取所有可用支付方式
-    all_methods = PaymentMethod.query.filter_by(is_active=True).order_by(PaymentMethod.display_order).all()
+    all_methods = payment_methods()
     
     # 获取店铺已启用的支付方式
-    shop_methods = ShopPaymentMethod.query.filter_by(shop_id=shop_id).all()
-    enabled_method_ids = {sm.payment_method_id for sm in shop_methods if sm.is_enabled}
+    enabled_method_ids = {pm.id for pm in shop_payment_methods(shop_id)}
     
     methods_data = []
     for pm in all_methods:
@@ -1,14 +1,22 @@
 """
 WebSocket事件處理
 """
-from flask import Blueprint, session
-from flask_socketio import emit, join_room, leave_room
+from flask import Blueprint, session, request
+from flask_socketio import emit, join_room, leave_room, rooms
 from app import socketio
-from app.utils.decorators import get_current_user
-from app.models import User
+from app.utils.session_claims import current_claims, load_claims
+from app.utils.socketio_replay import replay_events
 
 websocket_bp = Blueprint('websocket', __name__)
 
+def _connection_claims(user_id):
+    """連線使用者的頻道成員資格：優先使用 session 中的資料（不查詢資料庫）"""
+    claims = current_claims()
+    if claims is None:
+        # 升級前登入、尚未發出任何 HTTP 請求的 session，或 session 資料已失效
+        claims = load_claims(user_id)
+    return claims
+
 @socketio.on('connect')
 def handle_connect():
     """客戶端連接事件"""
@@ -32,10 +40,10 @@ def handle_connect():
             # 即使加入房間失敗，也允許連接
             return True
         
-        # 嘗試獲取使用者資訊
+        # 嘗試獲取使用者資訊（登入時已存入 session，通常不查詢資料庫）
         try:
-            user = User.query.get(user_id)
-            if not user or not user.is_active:
+            claims = _connection_claims(user_id)
+            if not claims['active']:
                 # 使用者不存在或已被禁用，降級為訪客模式
                 print(f"Socket.IO user not found or inactive: user_id={user_id}")
                 try:
@@ -45,22 +53,21 @@ def handle_connect():
                     pass
                 return True
             
+            role = claims['role']
             # 根據使用者角色加入相應的房間
             try:
-                if user.role == 'admin':
+                if role == 'admin':
                     join_room('/backend')
-                    emit('connected', {'message': '已連接到管理員頻道', 'user_id': user_id, 'role': user.role})
+                    emit('connected', {'message': '已連接到管理員頻道', 'user_id': user_id, 'role': role})
                 
-                if user.role == 'store_admin':
-                    # 獲取使用者擁有的店鋪
-                    from app.models import Shop
-                    shops = Shop.query.filter_by(owner_id=user_id).all()
-                    for shop in shops:
+                if role == 'store_admin':
+                    # 使用者擁有的店鋪
+                    for shop_id in claims['shop_ids']:
                         try:
-                            join_room(f'/shop/{shop.id}')
+                            join_room(f'/shop/{shop_id}')
                         except Exception as shop_error:
                             print(f"Socket.IO join shop error: {str(shop_error)}")
-                    emit('connected', {'message': '已連接到店鋪頻道', 'user_id': user_id, 'role': user.role})
+                    emit('connected', {'message': '已連接到店鋪頻道', 'user_id': user_id, 'role': role})
                 
                 # 所有使用者都加入使用者個人頻道和公開頻道
                 try:
@@ -69,11 +76,11 @@ def handle_connect():
                 except Exception as room_error:
                     print(f"Socket.IO join room error: {str(room_error)}")
                 
-                emit('connected', {'message': '連接成功', 'user_id': user_id, 'role': user.role})
+                emit('connected', {'message': '連接成功', 'user_id': user_id, 'role': role})
             except Exception as room_error:
                 # 加入房間失敗，但仍允許連接
                 print(f"Socket.IO room join error: {str(room_error)}")
-                emit('connected', {'message': '連接成功（部分功能可能受限）', 'user_id': user_id, 'role': user.role})
+                emit('connected', {'message': '連接成功（部分功能可能受限）', 'user_id': user_id, 'role': role})
             
             return True
             
@@ -101,26 +108,21 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """客戶端斷開連接事件"""
+    # 斷線時 Socket.IO 會自動把連線移出所有房間，不需要查詢使用者與店鋪再逐一 leave_room
+    pass
+
+@socketio.on('replay')
+def handle_replay(data):
+    """斷線重連後補送錯過的房間事件（回傳值即 ack）"""
     try:
-        user_id = session.get('user_id')
-        if user_id:
-            user = User.query.get(user_id)
-            if user:
-                if user.role == 'store_admin':
-                    from app.models import Shop
-                    shops = Shop.query.filter_by(owner_id=user_id).all()
-                    for shop in shops:
-                        leave_room(f'/shop/{shop.id}')
-                
-                leave_room(f'/user/{user_id}')
-                leave_room('/public')
-                
-                if user.role == 'admin':
-                    leave_room('/backend')
-        
-        emit('disconnected', {'message': '已断开连接'})
+        last_seq = (data or {}).get('last_seq')
+        if last_seq is not None:
+            last_seq = int(last_seq)
+        joined = [room for room in rooms() if room != request.sid]
+        return replay_events(joined, last_seq)
     except Exception as e:
-        pass  # 忽略斷開連接時的錯誤
+        print(f"Socket.IO replay error: {str(e)}")
+        return {'events': [], 'complete': False, 'last_seq': None}
 
 @socketio.on('join_shop')
 def handle_join_shop(data):
@@ -0,0 +1,208 @@
+"""
+標籤式快取失效
+快取項目帶有標籤（如 shop:12、product:55、stock:55），每個標籤在共享快取中有一個世代計數器；
+讀取時比對項目記錄的世代與目前世代，任一標籤的世代變了即視為失效。
+失效只需寫入新的世代（redis 等共享後端上跨 worker 生效），不必知道快取鍵，
+因此可以放心把 TTL 拉長到數小時。
+
+CACHE_TYPE 為 simple（每個 worker 各自一份）時，其他 worker 看不到失效，
+存活時間一律縮短為 LOCAL_CACHE_MAX_AGE，啟動時並記錄警告；多 worker 部署請使用 redis。
+
+用法：
+    @products_api_bp.route('/<int:product_id>')
+    @tagged_cache(tags=lambda product_id: [f'product:{product_id}'])
+    def get_product(product_id):
+        ...
+        add_cache_tags(f'shop:{product.shop_id}')   # 計算過程中才知道的標籤
+
+    invalidate_on_commit(f'product:{product_id}')   # 在寫入交易中登記，commit 後失效
+
+快取的回應帶有由標籤世代計算的 ETag；客戶端重新驗證時只需讀取世代即可返回 304。
+回應內容在寫入快取時壓縮一次（gzip / br），命中時直接送出，不再經過 Flask-Compress。
+"""
+import hashlib
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import g, request, current_app, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db, cache
+from app.utils.conditional import make_etag, not_modified, add_validators
+from app.utils.compression import compress_variants, encoded_response, encoded_etag
+
+# 帶標籤的快取項目預設存活時間（秒）；正確性靠標籤失效，TTL 只用來回收空間
+TAGGED_CACHE_TIMEOUT = 6 * 3600
+# 行程內快取後端：標籤世代不跨 worker 共享
+LOCAL_CACHE_TYPES = ('simple', 'simplecache', 'null', 'nullcache')
+# 行程內快取時的存活時間上限（秒）：其他 worker 的失效看不到，只能靠過期
+LOCAL_CACHE_MAX_AGE = 300
+
+# 快取的回應：內容以 compress_variants() 預先壓縮保存
+ViewEntry = namedtuple('ViewEntry', ['tags', 'generations', 'variants', 'mimetype'])
+
+
+def cache_is_shared(app=None):
+    """CACHE_TYPE 是否為跨 worker 共享的後端（redis、memcached、filesystem 等）"""
+    cache_type = str((app or current_app).config.get('CACHE_TYPE') or 'null')
+    return cache_type.rsplit('.', 1)[-1].lower() not in LOCAL_CACHE_TYPES
+
+
+def bounded_timeout(timeout):
+    """共享快取時原樣返回；行程內快取時不超過 LOCAL_CACHE_MAX_AGE"""
+    if cache_is_shared():
+        return timeout
+    return min(timeout, LOCAL_CACHE_MAX_AGE) if timeout else LOCAL_CACHE_MAX_AGE
+
+
+def init_cache_tags(app):
+    """啟動時檢查快取後端：行程內快取無法跨 worker 失效，記錄警告"""
+    if not cache_is_shared(app):
+        app.logger.warning(
+            f"CACHE_TYPE={app.config.get('CACHE_TYPE')} 為行程內快取，快取標籤失效不會同步到其他 worker；"
+            f"帶標籤的快取最多保存 {LOCAL_CACHE_MAX_AGE} 秒。多個 worker 部署請設定 CACHE_TYPE=redis"
+        )
+
+
+def _tag_key(tag):
+    return f'tag_gen_{tag}'
+
+
+def _new_generation():
+    # 以微秒時間作為世代：失效或計數器被逐出後重建的世代不會與舊項目記錄的世代相同。
+    # 不用 cache.inc：Flask-Caching 的 Cache 沒有 inc，RedisCache 也會把整數序列化成 pickle，無法 INCR
+    return time.time_ns() // 1000
+
+
+def tag_generations(tags):
+    """
+    取得標籤目前的世代（一次 get_many；不存在的標籤會初始化）
+
+    Args:
+        tags: 標籤列表
+
+    Returns:
+        tuple: 與 tags 順序相同的世代
+    """
+    if not tags:
+        return ()
+    keys = [_tag_key(tag) for tag in tags]
+    values = list(cache.get_many(*keys))
+    for i, value in enumerate(values):
+        if value is None:
+            cache.add(keys[i], _new_generation(), timeout=0)
+            values[i] = cache.get(keys[i])
+    return tuple(values)
+
+
+def generation_now():
+    """目前時間對應的世代值（世代即寫入時的微秒時間戳，可以與時間比較）"""
+    return _new_generation()
+
+
+def tags_changed_since(tags, timestamp):
+    """
+    標籤在 timestamp（generation_now() 的值）之後是否失效過
+
+    計數器被逐出後重建也視為失效過（保守判斷）
+    """
+    return any(generation > timestamp for generation in tag_generations(tags))
+
+
+def invalidate_tags(*tags):
+    """立即使帶有這些標籤的快取項目失效"""
+    generation = _new_generation()
+    keys = {_tag_key(tag): generation for tag in set(tags) if tag}
+    if keys:
+        cache.set_many(keys, timeout=0)
+
+
+def invalidate_on_commit(*tags):
+    """
+    在目前交易中登記要失效的標籤，commit 後才遞增世代（rollback 則不生效），
+    避免其他請求在 commit 前重新快取到舊資料
+    """
+    db.session.info.setdefault('cache_tags', set()).update(tag for tag in tags if tag)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tags(session):
+    tags = session.info.pop('cache_tags', None)
+    if not tags:
+        return
+    try:
+        invalidate_tags(*tags)
+    except Exception as e:
+        current_app.logger.warning(f'快取標籤失效失敗 {sorted(tags)}: {e}')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tags(session):
+    session.info.pop('cache_tags', None)
+
+
+def add_cache_tags(*tags):
+    """在 @tagged_cache 視圖計算過程中加入標籤"""
+    pending = g.get('_cache_tags')
+    if pending is not None:
+        pending.update(tag for tag in tags if tag)
+
+
+def _view_cache_key(query_string):
+    key = f'tagged_view_{request.path}'
+    if query_string:
+        args = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+        key += '_' + hashlib.md5(repr(args).encode('utf-8')).hexdigest()
+    return key
+
+
+def _serve_entry(entry):
+    etag = make_etag(entry.tags, entry.generations)
+    response = not_modified(etag)
+    if response is not None:
+        return add_validators(response, etag)
+    response = encoded_response(entry.variants, entry.mimetype)
+    return add_validators(response, encoded_etag(etag, response))
+
+
+def tagged_cache(timeout=TAGGED_CACHE_TIMEOUT, tags=None, query_string=False):
+    """
+    帶標籤的視圖快取裝飾器（只快取 200 回應，並支援 If-None-Match → 304）
+
+    Args:
+        timeout: 存活時間（秒；行程內快取時不超過 LOCAL_CACHE_MAX_AGE）
+        tags: 標籤列表，或以視圖參數呼叫、返回標籤列表的函數
+        query_string: 是否依查詢參數區分快取
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = _view_cache_key(query_string)
+            entry = cache.get(key)
+            # 舊格式的項目（未壓縮的 tuple）視為未命中
+            if isinstance(entry, ViewEntry) and tag_generations(entry.tags) == entry.generations:
+                return _serve_entry(entry)
+
+            static_tags = tags(*args, **kwargs) if callable(tags) else (tags or [])
+            static_tags = sorted(set(static_tags))
+            # 先讀世代再計算：計算期間發生的失效會讓這次寫入的項目直接作廢
+            static_generations = tag_generations(static_tags)
+            g._cache_tags = set()
+            try:
+                response = make_response(f(*args, **kwargs))
+                dynamic_tags = sorted(g._cache_tags - set(static_tags))
+            finally:
+                g._cache_tags = None
+
+            if response.status_code == 200 and not response.is_streamed:
+                entry = ViewEntry(
+                    tuple(static_tags + dynamic_tags),
+                    static_generations + tag_generations(dynamic_tags),
+                    compress_variants(response.get_data()),
+                    response.mimetype
+                )
+                cache.set(key, entry, timeout=bounded_timeout(timeout))
+                return _serve_entry(entry)
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,462 @@
+"""
+店鋪產品批次匯入／匯出（CSV、JSON Lines、JSON）
+匯入：逐行讀取上傳內容，每 IMPORT_CHUNK_SIZE 筆驗證一次，以 executemany 寫入 product（MySQL 逐筆寫入以取得 ID）與
+product_topping，全部在呼叫者的同一個交易中完成（任何一筆驗證失敗則整批不寫入），
+只記錄一筆彙總的稽核日誌。
+匯出：以 id 游標分批讀取欄位（不載入 ORM 物件），逐行產生輸出，記憶體用量與產品數量無關。
+
+CSV 欄位：
+    name, category_id, category, description, unit_price, discounted_price, stock_quantity,
+    is_active, has_cold_drink, cold_drink_price, has_hot_drink, hot_drink_price, toppings
+    - category_id 與 category（分類名稱）擇一
+    - toppings 格式為「配料名稱:價格;配料名稱」，省略價格時使用配料的預設價格
+匯出另外包含 id 欄位（匯入時忽略）。
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import insert
+from app import db
+from app.models import Product, Topping, product_topping
+from app.utils.reference_data import categories, get_category
+from app.utils.validators import validate_decimal, validate_integer
+
+# 每批驗證與寫入的筆數
+IMPORT_CHUNK_SIZE = 500
+# 單次匯入的最大筆數
+MAX_IMPORT_ROWS = 20000
+# 錯誤回報的最大筆數
+MAX_IMPORT_ERRORS = 100
+# 匯出時每批讀取的筆數
+EXPORT_BATCH_SIZE = 1000
+
+CATALOG_FORMATS = ('csv', 'jsonl', 'json')
+CATALOG_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'json': 'application/json',
+}
+CATALOG_FIELDS = [
+    'name', 'category_id', 'category', 'description', 'unit_price', 'discounted_price',
+    'stock_quantity', 'is_active', 'has_cold_drink', 'cold_drink_price',
+    'has_hot_drink', 'hot_drink_price', 'toppings'
+]
+
+_TRUE_VALUES = ('true', '1', 'yes', 'y', 't', '是')
+_FALSE_VALUES = ('false', '0', 'no', 'n', 'f', '否')
+
+
+class CatalogImportError(ValueError):
+    """匯入資料驗證失敗（errors 為 [{'row': 行號, 'message': 說明}, ...]）"""
+
+    def __init__(self, errors, total):
+        super().__init__(f'{total} 筆資料驗證失敗')
+        self.errors = errors
+        self.total = total
+
+
+def detect_format(filename=None, mimetype=None, requested=None):
+    """
+    判斷匯入／匯出格式
+
+    Returns:
+        'csv' / 'jsonl' / 'json' 或 None（無法判斷）
+    """
+    if requested:
+        requested = requested.lower()
+        return 'jsonl' if requested == 'ndjson' else (requested if requested in CATALOG_FORMATS else None)
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if extension in ('jsonl', 'ndjson'):
+            return 'jsonl'
+        if extension in ('csv', 'json'):
+            return extension
+    if mimetype:
+        for fmt, candidate in CATALOG_MIMETYPES.items():
+            if mimetype == candidate:
+                return fmt
+    return None
+
+
+def iter_records(stream, fmt):
+    """
+    逐筆讀取上傳內容（CSV 與 JSON Lines 為串流解析；JSON 陣列會整份載入）
+
+    Yields:
+        (行號, dict 或 None)；None 表示該行無法解析
+    """
+    reader = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.DictReader(reader), start=2):
+            yield line_no, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(reader, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+    else:
+        try:
+            data = json.load(reader)
+        except ValueError:
+            data = None
+        if not isinstance(data, list):
+            yield 1, None
+            return
+        for index, record in enumerate(data, start=1):
+            yield index, record if isinstance(record, dict) else None
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _parse_bool(value, default):
+    if _blank(value):
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ValueError(f'無法辨識的布林值：{value}')
+
+
+class _ShopToppings:
+    """店鋪配料對照（名稱與 ID 兩種查法）"""
+
+    def __init__(self, shop_id):
+        rows = db.session.query(Topping.id, Topping.name, Topping.price).filter(Topping.shop_id == shop_id).all()
+        self.prices = {row.id: row.price for row in rows}
+        self.by_name = {row.name.strip(): row.id for row in rows}
+
+    def resolve(self, ref):
+        """依名稱（優先）或 ID 找配料"""
+        ref = str(ref).strip()
+        if ref in self.by_name:
+            return self.by_name[ref]
+        if ref.isdigit() and int(ref) in self.prices:
+            return int(ref)
+        return None
+
+
+def _parse_toppings(value, shop_toppings):
+    """
+    解析 toppings 欄位
+
+    接受「名稱:價格;名稱」字串，或 [{'topping_id'|'name': ..., 'price': ...}, ...]
+
+    Returns:
+        list: [(topping_id, price), ...]
+    """
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        items = []
+        for part in value.split(';'):
+            if not part.strip():
+                continue
+            ref, _, price = part.partition(':')
+            items.append({'ref': ref, 'price': price if price.strip() else None})
+    elif isinstance(value, list):
+        items = [{
+            'ref': item.get('topping_id') or item.get('name'),
+            'price': item.get('price')
+        } for item in value if isinstance(item, dict)]
+    else:
+        raise ValueError('toppings 格式錯誤')
+
+    result = {}
+    for item in items:
+        topping_id = shop_toppings.resolve(item['ref']) if item['ref'] is not None else None
+        if topping_id is None:
+            raise ValueError(f'配料不存在：{item["ref"]}')
+        if item['price'] is None:
+            price = shop_toppings.prices[topping_id]
+        else:
+            is_valid, price, error_msg = validate_decimal(item['price'], '配料價格')
+            if not is_valid:
+                raise ValueError(error_msg)
+        result[topping_id] = price
+    return list(result.items())
+
+
+def _optional_price(record, key, field_name):
+    value = record.get(key)
+    if _blank(value):
+        return None
+    is_valid, price, error_msg = validate_decimal(value, field_name)
+    if not is_valid:
+        raise ValueError(error_msg)
+    return price
+
+
+def _validate_record(record, shop_toppings, category_ids):
+    """
+    驗證一筆匯入資料
+
+    Returns:
+        (產品欄位 dict, [(topping_id, price), ...])
+
+    Raises:
+        ValueError: 驗證失敗
+    """
+    name = _text(record.get('name'))
+    if not name:
+        raise ValueError('產品名稱不能為空')
+
+    category_id = record.get('category_id')
+    if not _blank(category_id):
+        is_valid, category_id, error_msg = validate_integer(category_id, '分類ID', min_value=1)
+        if not is_valid:
+            raise ValueError(error_msg)
+        if get_category(category_id) is None:
+            raise ValueError(f'分類不存在：{category_id}')
+    else:
+        category_name = _text(record.get('category'))
+        category_id = category_ids.get(category_name)
+        if category_id is None:
+            raise ValueError(f'分類不存在：{category_name}' if category_name else '產品分類不能為空')
+
+    is_valid, unit_price, error_msg = validate_decimal(record.get('unit_price'), '單價')
+    if not is_valid:
+        raise ValueError(error_msg)
+    discounted_price = _optional_price(record, 'discounted_price', '折扣價')
+    if discounted_price is not None and discounted_price >= unit_price:
+        raise ValueError('折扣價必須小於單價')
+
+    stock_quantity = record.get('stock_quantity')
+    if _blank(stock_quantity):
+        stock_quantity = 0
+    else:
+        is_valid, stock_quantity, error_msg = validate_integer(stock_quantity, '庫存數量', min_value=0)
+        if not is_valid:
+            raise ValueError(error_msg)
+
+    has_cold_drink = _parse_bool(record.get('has_cold_drink'), False)
+    has_hot_drink = _parse_bool(record.get('has_hot_drink'), False)
+    cold_drink_price = _optional_price(record, 'cold_drink_price', '冷飲加價') if has_cold_drink else None
+    hot_drink_price = _optional_price(record, 'hot_drink_price', '熱飲加價') if has_hot_drink else None
+
+    product = {
+        'name': name,
+        'description': _text(record.get('description')),
+        'category_id': category_id,
+        'unit_price': unit_price,
+        'discounted_price': discounted_price,
+        'stock_quantity': stock_quantity,
+        'is_active': _parse_bool(record.get('is_active'), True),
+        'has_cold_drink': has_cold_drink,
+        'cold_drink_price': Decimal(cold_drink_price or 0) if has_cold_drink else None,
+        'has_hot_drink': has_hot_drink,
+        'hot_drink_price': Decimal(hot_drink_price or 0) if has_hot_drink else None,
+    }
+    return product, _parse_toppings(record.get('toppings'), shop_toppings)
+
+
+def _insert_products(rows):
+    """
+    寫入產品並取回 ID（與 rows 順序相同）
+
+    支援 executemany RETURNING 的資料庫（SQLite、PostgreSQL、MariaDB）一次寫入並依參數順序取回 ID；
+    MySQL 不支援 RETURNING，且並行寫入時自動遞增值不保證連續，改為逐筆 INSERT 取 inserted_primary_key。
+    """
+    dialect = db.session.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(db.session.scalars(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True), rows
+        ))
+    return [db.session.execute(insert(Product).values(**row)).inserted_primary_key[0] for row in rows]
+
+
+def _insert_chunk(shop_id, chunk):
+    """
+    寫入一批產品與配料關聯（配料關聯一次 executemany）
+
+    Returns:
+        list: 新產品的 ID（與 chunk 順序相同）
+    """
+    now = datetime.utcnow()
+    product_ids = _insert_products([
+        dict(product, shop_id=shop_id, created_at=now, updated_at=now) for product, _ in chunk
+    ])
+
+    topping_rows = [
+        {'product_id': product_id, 'topping_id': topping_id, 'price': price}
+        for product_id, (_, toppings) in zip(product_ids, chunk)
+        for topping_id, price in toppings
+    ]
+    if topping_rows:
+        db.session.execute(product_topping.insert(), topping_rows)
+    return product_ids
+
+
+def import_products(shop_id, records):
+    """
+    批次匯入產品（寫入呼叫者的交易，由呼叫者 commit；失敗時由呼叫者 rollback）
+
+    Args:
+        shop_id: 店鋪ID
+        records: iter_records() 產生的 (行號, dict) 序列
+
+    Returns:
+        list: 新產品的 ID
+
+    Raises:
+        CatalogImportError: 有資料驗證失敗（此時不保證已寫入的資料，呼叫者需 rollback）
+    """
+    shop_toppings = _ShopToppings(shop_id)
+    category_ids = {c.name.strip(): c.id for c in categories()}
+
+    errors = []
+    error_count = 0
+    product_ids = []
+    chunk = []
+    row_count = 0
+    for line_no, record in records:
+        row_count += 1
+        if row_count > MAX_IMPORT_ROWS:
+            raise CatalogImportError([{'row': line_no, 'message': f'單次最多匯入 {MAX_IMPORT_ROWS} 筆'}],
+                                     error_count + 1)
+        try:
+            if record is None:
+                raise ValueError('無法解析此行資料')
+            chunk.append(_validate_record(record, shop_toppings, category_ids))
+        except (ValueError, TypeError) as e:
+            error_count += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append({'row': line_no, 'message': str(e)})
+
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            # 已有錯誤時不再寫入，只繼續驗證以回報所有錯誤
+            if not error_count:
+                product_ids += _insert_chunk(shop_id, chunk)
+            chunk = []
+
+    if error_count:
+        raise CatalogImportError(errors, error_count)
+    if chunk:
+        product_ids += _insert_chunk(shop_id, chunk)
+    return product_ids
+
+
+def _export_batches(shop_id):
+    """以 id 游標分批讀取產品與其配料"""
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Product.id, Product.name, Product.category_id, Product.description,
+            Product.unit_price, Product.discounted_price, Product.stock_quantity, Product.is_active,
+            Product.has_cold_drink, Product.cold_drink_price, Product.has_hot_drink, Product.hot_drink_price
+        ).filter(
+            Product.shop_id == shop_id,
+            Product.deleted_at.is_(None),
+            Product.id > last_id
+        ).order_by(Product.id).limit(EXPORT_BATCH_SIZE).all()
+        if not rows:
+            return
+
+        toppings = {}
+        topping_rows = db.session.query(
+            product_topping.c.product_id, Topping.id, Topping.name, product_topping.c.price
+        ).join(Topping, Topping.id == product_topping.c.topping_id).filter(
+            product_topping.c.product_id.in_([row.id for row in rows])
+        ).order_by(product_topping.c.product_id, Topping.id).all()
+        for product_id, topping_id, name, price in topping_rows:
+            toppings.setdefault(product_id, []).append((topping_id, name, price))
+
+        yield rows, toppings
+        last_id = rows[-1].id
+
+
+def _price_text(value):
+    return '' if value is None else format(Decimal(value).normalize(), 'f')
+
+
+def _export_record(row, toppings):
+    category = get_category(row.category_id)
+    return {
+        'id': row.id,
+        'name': row.name,
+        'category_id': row.category_id,
+        'category': category.name if category else None,
+        'description': row.description or '',
+        'unit_price': float(row.unit_price),
+        'discounted_price': float(row.discounted_price) if row.discounted_price else None,
+        'stock_quantity': row.stock_quantity,
+        'is_active': row.is_active,
+        'has_cold_drink': row.has_cold_drink,
+        'cold_drink_price': float(row.cold_drink_price or 0) if row.has_cold_drink else None,
+        'has_hot_drink': row.has_hot_drink,
+        'hot_drink_price': float(row.hot_drink_price or 0) if row.has_hot_drink else None,
+        'toppings': [
+            {'topping_id': topping_id, 'name': name, 'price': float(price)}
+            for topping_id, name, price in toppings
+        ]
+    }
+
+
+def export_products(shop_id, fmt):
+    """
+    匯出店鋪產品（產生器，配合 stream_with_context 以串流回應輸出）
+
+    Args:
+        shop_id: 店鋪ID
+        fmt: 'csv' / 'jsonl' / 'json'
+
+    Yields:
+        str: 輸出片段
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # 讓 Excel 以 UTF-8 開啟
+        writer.writerow(['id'] + CATALOG_FIELDS)
+        for rows, toppings in _export_batches(shop_id):
+            for row in rows:
+                category = get_category(row.category_id)
+                writer.writerow([
+                    row.id, row.name, row.category_id, category.name if category else '',
+                    row.description or '', _price_text(row.unit_price), _price_text(row.discounted_price),
+                    row.stock_quantity, 'true' if row.is_active else 'false',
+                    'true' if row.has_cold_drink else 'false',
+                    _price_text(row.cold_drink_price) if row.has_cold_drink else '',
+                    'true' if row.has_hot_drink else 'false',
+                    _price_text(row.hot_drink_price) if row.has_hot_drink else '',
+                    ';'.join(f'{name}:{_price_text(price)}' for _, name, price in toppings.get(row.id, []))
+                ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+
+    first = True
+    if fmt == 'json':
+        yield '['
+    for rows, toppings in _export_batches(shop_id):
+        lines = []
+        for row in rows:
+            line = json.dumps(_export_record(row, toppings.get(row.id, [])), ensure_ascii=False)
+            if fmt == 'json':
+                lines.append(line if first else ',' + line)
+            else:
+                lines.append(line + '\n')
+            first = False
+        yield ''.join(lines)
+    if fmt == 'json':
+        yield ']'
@@ -0,0 +1,141 @@
+"""
+預先壓縮的回應內容
+快取的內容在寫入快取時壓縮一次（gzip，安裝 brotli 時另存 br），命中時直接送出壓縮好的位元組，
+不再經過 Flask-Compress 每次重新壓縮（已帶 Content-Encoding 的回應 Flask-Compress 會略過）。
+靜態文件由建置步驟（build_static.py）在旁邊寫出 .gz / .br 文件，static 路由依 Accept-Encoding 直接送出。
+"""
+import gzip
+import os
+from flask import request, current_app
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Flask-Compress 的相依套件，未安裝時只提供 gzip
+    brotli = None
+
+# 快取內容的壓縮等級：只在快取未命中時壓縮一次（brotli 11 對大型 JSON 太慢，執行期用 5）
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 5
+# 建置步驟的壓縮等級：部署時壓縮一次，用最高等級
+BUILD_GZIP_LEVEL = 9
+BUILD_BROTLI_QUALITY = 11
+# 建置步驟壓縮的文件類型（其餘如圖片已是壓縮格式）
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.map')
+# 預先壓縮文件的副檔名（依偏好順序）
+PRECOMPRESSED_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress_variants(body):
+    """
+    壓縮內容
+
+    Args:
+        body: bytes
+
+    Returns:
+        dict: {'gzip': bytes, 'br': bytes}；內容小於 COMPRESS_MIN_SIZE 時為 {'identity': body}
+    """
+    if len(body) < current_app.config.get('COMPRESS_MIN_SIZE', 500):
+        return {'identity': body}
+    # mtime=0 讓相同內容壓出相同位元組
+    variants = {'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def choose_encoding(variants):
+    """依 Accept-Encoding 選擇要送出的版本（br 優先）"""
+    if 'identity' in variants:
+        return 'identity'
+    accepted = request.accept_encodings
+    for encoding, _ in PRECOMPRESSED_SUFFIXES:
+        if encoding in variants and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def encoded_body(variants, encoding):
+    """取得指定編碼的內容（identity 由 gzip 版本解壓，只有不支援壓縮的客戶端會用到）"""
+    if encoding in variants:
+        return variants[encoding]
+    return gzip.decompress(variants['gzip'])
+
+
+def encoded_response(variants, mimetype, status=200):
+    """
+    以預先壓縮的內容建立回應
+
+    Args:
+        variants: compress_variants() 的結果
+        mimetype: 內容類型
+        status: 狀態碼
+    """
+    encoding = choose_encoding(variants)
+    response = current_app.response_class(encoded_body(variants, encoding), status=status, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def encoded_etag(etag, response):
+    """壓縮後的內容是不同的表示，ETag 加上 ':<演算法>'（與 Flask-Compress 相同，conditional 會一併比對）"""
+    encoding = response.headers.get('Content-Encoding')
+    return f'{etag}:{encoding}' if encoding else etag
+
+
+def write_compressed_siblings(path):
+    """
+    建置步驟：在文件旁寫出 .gz（與安裝 brotli 時的 .br）；已是最新的文件不重寫
+
+    Returns:
+        list: 寫出的文件路徑
+    """
+    if not path.endswith(COMPRESSIBLE_EXTENSIONS):
+        return []
+    with open(path, 'rb') as f:
+        body = f.read()
+    mtime = os.path.getmtime(path)
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=BUILD_GZIP_LEVEL, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=BUILD_BROTLI_QUALITY)))
+
+    written = []
+    for suffix, compress in compressors:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+        data = compress(body)
+        # 壓縮後沒有變小就不寫出（送出原始文件即可），並移除舊版本的壓縮文件
+        if len(data) >= len(body):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        with open(target, 'wb') as f:
+            f.write(data)
+        written.append(target)
+    return written
+
+
+def precompressed_file(folder, filename):
+    """
+    依 Accept-Encoding 選擇預先壓縮的文件
+
+    Returns:
+        (相對路徑, 編碼) 或 (None, None)
+    """
+    source = safe_join(folder, filename)
+    if source is None or not os.path.isfile(source):
+        return None, None
+    source_mtime = os.path.getmtime(source)
+    accepted = request.accept_encodings
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+        if not accepted[encoding]:
+            continue
+        path = source + suffix
+        # 原始文件在建置之後被修改過時，壓縮文件已過期
+        if os.path.isfile(path) and os.path.getmtime(path) >= source_mtime:
+            return filename + suffix, encoding
+    return None, None
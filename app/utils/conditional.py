@@ -0,0 +1,129 @@
+"""
+條件式 GET（ETag / Last-Modified → 304 Not Modified）
+驗證器在產生回應內容之前計算（資料集的 max(updated_at) 與筆數，或快取標籤的世代），
+客戶端帶著相同的 If-None-Match / If-Modified-Since 重新驗證時直接返回空的 304，
+不查詢資料、不做 JSON 序列化、也不經過 Flask-Compress 壓縮。
+
+用法：
+    @news_api_bp.route('', methods=['GET'])
+    @conditional_get(lambda: collection_validators(_news_query()))
+    def get_news_list():
+        ...
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import request, current_app, make_response
+from app import db
+
+# Flask-Compress 壓縮後會在 ETag 後面加上 ':<演算法>'，比對時一併接受
+_COMPRESSED_SUFFIXES = ('gzip', 'br', 'deflate')
+
+
+def make_etag(*parts):
+    """由驗證器的組成部分與請求路徑、查詢參數計算 ETag"""
+    args = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+    raw = repr((request.path, args) + parts).encode('utf-8')
+    return hashlib.md5(raw).hexdigest()
+
+
+def collection_validators(query, column=None):
+    """
+    資料集的驗證器：SELECT max(updated_at), count(*)（不載入資料列）
+
+    筆數一併納入 ETag，刪除資料時 max(updated_at) 不變也能察覺。
+
+    Args:
+        query: Model.query 加上與視圖相同的篩選條件
+        column: 時間欄位（預設為查詢主體的 updated_at）
+
+    Returns:
+        (etag, last_modified)
+    """
+    if column is None:
+        column = query.column_descriptions[0]['entity'].updated_at
+    last_modified, count = query.order_by(None).with_entities(
+        db.func.max(column), db.func.count()
+    ).one()
+    return make_etag(last_modified, count), last_modified
+
+
+def row_validators(model, record_id):
+    """
+    單筆資料的驗證器
+
+    Returns:
+        (etag, last_modified) 或 None（資料不存在，交給視圖返回 404）
+    """
+    last_modified = db.session.query(model.updated_at).filter(model.id == record_id).scalar()
+    if last_modified is None:
+        return None
+    return make_etag(last_modified), last_modified
+
+
+def _matching_etag(etag):
+    """If-None-Match 是否包含這個 ETag（含壓縮後的變體）；返回相符的 ETag"""
+    if_none_match = request.if_none_match
+    for candidate in (etag,) + tuple(f'{etag}:{suffix}' for suffix in _COMPRESSED_SUFFIXES):
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def not_modified(etag, last_modified=None):
+    """
+    依請求的條件標頭判斷是否可以返回 304（有 If-None-Match 時忽略 If-Modified-Since）
+
+    Returns:
+        304 Response 或 None
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    if request.if_none_match:
+        matched = _matching_etag(etag)
+        if matched is None:
+            return None
+    elif last_modified is not None and request.if_modified_since is not None:
+        if last_modified.replace(tzinfo=timezone.utc, microsecond=0) > request.if_modified_since:
+            return None
+        matched = etag
+    else:
+        return None
+
+    response = current_app.response_class(status=304)
+    return add_validators(response, matched, last_modified)
+
+
+def add_validators(response, etag, last_modified=None):
+    """在回應上設定 ETag / Last-Modified（瀏覽器可保存，但使用前需重新驗證）"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.headers.setdefault('Cache-Control', 'public, no-cache')
+    return response
+
+
+def conditional_get(validator):
+    """
+    條件式 GET 裝飾器
+
+    Args:
+        validator: 以視圖參數呼叫，返回 (etag, last_modified) 或 None（不做條件判斷）
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            validators = validator(*args, **kwargs)
+            if validators is None:
+                return f(*args, **kwargs)
+            etag, last_modified = validators
+            response = not_modified(etag, last_modified)
+            if response is not None:
+                return response
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return add_validators(response, etag, last_modified)
+        return decorated_function
+    return decorator
@@ -0,0 +1,172 @@
+"""
+下單冪等工具
+客戶端以 Idempotency-Key 標頭重試下單時，直接返回第一次的回應，
+不再重跑計價、庫存扣減與訂單寫入（重放只讀 idempotency_key 表）
+"""
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, session, jsonify, current_app, make_response
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+
+# 處理中的記錄超過此時間仍未完成（例如 worker 崩潰），允許重新處理
+IN_PROGRESS_TIMEOUT = timedelta(seconds=60)
+
+
+def _request_scope():
+    """
+    冪等範圍：端點 + 使用者
+
+    訪客以請求中的店鋪與桌號區分（不依賴 session：第一次請求的回應遺失時 Set-Cookie 也一併遺失，
+    重試會帶著同一個 key 但沒有 cookie）。同一桌的其他訪客須猜中客戶端產生的 key
+    且請求內容完全相同才會重放，內容不同時由 request_hash 檢查拒絕。
+    """
+    user_id = session.get('user_id')
+    if user_id:
+        return f"{request.endpoint}:{user_id}"
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    # 店鋪 ID 與桌號來自客戶端，取雜湊以符合 scope 欄位長度
+    table = f"{data.get('shop_id')}:{data.get('table_number')}"
+    return f"{request.endpoint}:guest-{hashlib.sha256(table.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _request_hash():
+    """請求內容指紋（同一個 key 搭配不同內容視為客戶端錯誤）"""
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(record):
+    """返回已儲存的回應"""
+    response = current_app.response_class(
+        record.response_body,
+        status=record.status_code,
+        mimetype='application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress():
+    """同一個 key 的第一次請求尚未完成"""
+    return jsonify({
+        'error': 'conflict',
+        'message': '相同的 Idempotency-Key 正在處理中，請稍後重試',
+        'details': {}
+    }), 409
+
+
+def _claim(scope, key, request_hash):
+    """
+    取得 key 的處理權
+
+    Returns:
+        tuple: (record_id, None) 取得處理權；(None, 回應) 應直接返回
+    """
+    now = datetime.utcnow()
+    record = IdempotencyKey(scope=scope, key=key, request_hash=request_hash, created_at=now)
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return record.id, None
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+    if existing is None:
+        # 另一個請求剛好刪除了失敗的記錄，請客戶端重試
+        return None, _in_progress()
+
+    ttl = timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    expired = existing.created_at < now - ttl
+    stale = existing.status_code is None and existing.created_at < now - IN_PROGRESS_TIMEOUT
+
+    if not expired and not stale:
+        if existing.request_hash != request_hash:
+            return None, (jsonify({
+                'error': 'idempotency_key_reused',
+                'message': 'Idempotency-Key 已用於不同的請求內容',
+                'details': {}
+            }), 422)
+        if existing.status_code is None:
+            return None, _in_progress()
+        return None, _replay(existing)
+
+    # 過期或卡住的記錄：以條件式 UPDATE 搶回處理權，避免兩個請求同時接手
+    claimed = IdempotencyKey.query.filter(
+        IdempotencyKey.id == existing.id,
+        or_(
+            IdempotencyKey.created_at < now - ttl,
+            and_(IdempotencyKey.status_code.is_(None),
+                 IdempotencyKey.created_at < now - IN_PROGRESS_TIMEOUT)
+        )
+    ).update({
+        'request_hash': request_hash,
+        'status_code': None,
+        'response_body': None,
+        'created_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+    if claimed:
+        return existing.id, None
+    return None, _in_progress()
+
+
+def _finish(record_id, response):
+    """儲存回應；伺服器錯誤不儲存，讓客戶端可以用同一個 key 重試"""
+    try:
+        db.session.rollback()
+        if response.status_code >= 500:
+            IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+        else:
+            IdempotencyKey.query.filter_by(id=record_id).update({
+                'status_code': response.status_code,
+                'response_body': response.get_data(as_text=True)
+            }, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f'儲存冪等記錄失敗 (id={record_id}): {e}')
+
+
+def idempotent(f):
+    """
+    下單端點冪等裝飾器
+
+    - 沒有 Idempotency-Key 標頭：照常處理
+    - 第一次請求：佔位後執行端點，儲存狀態碼與回應內容（5xx 除外）
+    - 重放：直接返回儲存的回應，並加上 Idempotent-Replayed: true
+    - 同一個 key 搭配不同請求內容：422；第一次請求仍在處理中：409
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+        if not key:
+            return f(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({
+                'error': 'validation_error',
+                'message': f'Idempotency-Key 長度不可超過 {MAX_KEY_LENGTH}',
+                'details': {'field': IDEMPOTENCY_HEADER}
+            }), 400
+
+        record_id, early_response = _claim(_request_scope(), key, _request_hash())
+        if early_response is not None:
+            return early_response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            _finish(record_id, current_app.response_class(status=500))
+            raise
+        _finish(record_id, response)
+        return response
+    return decorated_function
@@ -0,0 +1,264 @@
+"""
+店鋪菜單文件
+把一個店鋪前台需要的資料（店鋪資訊、產品、配料與覆寫價格、圖片、分類、飲品選項、支付方式）
+預先組成一份 JSON 文件，序列化並 gzip 壓縮後保存；以 shop.menu_version 作為單調遞增的版本號，
+ETag 由版本號決定，重複造訪時直接返回 304（不查資料庫、不做 JSON 序列化）。
+
+產品、配料、圖片、支付方式等寫入時，在同一個交易中呼叫 mark_menu_changed(shop_id) 遞增版本；
+commit 後自動發布新版本號，並使計價快照與 shop:<id> 快取標籤失效。
+庫存會隨每筆訂單變動，不放進菜單文件（即時庫存請查詢 /api/products/<id>）。
+"""
+import gzip
+import json
+from collections import namedtuple
+from flask import request, current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session, noload, selectinload
+from app import db, cache
+from app.models import Shop, Product, Topping, product_topping
+from app.utils.pricing import invalidate_pricing
+from app.utils.cache_tags import invalidate_on_commit
+from app.utils.reference_data import get_category, shop_payment_methods
+
+# 共享快取中版本號的存活時間（秒）；只用來限制併發重建時寫回舊版本號的影響範圍
+MENU_VERSION_TTL = 60
+# 共享快取中菜單文件的存活時間（秒）；版本號不變時文件內容不變，可以放久一點
+MENU_DOCUMENT_TTL = 86400
+
+MenuDocument = namedtuple('MenuDocument', ['shop_id', 'version', 'body', 'gzip_body'])
+
+# {shop_id: MenuDocument}
+_documents = {}
+
+
+def _version_key(shop_id):
+    return f'menu_version_{shop_id}'
+
+
+def _document_key(shop_id):
+    return f'menu_document_{shop_id}'
+
+
+def menu_etag(shop_id, version, gzipped=False):
+    """菜單文件的強 ETag（gzip 與未壓縮的內容不同，ETag 也不同）"""
+    return f'menu-{shop_id}-v{version}' + ('-gz' if gzipped else '')
+
+
+def current_menu_version(shop_id):
+    """
+    取得店鋪菜單的目前版本號（優先讀共享快取）
+
+    Returns:
+        int 或 None（店鋪不存在或已刪除）
+    """
+    key = _version_key(shop_id)
+    version = cache.get(key)
+    if version is None:
+        version = db.session.scalar(
+            select(Shop.menu_version).where(Shop.id == shop_id, Shop.deleted_at.is_(None))
+        )
+        if version is None:
+            return None
+        cache.set(key, version, timeout=MENU_VERSION_TTL)
+    return version
+
+
+def mark_menu_changed(*shop_ids):
+    """
+    在目前交易中遞增店鋪菜單版本（由呼叫者 commit）
+
+    UPDATE shop SET menu_version = menu_version + 1 WHERE id IN (...)
+
+    commit 後發布新版本號、丟棄本行程的舊文件，並使計價快照與 shop:<id> 快取標籤失效；
+    rollback 則不生效。
+
+    Args:
+        shop_ids: 一個或多個店鋪ID
+    """
+    ids = sorted({shop_id for shop_id in shop_ids if shop_id is not None})
+    if not ids:
+        return
+    db.session.execute(
+        update(Shop).where(Shop.id.in_(ids)).values(
+            menu_version=Shop.menu_version + 1,
+            updated_at=Shop.updated_at  # 菜單異動不算店鋪資料更新
+        ).execution_options(synchronize_session=False)
+    )
+    versions = dict(db.session.execute(
+        select(Shop.id, Shop.menu_version).where(Shop.id.in_(ids))
+    ).all())
+    db.session.info.setdefault('menu_changed', {}).update(versions)
+    invalidate_on_commit(*(f'shop:{shop_id}' for shop_id in ids))
+
+
+def mark_all_menus_changed():
+    """遞增所有店鋪的菜單版本（分類等全站共用資料異動時使用）"""
+    shop_ids = db.session.scalars(select(Shop.id).where(Shop.deleted_at.is_(None))).all()
+    mark_menu_changed(*shop_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_menu_versions(session):
+    versions = session.info.pop('menu_changed', None)
+    if not versions:
+        return
+    try:
+        for shop_id, version in versions.items():
+            cache.set(_version_key(shop_id), version, timeout=MENU_VERSION_TTL)
+            _documents.pop(shop_id, None)
+        invalidate_pricing(*versions.keys())
+    except Exception as e:
+        # 發布失敗時最多 MENU_VERSION_TTL 秒後從資料庫讀到新版本
+        current_app.logger.warning(f'發布菜單版本失敗: {e}')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_menu_versions(session):
+    session.info.pop('menu_changed', None)
+
+
+def _price(value):
+    return float(value) if value is not None else None
+
+
+def _build_document(shop_id, version):
+    """從資料庫組出菜單文件並序列化、壓縮"""
+    shop = db.session.get(Shop, shop_id)
+    if shop is None or shop.deleted_at is not None:
+        return None
+
+    products = Product.query.options(
+        noload(Product.toppings),
+        selectinload(Product.images)
+    ).filter(
+        Product.shop_id == shop_id,
+        Product.is_active == True,
+        Product.deleted_at.is_(None)
+    ).order_by(Product.id).all()
+    product_ids = [p.id for p in products]
+
+    # 產品專屬的配料價格（product_topping 覆寫）
+    overrides = {}
+    if product_ids:
+        rows = db.session.query(
+            product_topping.c.product_id, product_topping.c.topping_id, product_topping.c.price
+        ).filter(product_topping.c.product_id.in_(product_ids)).all()
+        for product_id, topping_id, price in rows:
+            overrides.setdefault(product_id, {})[str(topping_id)] = float(price)
+
+    toppings = Topping.query.filter_by(shop_id=shop_id, is_active=True).order_by(Topping.id).all()
+
+    category_ids = sorted({p.category_id for p in products})
+    categories = [c for c in map(get_category, category_ids) if c is not None]
+
+    # 支付方式（店鋪未設定時為所有可用支付方式，與 /payment-methods/public 相同）
+    payment_methods = shop_payment_methods(shop_id, fallback=True)
+
+    document = {
+        'version': version,
+        'shop': {
+            'id': shop.id,
+            'name': shop.name,
+            'description': shop.description,
+            'status': shop.status,
+            'banner_image': shop.banner_image,
+            'images': [img.image_path for img in shop.images],
+            'max_toppings_per_order': shop.max_toppings_per_order,
+            'points_rate': shop.points_rate,
+            'qrcode_enabled': shop.qrcode_enabled
+        },
+        'categories': [{'id': c.id, 'name': c.name} for c in categories],
+        'products': [{
+            'id': p.id,
+            'name': p.name,
+            'description': p.description,
+            'category_id': p.category_id,
+            'unit_price': float(p.unit_price),
+            'discounted_price': _price(p.discounted_price) if p.discounted_price else None,
+            'images': [img.image_path for img in p.images],
+            'has_cold_drink': p.has_cold_drink,
+            'cold_drink_price': _price(p.cold_drink_price) if p.has_cold_drink else None,
+            'has_hot_drink': p.has_hot_drink,
+            'hot_drink_price': _price(p.hot_drink_price) if p.has_hot_drink else None,
+            'topping_prices': overrides.get(p.id, {})
+        } for p in products],
+        'toppings': [{
+            'id': t.id,
+            'name': t.name,
+            'price': float(t.price),
+            'display_price': t.get_display_price()
+        } for t in toppings],
+        'payment_methods': [{
+            'id': pm.id,
+            'name': pm.name,
+            'code': pm.code,
+            'icon': pm.icon
+        } for pm in payment_methods]
+    }
+
+    body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    # mtime=0 讓相同內容壓出相同位元組（各 worker 的 gzip ETag 一致）
+    gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+    return MenuDocument(shop_id, version, body, gzip_body)
+
+
+def get_menu_document(shop_id, version=None):
+    """
+    取得店鋪菜單文件（本行程記憶體 → 共享快取 → 重建）
+
+    Args:
+        shop_id: 店鋪ID
+        version: 已知的目前版本號（可選）
+
+    Returns:
+        MenuDocument 或 None（店鋪不存在或已刪除）
+    """
+    if version is None:
+        version = current_menu_version(shop_id)
+        if version is None:
+            return None
+
+    document = _documents.get(shop_id)
+    if document is not None and document.version == version:
+        return document
+
+    document = cache.get(_document_key(shop_id))
+    if document is None or document.version != version:
+        document = _build_document(shop_id, version)
+        if document is None:
+            return None
+        cache.set(_document_key(shop_id), document, timeout=MENU_DOCUMENT_TTL)
+    _documents[shop_id] = document
+    return document
+
+
+def menu_response(shop_id):
+    """
+    返回菜單文件回應（支援 If-None-Match → 304，客戶端接受 gzip 時直接送出預先壓縮的內容）
+
+    Returns:
+        Response 或 None（店鋪不存在或已刪除）
+    """
+    version = current_menu_version(shop_id)
+    if version is None:
+        return None
+
+    gzipped = 'gzip' in request.accept_encodings
+    etag = menu_etag(shop_id, version, gzipped)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        document = get_menu_document(shop_id, version)
+        if document is None:
+            return None
+        response = current_app.response_class(
+            document.gzip_body if gzipped else document.body,
+            mimetype='application/json'
+        )
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 允許瀏覽器保存，但每次使用前都要帶 ETag 重新驗證
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
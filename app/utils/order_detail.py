@@ -0,0 +1,131 @@
+"""
+訂單詳情載入工具
+以固定次數的查詢載入整個訂單圖（訂單、使用者、店鋪、桌號、訂單項、產品、配料、配料價格），
+供 API 與 HTML 頁面共用，避免逐項 lazy load 與逐配料查價
+"""
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import Order, OrderItem, Product, order_item_topping
+
+
+def order_detail_options():
+    """
+    訂單圖的預載選項
+
+    Returns:
+        tuple: 可傳給 query.options() 的載入選項
+    """
+    return (
+        joinedload(Order.user),
+        joinedload(Order.shop),
+        joinedload(Order.table),
+        selectinload(Order.items).joinedload(OrderItem.product).lazyload(Product.toppings),
+        selectinload(Order.items).selectinload(OrderItem.toppings),
+    )
+
+
+def load_order_detail(order_id):
+    """
+    載入單一訂單的完整資料
+
+    Args:
+        order_id: 訂單ID
+
+    Returns:
+        Order 或 None
+    """
+    order = Order.query.options(*order_detail_options()).filter(Order.id == order_id).first()
+    if order:
+        attach_topping_prices([order])
+    return order
+
+
+def load_orders_detail(query):
+    """
+    載入多筆訂單的完整資料（查詢次數與訂單數、訂單項數無關）
+
+    Args:
+        query: 已加上篩選、排序、分頁的 Order 查詢
+
+    Returns:
+        list: Order 列表
+    """
+    orders = query.options(*order_detail_options()).all()
+    attach_topping_prices(orders)
+    return orders
+
+
+def attach_topping_prices(orders):
+    """
+    一次查出所有訂單項的配料價格，並掛到訂單項上供 get_topping_prices() 使用
+
+    Args:
+        orders: Order 列表（items 已載入）
+    """
+    items = [item for order in orders for item in order.items]
+    if not items:
+        return
+
+    prices = {item.id: {} for item in items}
+    rows = db.session.query(
+        order_item_topping.c.order_item_id,
+        order_item_topping.c.topping_id,
+        order_item_topping.c.price
+    ).filter(order_item_topping.c.order_item_id.in_(list(prices.keys()))).all()
+    for order_item_id, topping_id, price in rows:
+        prices[order_item_id][topping_id] = price
+
+    for item in items:
+        item._topping_prices = prices[item.id]
+
+
+def serialize_order_detail(order):
+    """
+    訂單詳情序列化（API 回應格式）
+
+    Args:
+        order: 已透過 load_order_detail / load_orders_detail 載入的 Order
+
+    Returns:
+        dict
+    """
+    items_data = []
+    for item in order.items:
+        topping_prices = item.get_topping_prices()
+        toppings_data = []
+        for topping in item.toppings:
+            # 优先使用订单项中特定的 topping 价格，否则使用默认价格
+            price = topping_prices.get(topping.id)
+            topping_price = float(price) if price is not None else float(topping.price)
+            toppings_data.append({
+                'id': topping.id,
+                'name': topping.name,
+                'price': topping_price,
+                'display_price': "FREE" if topping_price == 0 else f"${topping_price:.2f}"
+            })
+
+        items_data.append({
+            'id': item.id,
+            'product_id': item.product_id,
+            'product_name': item.product.name if item.product else None,
+            'quantity': item.quantity,
+            'unit_price': float(item.unit_price),
+            'drink_type': item.drink_type,
+            'drink_price': float(item.drink_price) if item.drink_price else None,
+            'toppings': toppings_data
+        })
+
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'user_id': order.user_id,
+        'user_name': order.user.name if order.user else None,
+        'shop_id': order.shop_id,
+        'shop_name': order.shop.name if order.shop else None,
+        'table_number': order.table.table_number if order.table else None,
+        'status': order.status,
+        'total_price': float(order.total_price),
+        'items': items_data,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None
+    }
@@ -2,8 +2,15 @@
 订单编号生成工具
 """
 from datetime import datetime
-from app.models import Order, Shop, SystemSetting
-from app import db
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from app.models import Shop, SystemSetting, OrderSequence
+from app import db, cache
+from app.utils import reference_data
+from app.utils.cache_tags import bounded_timeout, invalidate_tags
+
+# 商店编码的快取时间（秒），修改时会主动清除；行程内快取时由 bounded_timeout 缩短
+ORDER_NUMBER_CACHE_TIMEOUT = 3600
 
 
 def generate_order_number(shop_id):
@@ -13,54 +20,113 @@ def generate_order_number(shop_id):
     格式：前缀 + 商店编码 + Ymd + 流水号
     例如：ORDERSHOP0120251106 0001
     
+    流水号由 order_sequence 计数器原子递增（O(1)，并发安全），
+    商店编码与订单前缀走快取，不再每张订单查询 shop / system_setting。
+    
     Args:
         shop_id: 店铺 ID
         
     Returns:
         str: 订单编号
     """
-    # 获取店铺
-    shop = Shop.query.get(shop_id)
-    if not shop:
-        raise ValueError(f'店铺 ID {shop_id} 不存在')
-    
     # 从系统设置获取订单前缀
-    order_prefix = SystemSetting.get('order_prefix', 'ORDER')
+    order_prefix = get_order_prefix()
     
     # 获取商店订单ID（必填字段）
-    shop_order_code = shop.shop_order_id
-    if not shop_order_code:
-        raise ValueError(f'店铺 {shop_id} 未设置商店订单ID')
+    shop_order_code = get_shop_order_code(shop_id)
     
     # 获取当前日期（Ymd格式）
-    today = datetime.now()
+    today = datetime.now().date()
     date_str = today.strftime('%Y%m%d')
     
-    # 获取今天该店铺的订单数量（用于生成流水号）
-    today_start = today.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # 查询今天该店铺的订单数量
-    today_order_count = Order.query.filter(
-        Order.shop_id == shop_id,
-        Order.created_at >= today_start,
-        Order.created_at <= today_end
-    ).count()
-    
     # 流水号（从 00001 开始，5位数）
-    sequence = str(today_order_count + 1).zfill(5)
+    sequence = str(next_order_sequence(shop_id, today)).zfill(5)
     
     # 组合订单编号
-    order_number = f"{order_prefix}{shop_order_code}{date_str}{sequence}"
+    return f"{order_prefix}{shop_order_code}{date_str}{sequence}"
+
+
+def next_order_sequence(shop_id, seq_date):
+    """
+    原子递增并返回 (shop_id, seq_date) 的流水号
+    
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE last_seq = LAST_INSERT_ID(last_seq + 1)，
+    一条语句完成递增并取回新值；其他数据库使用 SELECT ... FOR UPDATE。
+    计数器行锁随调用者的交易一起提交或回滚。
+    
+    Args:
+        shop_id: 店铺 ID
+        seq_date: 日期（date）
+        
+    Returns:
+        int: 新的流水号
+    """
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql_insert(OrderSequence).values(
+            shop_id=shop_id,
+            seq_date=seq_date,
+            last_seq=db.func.last_insert_id(1),
+            updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_duplicate_key_update(
+            last_seq=db.func.last_insert_id(OrderSequence.last_seq + 1),
+            updated_at=datetime.utcnow()
+        )
+        db.session.execute(stmt)
+        return db.session.execute(db.select(db.func.last_insert_id())).scalar()
     
-    # 检查是否已存在（理论上不应该存在）
-    existing = Order.query.filter_by(order_number=order_number).first()
-    if existing:
-        # 如果存在，递增流水号
-        sequence = str(today_order_count + 2).zfill(5)
-        order_number = f"{order_prefix}{shop_order_code}{date_str}{sequence}"
+    counter = OrderSequence.query.filter_by(
+        shop_id=shop_id, seq_date=seq_date
+    ).with_for_update().first()
+    if counter is None:
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.add(OrderSequence(shop_id=shop_id, seq_date=seq_date, last_seq=1))
+            savepoint.commit()
+            return 1
+        except IntegrityError:
+            # 其他交易已先建立今日计数器
+            savepoint.rollback()
+            counter = OrderSequence.query.filter_by(
+                shop_id=shop_id, seq_date=seq_date
+            ).with_for_update().first()
+    counter.last_seq += 1
+    db.session.flush()
+    return counter.last_seq
+
+
+def get_order_prefix():
+    """获取订单前缀（系统设定的参考数据副本，其他 worker 修改后最多 REFERENCE_DATA_MAX_AGE 秒生效）"""
+    return reference_data.setting('order_prefix', 'ORDER')
+
+
+def get_shop_order_code(shop_id):
+    """获取商店订单ID（快取）"""
+    cache_key = f'shop_order_code_{shop_id}'
+    shop_order_code = cache.get(cache_key)
+    if shop_order_code is None:
+        shop = Shop.query.get(shop_id)
+        if not shop:
+            raise ValueError(f'店铺 ID {shop_id} 不存在')
+        shop_order_code = shop.shop_order_id
+        if not shop_order_code:
+            raise ValueError(f'店铺 {shop_id} 未设置商店订单ID')
+        cache.set(cache_key, shop_order_code, timeout=bounded_timeout(ORDER_NUMBER_CACHE_TIMEOUT))
+    return shop_order_code
+
+
+def clear_order_number_cache(shop_id=None):
+    """
+    清除订单编号相关快取
     
-    return order_number
+    Args:
+        shop_id: 店铺 ID；为 None 时清除订单前缀
+    """
+    if shop_id is None:
+        # 系统设定经 ORM 写入时已自动失效；此处涵盖批次写入
+        invalidate_tags(reference_data.SETTINGS_TAG)
+    else:
+        cache.delete(f'shop_order_code_{shop_id}')
 
 
 def init_default_settings():
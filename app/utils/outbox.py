@@ -0,0 +1,304 @@
+"""
+交易外寄箱（transactional outbox）
+業務資料與待送出的副作用（Socket.IO 事件、稽核日誌、日後的通知）在同一個交易寫入，
+請求只負責 DB 寫入；每個 worker 的背景派送器再把 outbox_event 送出。
+worker 在 commit 後崩潰時，事件仍留在資料表中，由任一 worker 的派送器補送。
+
+Socket.IO 事件在派送時才配發 seq（outbox_sequence 單一行計數器）：外寄箱 id 依 INSERT 順序配發，
+與 commit 順序、各 worker 的派送順序都不同；派送器之間以該行的列鎖互斥，seq 的送出順序即遞增順序，
+客戶端收過 seq N 之後不會再收到更小的新事件，斷線重連時從 N 補送即可。
+"""
+import os
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db, socketio
+from app.models import OutboxEvent, OutboxSequence
+from app.utils.update_logger import get_request_actor, build_update_log
+from app.utils.socketio_queue import publish_batch
+from app.utils.socketio_coalesce import emitter
+
+# 事件類型 -> 處理函數；新的副作用（如推播通知）以 register_handler 註冊
+HANDLERS = {}
+
+# 每次清理刪除的已派送事件數（分批刪除，避免長時間鎖表）
+PRUNE_CHUNK_SIZE = 1000
+
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def register_handler(kind):
+    """
+    註冊外寄箱事件處理函數（handler(payload)，在派送交易內執行）
+
+    payload['event_id'] 為外寄箱事件 id；socketio 事件另有 payload['seq']（派送時配發的序號）
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload):
+    """
+    加入外寄箱事件（只加入 session，由呼叫者的交易一併 commit）
+
+    Args:
+        kind: 事件類型
+        payload: 可序列化為 JSON 的字典
+
+    Returns:
+        OutboxEvent
+    """
+    event = OutboxEvent(kind=kind, payload=json.dumps(payload, ensure_ascii=False))
+    db.session.add(event)
+    return event
+
+
+def emit_event(event, data, rooms):
+    """
+    交易提交後送出 Socket.IO 事件
+
+    Args:
+        event: 事件名稱，如 'new_order'
+        data: 事件內容
+        rooms: 房間名稱或列表，如 ['/shop/1', '/backend']
+    """
+    if isinstance(rooms, str):
+        rooms = [rooms]
+    return enqueue('socketio', {'event': event, 'data': data, 'rooms': list(rooms)})
+
+
+def audit(action, table_name, record_id=None, old_data=None, new_data=None, description=None):
+    """
+    交易提交後寫入更新日誌（參數同 log_update，操作者與時間於請求當下記錄）
+    """
+    user_id, ip_address = get_request_actor()
+    return enqueue('audit', {
+        'action': action,
+        'table_name': table_name,
+        'record_id': record_id,
+        'old_data': old_data,
+        'new_data': new_data,
+        'description': description,
+        'user_id': user_id,
+        'ip_address': ip_address,
+        'created_at': datetime.utcnow().isoformat()
+    })
+
+
+@register_handler('socketio')
+def _dispatch_socketio(payload):
+    # 派送時配發的 seq（依送出順序遞增），客戶端斷線重連時據此補送錯過的事件
+    data = dict(payload['data'], seq=payload['seq'])
+    for room in payload['rooms']:
+        # 設定 SOCKETIO_COALESCE_WINDOW_MS 時，同一房間短時間內的訂單事件合併為 orders_batch
+        emitter.emit(payload['event'], data, room=room)
+
+
+@register_handler('audit')
+def _dispatch_audit(payload):
+    log = build_update_log(
+        payload['action'], payload['table_name'], payload.get('record_id'),
+        payload.get('old_data'), payload.get('new_data'), payload.get('description'),
+        user_id=payload.get('user_id'), ip_address=payload.get('ip_address')
+    )
+    if payload.get('created_at'):
+        log.created_at = datetime.fromisoformat(payload['created_at'])
+    db.session.add(log)
+
+
+def dispatch_pending(batch_size=100, max_attempts=5):
+    """
+    派送一批待送出的外寄箱事件
+
+    有待派送事件時先鎖定 outbox_sequence（多個 worker 的派送器依序執行），
+    再以 FOR UPDATE SKIP LOCKED 取得事件，為 Socket.IO 事件配發遞增的 seq。
+    單筆失敗只記錄錯誤次數，不影響同批其他事件；失敗達 max_attempts 次時記錄錯誤，不再重試。
+    本批的 Socket.IO 事件（含合併視窗暫存的訂單事件）合併成一則訊息發佈到跨 worker 訊息佇列，
+    發佈之後才標記為已派送並 commit：worker 在兩者之間崩潰時事件會再送一次（客戶端依 seq 去重），不會遺失。
+
+    Returns:
+        int: 本批處理的事件數
+    """
+    return _dispatch_batch(batch_size, max_attempts)
+
+
+def _lock_sequence():
+    """
+    鎖定派送序號列並返回最後配發的序號
+
+    以 UPDATE 取得列鎖（SQLite 為資料庫寫入鎖），其他派送器在此等待到本交易 commit / rollback。
+    """
+    locked = db.session.execute(
+        update(OutboxSequence).where(OutboxSequence.id == 1).values(last_seq=OutboxSequence.last_seq)
+    ).rowcount
+    if not locked:
+        # 以 db.create_all() 建立的資料表沒有初始列
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.add(OutboxSequence(id=1, last_seq=0))
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+            db.session.execute(
+                update(OutboxSequence).where(OutboxSequence.id == 1).values(last_seq=OutboxSequence.last_seq)
+            )
+    return db.session.scalar(select(OutboxSequence.last_seq).where(OutboxSequence.id == 1))
+
+
+def _dispatch_batch(batch_size, max_attempts):
+    pending = (
+        OutboxEvent.dispatched_at.is_(None),
+        OutboxEvent.attempts < max_attempts
+    )
+    # 沒有待派送事件時不鎖定序號列（閒置時每次輪詢只有一次讀取）
+    if db.session.query(OutboxEvent.id).filter(*pending).first() is None:
+        db.session.rollback()
+        return 0
+
+    # 以微秒時間作為下限：送出後、commit 前崩潰時計數器會回滾，之後配發的 seq 仍大於已送出的 seq
+    last_seq = max(_lock_sequence(), int(time.time() * 1_000_000))
+    query = OutboxEvent.query.filter(*pending).order_by(OutboxEvent.id).limit(batch_size)
+    if db.engine.dialect.name != 'sqlite':
+        query = query.with_for_update(skip_locked=True)
+    events = query.all()
+    if not events:
+        db.session.rollback()
+        return 0
+
+    dispatched = []
+    with publish_batch():
+        for event in events:
+            handler = HANDLERS.get(event.kind)
+            if event.kind == 'socketio':
+                last_seq += 1
+                event.seq = last_seq
+            savepoint = db.session.begin_nested()
+            try:
+                if handler is None:
+                    raise LookupError(f'未註冊的外寄箱事件類型: {event.kind}')
+                payload = json.loads(event.payload)
+                payload['event_id'] = event.id
+                payload['seq'] = event.seq
+                handler(payload)
+                savepoint.commit()
+                dispatched.append(event)
+            except Exception as e:
+                savepoint.rollback()
+                event.seq = None
+                event.attempts += 1
+                event.last_error = str(e)[:500]
+                if event.attempts >= max_attempts:
+                    current_app.logger.error(
+                        f'外寄箱事件 #{event.id} ({event.kind}) 已失敗 {event.attempts} 次，不再重試: {e}'
+                    )
+                else:
+                    current_app.logger.warning(f'外寄箱事件 #{event.id} 派送失敗: {e}')
+        # 合併視窗暫存的訂單事件在本批內送出，不留到背景計時器（計時器觸發前崩潰會遺失已標記的事件）
+        emitter.flush()
+
+    now = datetime.utcnow()
+    for event in dispatched:
+        event.dispatched_at = now
+    db.session.execute(update(OutboxSequence).where(OutboxSequence.id == 1).values(last_seq=last_seq))
+    db.session.commit()
+    return len(events)
+
+
+def prune_dispatched(retention, max_attempts=None):
+    """
+    刪除派送完成超過 retention 的事件（保留 seq 最大的一筆，作為斷線重連補送判斷缺口的依據）
+
+    Args:
+        retention: timedelta
+        max_attempts: 指定時一併刪除失敗達此次數、建立超過 retention 的事件（失敗當下已記錄錯誤日誌）
+
+    Returns:
+        int: 刪除的事件數
+    """
+    cutoff = datetime.utcnow() - retention
+    deleted = 0
+    if max_attempts is not None:
+        deleted += _delete_in_chunks(
+            OutboxEvent.dispatched_at.is_(None),
+            OutboxEvent.attempts >= max_attempts,
+            OutboxEvent.created_at < cutoff
+        )
+    criteria = [OutboxEvent.dispatched_at.isnot(None), OutboxEvent.dispatched_at < cutoff]
+    newest = db.session.query(db.func.max(OutboxEvent.seq)).scalar()
+    if newest is not None:
+        criteria.append(or_(OutboxEvent.seq.is_(None), OutboxEvent.seq < newest))
+    deleted += _delete_in_chunks(*criteria)
+    return deleted
+
+
+def _delete_in_chunks(*criteria):
+    """依主鍵分批刪除符合條件的事件，每批 commit 一次"""
+    deleted = 0
+    while True:
+        ids = [event_id for event_id, in db.session.query(OutboxEvent.id).filter(
+            *criteria
+        ).order_by(OutboxEvent.id).limit(PRUNE_CHUNK_SIZE)]
+        if not ids:
+            break
+        OutboxEvent.query.filter(OutboxEvent.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < PRUNE_CHUNK_SIZE:
+            break
+    return deleted
+
+
+def _run_dispatcher(app):
+    """背景派送迴圈（eventlet 下為 greenlet，threading 模式下為執行緒）"""
+    interval = app.config['OUTBOX_POLL_INTERVAL']
+    batch_size = app.config['OUTBOX_BATCH_SIZE']
+    max_attempts = app.config['OUTBOX_MAX_ATTEMPTS']
+    retention = timedelta(hours=app.config['OUTBOX_RETENTION_HOURS'])
+    prune_interval = app.config['OUTBOX_PRUNE_INTERVAL']
+    last_prune = 0
+    while True:
+        processed = 0
+        with app.app_context():
+            try:
+                processed = dispatch_pending(batch_size, max_attempts)
+                if time.monotonic() - last_prune >= prune_interval:
+                    last_prune = time.monotonic()
+                    prune_dispatched(retention, max_attempts)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f'外寄箱派送器錯誤: {e}')
+            finally:
+                db.session.remove()
+        # 整批處理滿時立即處理下一批，否則等待下一輪
+        if processed < batch_size:
+            socketio.sleep(interval)
+
+
+def init_outbox(app):
+    """
+    註冊外寄箱派送器
+
+    派送器在每個行程處理第一個請求時啟動（而不是在 create_app 時），
+    確保只在實際服務請求的 worker 內執行，不會在 gunicorn master 或 reloader 父行程內執行。
+    """
+    if not app.config.get('OUTBOX_DISPATCHER_ENABLED', True):
+        return
+
+    @app.before_request
+    def start_outbox_dispatcher():
+        global _dispatcher_pid
+        pid = os.getpid()
+        if _dispatcher_pid == pid:
+            return
+        with _dispatcher_lock:
+            if _dispatcher_pid == pid:
+                return
+            _dispatcher_pid = pid
+        socketio.start_background_task(_run_dispatcher, app)
@@ -0,0 +1,135 @@
+"""
+前台頁面快取（只對未登入的訪客）
+整頁 HTML 渲染一次後壓縮保存（共享快取 + 本行程記憶體），以快取標籤失效：
+店鋪、產品頁沿用 shop:<id> / product:<id> 等既有標籤，最新消息、關於我們、首頁 Banner
+由 after_flush 監聽器在資料寫入時自動登記 news / news:<id> / about / home_banners 標籤。
+session 中有 user_id（已登入）時完全略過快取。
+
+用法：
+    @customer_bp.route('/shop/<int:shop_id>')
+    @page_cache(tags=lambda shop_id: [f'shop:{shop_id}'])
+    def shop(shop_id):
+        ...
+"""
+import hashlib
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import g, request, session, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import cache
+from app.models import News, About, HomeBanner
+from app.utils.cache_tags import tag_generations, bounded_timeout
+from app.utils.conditional import make_etag, not_modified, add_validators
+from app.utils.compression import compress_variants, encoded_response, encoded_etag
+
+# 頁面快取預設存活時間（秒）；正確性靠標籤失效
+PAGE_CACHE_TIMEOUT = 3600
+# 顯示庫存的頁面（店鋪、產品）存活時間（秒）：庫存隨每筆訂單變動，不以標籤失效，
+# 最多顯示這麼久以前的庫存（下單時仍以資料庫庫存為準）
+STOCK_PAGE_TIMEOUT = 60
+# 本行程保存的頁面數上限（超過時清空重來）
+PAGE_LOCAL_MAX_ENTRIES = 512
+
+PageEntry = namedtuple('PageEntry', ['tags', 'generations', 'variants', 'mimetype', 'expires_at'])
+
+# {key: PageEntry}
+_local = {}
+
+
+def _page_key():
+    key = f'page_{request.host}{request.path}'
+    if request.args:
+        args = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+        key += '_' + hashlib.md5(repr(args).encode('utf-8')).hexdigest()
+    return key
+
+
+def _fresh(entry):
+    """項目未過期且所有標籤的世代都沒變時返回項目本身"""
+    if entry is not None and entry.expires_at > time.time() and tag_generations(entry.tags) == entry.generations:
+        return entry
+    return None
+
+
+def _serve(entry):
+    etag = make_etag(entry.tags, entry.generations)
+    response = not_modified(etag)
+    if response is None:
+        response = encoded_response(entry.variants, entry.mimetype)
+        etag = encoded_etag(etag, response)
+    # 同一網址登入後內容不同，只允許瀏覽器保存
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return add_validators(response, etag)
+
+
+def page_cache(tags=None, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    頁面快取裝飾器（只快取未登入訪客的 200 回應）
+
+    Args:
+        tags: 標籤列表，或以視圖參數呼叫、返回標籤列表的函數；計算過程中可用 add_cache_tags 補充
+        timeout: 存活時間（秒；行程內快取時不超過 LOCAL_CACHE_MAX_AGE）
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or session.get('user_id'):
+                return f(*args, **kwargs)
+
+            key = _page_key()
+            entry = _fresh(_local.get(key)) or _fresh(cache.get(key))
+            if entry is not None:
+                _local[key] = entry
+                return _serve(entry)
+
+            static_tags = tags(*args, **kwargs) if callable(tags) else (tags or [])
+            static_tags = sorted(set(static_tags))
+            # 先讀世代再渲染：渲染期間發生的失效會讓這次寫入的項目直接作廢
+            static_generations = tag_generations(static_tags)
+            g._cache_tags = set()
+            try:
+                response = make_response(f(*args, **kwargs))
+                dynamic_tags = sorted(g._cache_tags - set(static_tags))
+            finally:
+                g._cache_tags = None
+
+            # 渲染過程中寫入 session（如 flash 訊息）的頁面不能共用
+            if response.status_code != 200 or response.is_streamed or session.modified:
+                return response
+
+            entry_tags = tuple(static_tags + dynamic_tags)
+            entry_timeout = bounded_timeout(timeout)
+            entry = PageEntry(
+                entry_tags,
+                static_generations + tag_generations(dynamic_tags),
+                compress_variants(response.get_data()),
+                response.mimetype,
+                time.time() + entry_timeout
+            )
+            cache.set(key, entry, timeout=entry_timeout)
+            if len(_local) >= PAGE_LOCAL_MAX_ENTRIES:
+                _local.clear()
+            _local[key] = entry
+            return _serve(entry)
+        return decorated_function
+    return decorator
+
+
+def _page_tags(obj):
+    if isinstance(obj, News):
+        return ['news', f'news:{obj.id}']
+    if isinstance(obj, About):
+        return ['about']
+    if isinstance(obj, HomeBanner):
+        return ['home_banners']
+    return []
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_page_writes(session, flush_context):
+    # after_flush 時新資料已有 ID，new / dirty / deleted 仍是 flush 前的內容
+    tags = {tag for obj in (*session.new, *session.dirty, *session.deleted) for tag in _page_tags(obj)}
+    if tags:
+        session.info.setdefault('cache_tags', set()).update(tags)
@@ -0,0 +1,92 @@
+"""
+游標（keyset）分頁工具
+以 (created_at, id) 為游標，第 N 頁與第 1 頁的成本相同，不使用 OFFSET
+"""
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, record_id):
+    """
+    產生游標字串
+
+    Args:
+        created_at: 最後一筆的建立時間
+        record_id: 最後一筆的 ID
+
+    Returns:
+        str: URL 安全的游標
+    """
+    raw = f'{created_at.isoformat()}|{record_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游標字串
+
+    Args:
+        cursor: encode_cursor() 產生的游標
+
+    Returns:
+        tuple: (created_at, record_id)
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_str, id_str = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_str), int(id_str)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError('游標格式錯誤') from e
+
+
+def keyset_paginate(query, created_column, id_column, cursor=None, per_page=20):
+    """
+    依 (created_at DESC, id DESC) 做游標分頁
+
+    需要 (篩選欄位..., created_at, id) 的複合索引支撐。
+
+    Args:
+        query: 已加上篩選條件的查詢（不要先排序）
+        created_column: 建立時間欄位，如 Order.created_at
+        id_column: 主鍵欄位，如 Order.id
+        cursor: 上一頁返回的 next_cursor；None 或空字串表示第一頁
+        per_page: 每頁數量
+
+    Returns:
+        tuple: (分頁後的查詢（多取一筆用於判斷 has_next）, per_page)
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < record_id)
+        ))
+    return query.order_by(created_column.desc(), id_column.desc()).limit(per_page + 1), per_page
+
+
+def split_page(records, per_page):
+    """
+    切出本頁資料並產生下一頁游標
+
+    Args:
+        records: keyset_paginate() 查詢的結果（最多 per_page + 1 筆）
+        per_page: 每頁數量
+
+    Returns:
+        tuple: (本頁資料, next_cursor 或 None)
+    """
+    has_next = len(records) > per_page
+    records = records[:per_page]
+    next_cursor = None
+    if has_next and records:
+        last = records[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return records, next_cursor
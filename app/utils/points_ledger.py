@@ -0,0 +1,143 @@
+"""
+回馈金帳本
+所有點數異動都在呼叫者的交易中執行（本模組不 commit），
+餘額以原子 UPDATE 調整，避免「讀取 → Python 計算 → 寫回」的遺失更新
+"""
+from datetime import datetime
+from sqlalchemy import case, insert, literal, select, update, Integer, String, DateTime
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models import User, PointTransaction
+
+# 批量入帳時每條語句處理的使用者數
+BULK_CHUNK_SIZE = 500
+
+
+class InsufficientPointsError(ValueError):
+    """回馈金餘額不足"""
+
+    def __init__(self, user_id, delta):
+        self.user_id = user_id
+        self.delta = delta
+        super().__init__('回馈金余额不足')
+
+
+def apply_movements(user_id, movements):
+    """
+    套用同一位使用者的多筆點數異動（例如同一張訂單的 use + earn）
+
+    UPDATE user SET points = points + :delta WHERE id = :id AND points >= :spend
+
+    扣點（負數異動合計）本身必須在原有餘額內，不能以同批的赚取點數抵銷：
+    否則兩筆並行結帳（餘額 10，各自 use -10 + earn +5）都會通過淨額檢查。
+    整批只有一條餘額 UPDATE，交易記錄以 executemany 寫入；
+    每筆記錄的 balance 依 movements 順序累計。
+
+    Args:
+        user_id: 使用者 ID
+        movements: list[dict]，每筆包含 type, points（正數=赚取，負數=使用），
+                   可選 order_id, shop_id, description
+
+    Returns:
+        int: 異動後的餘額
+
+    Raises:
+        InsufficientPointsError: 餘額不足（不會部分扣減）
+        ValueError: 使用者不存在
+    """
+    movements = [m for m in movements if m['points']]
+    if not movements:
+        return db.session.scalar(select(User.points).where(User.id == user_id))
+
+    delta = sum(m['points'] for m in movements)
+    spend = -sum(m['points'] for m in movements if m['points'] < 0)
+    result = db.session.execute(
+        update(User).where(
+            User.id == user_id,
+            User.points >= spend
+        ).values(points=User.points + delta).execution_options(synchronize_session=False)
+    )
+    new_balance = db.session.scalar(select(User.points).where(User.id == user_id))
+    if result.rowcount != 1:
+        if new_balance is None:
+            raise ValueError('用户不存在')
+        raise InsufficientPointsError(user_id, -spend)
+
+    # 同步 session 中已載入的 User，避免後續讀到舊餘額
+    cached = db.session.identity_map.get(db.session.identity_key(User, user_id))
+    if cached is not None:
+        set_committed_value(cached, 'points', new_balance)
+
+    now = datetime.utcnow()
+    balance = new_balance - delta
+    rows = []
+    for movement in movements:
+        balance += movement['points']
+        rows.append({
+            'user_id': user_id,
+            'order_id': movement.get('order_id'),
+            'shop_id': movement.get('shop_id'),
+            'type': movement['type'],
+            'points': movement['points'],
+            'balance': balance,
+            'description': movement.get('description'),
+            'created_at': now
+        })
+    db.session.execute(insert(PointTransaction), rows)
+    return new_balance
+
+
+def credit_users(amounts, transaction_type='earn', shop_id=None, description=None):
+    """
+    批量入帳（例如活動贈點），以集合式語句處理，不逐一載入使用者
+
+    每個分塊兩條語句：
+    UPDATE user SET points = points + CASE id ... END WHERE id IN (...)
+    INSERT INTO point_transactions (...) SELECT ... FROM user WHERE id IN (...)
+
+    Args:
+        amounts: {user_id: points}（點數須為正數）
+        transaction_type: 交易類型
+        shop_id: 關聯店鋪（可選）
+        description: 描述（可選）
+
+    Returns:
+        int: 實際入帳的使用者數
+    """
+    amounts = {uid: pts for uid, pts in amounts.items() if pts > 0}
+    user_ids = list(amounts.keys())
+    now = datetime.utcnow()
+    credited = 0
+
+    for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+        chunk = {uid: amounts[uid] for uid in user_ids[start:start + BULK_CHUNK_SIZE]}
+        points_expr = case(chunk, value=User.id, else_=0)
+        result = db.session.execute(
+            update(User).where(User.id.in_(list(chunk.keys()))).values(
+                points=User.points + points_expr
+            ).execution_options(synchronize_session=False)
+        )
+        credited += result.rowcount
+
+        # 交易記錄的 balance 直接取更新後的 user.points
+        db.session.execute(
+            insert(PointTransaction).from_select(
+                ['user_id', 'shop_id', 'type', 'points', 'balance', 'description', 'created_at'],
+                select(
+                    User.id,
+                    literal(shop_id, Integer),
+                    literal(transaction_type, String(20)),
+                    points_expr,
+                    User.points,
+                    literal(description, String(255)),
+                    literal(now, DateTime)
+                ).where(User.id.in_(list(chunk.keys())))
+            )
+        )
+
+    # 已載入 session 的使用者餘額已過期
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, User) and obj.id in amounts:
+            db.session.expire(obj, ['points'])
+
+    return credited
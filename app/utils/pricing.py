@@ -0,0 +1,285 @@
+"""
+店鋪計價快照
+每個店鋪的產品價格、飲品加價、配料價格與 product_topping 覆寫價格編譯成一份
+常駐行程記憶體的快照，購物車、結帳、各種下單路徑都從這裡計價（純記憶體計算）。
+
+版本戳記存放在 Flask-Caching（CACHE_TYPE 為 redis 等共享後端時跨 worker 生效）；
+產品、配料、店鋪寫入後呼叫 invalidate_pricing(shop_id)，各 worker 下次計價時發現版本不同即重建。
+快取為行程內（CACHE_TYPE=simple）時其他 worker 的失效看不到，改以 shop.menu_version
+（mark_menu_changed 在寫入交易中遞增）作為版本：每次取得快照查詢一次主鍵，價格仍在記憶體中計算。
+"""
+import time
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+from app import db, cache
+from app.models import Shop, Product, Topping, product_topping
+from app.utils.validators import validate_integer
+from app.utils.cache_tags import cache_is_shared
+
+# 快照最長存活時間（秒），作為漏失失效通知時的保險
+PRICING_SNAPSHOT_MAX_AGE = 600
+
+ZERO = Decimal('0')
+
+PricedProduct = namedtuple('PricedProduct', [
+    'id', 'name', 'shop_id', 'is_active', 'base_price', 'cold_price', 'hot_price'
+])
+PricedTopping = namedtuple('PricedTopping', ['id', 'name', 'price', 'is_active'])
+PricedLine = namedtuple('PricedLine', [
+    'product_id', 'product_name', 'quantity', 'base_price',
+    'drink_type', 'drink_price', 'toppings', 'unit_price', 'line_total'
+])
+
+def normalize_id(value):
+    """
+    請求中的 ID 轉為整數（快照以整數為鍵，JSON 傳入的 "1" 與 1 相同）
+
+    無效的值原樣返回，查找時視為不存在（與 Query.get 的行為一致）
+    """
+    is_valid, integer_value, _ = validate_integer(value, 'ID', min_value=1)
+    return integer_value if is_valid else value
+
+
+# {shop_id: PricingSnapshot}
+_snapshots = {}
+# {product_id: shop_id}，購物車模式依產品找店鋪用
+_product_shops = {}
+
+
+class PricingError(ValueError):
+    """計價錯誤（產品、配料或飲品選項無效）"""
+
+
+class PricingSnapshot:
+    """單一店鋪的計價快照（建立後唯讀）"""
+
+    __slots__ = (
+        'shop_id', 'version', 'built_at', 'status', 'owner_id', 'points_rate',
+        'qrcode_enabled', 'max_toppings', 'products', 'toppings', 'overrides'
+    )
+
+    def __init__(self, shop, version, products, toppings, overrides):
+        self.shop_id = shop.id
+        self.version = version
+        self.built_at = time.monotonic()
+        self.status = shop.status
+        self.owner_id = shop.owner_id
+        self.points_rate = shop.points_rate or 30
+        self.qrcode_enabled = shop.qrcode_enabled
+        self.max_toppings = shop.max_toppings_per_order
+        self.products = products
+        self.toppings = toppings
+        self.overrides = overrides
+
+    @property
+    def is_active(self):
+        return self.status == 'active'
+
+    def price_line(self, product_id, topping_ids, drink_type=None, quantity=1, strict=True):
+        """
+        計算一個訂單行
+
+        單價 = 產品價（有折扣用折扣價）+ 飲品加價 + 各配料價格（有 product_topping 覆寫時用覆寫價）
+        行總價 = 單價 × 數量
+
+        Args:
+            product_id: 產品ID
+            topping_ids: 配料ID列表
+            drink_type: 'cold' / 'hot' / None
+            quantity: 數量
+            strict: True 時無效配料或飲品選項拋出 PricingError；False 時略過
+
+        Returns:
+            PricedLine
+
+        Raises:
+            PricingError: 產品不存在、不屬於此店鋪、已下架，或（strict 時）配料、飲品無效
+        """
+        product = self.products.get(product_id)
+        if product is None:
+            raise PricingError(f'產品 {product_id} 不屬於此店鋪或不存在')
+        if not product.is_active:
+            raise PricingError(f'產品 {product.name} 已下架')
+
+        drink_price = ZERO
+        if drink_type:
+            option_price = product.cold_price if drink_type == 'cold' else (
+                product.hot_price if drink_type == 'hot' else None
+            )
+            if option_price is None:
+                if strict:
+                    raise PricingError(f'產品 {product.name} 不提供此飲品選項')
+                drink_type = None
+            else:
+                drink_price = option_price
+
+        toppings = []
+        for topping_id in topping_ids:
+            topping = self.toppings.get(topping_id)
+            if topping is None or not topping.is_active:
+                if strict:
+                    raise PricingError(f'Topping ID {topping_id} 无效')
+                continue
+            price = self.overrides.get((product_id, topping_id), topping.price)
+            toppings.append((topping_id, price))
+
+        unit_price = product.base_price + drink_price + sum((price for _, price in toppings), ZERO)
+        return PricedLine(
+            product_id=product_id,
+            product_name=product.name,
+            quantity=quantity,
+            base_price=product.base_price,
+            drink_type=drink_type,
+            drink_price=drink_price,
+            toppings=tuple(toppings),
+            unit_price=unit_price,
+            line_total=unit_price * quantity
+        )
+
+
+def _version_key(shop_id):
+    return f'pricing_version_{shop_id}'
+
+
+def _current_version(shop_id):
+    """
+    讀取版本戳記：共享快取中的版本（不存在時建立一個）；行程內快取時為資料庫中的 shop.menu_version
+
+    Returns:
+        版本值，或 None（行程內快取時店鋪不存在或已刪除）
+    """
+    if not cache_is_shared():
+        return db.session.scalar(
+            db.select(Shop.menu_version).where(Shop.id == shop_id, Shop.deleted_at.is_(None))
+        )
+    key = _version_key(shop_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=0)
+        version = cache.get(key)
+    return version
+
+
+def _build_snapshot(shop_id, version):
+    """從資料庫編譯店鋪快照（4 次查詢）"""
+    shop = db.session.get(Shop, shop_id)
+    if shop is None or shop.deleted_at is not None:
+        return None
+
+    products = {}
+    rows = db.session.query(
+        Product.id, Product.name, Product.is_active, Product.unit_price, Product.discounted_price,
+        Product.has_cold_drink, Product.cold_drink_price, Product.has_hot_drink, Product.hot_drink_price
+    ).filter(Product.shop_id == shop_id, Product.deleted_at.is_(None)).all()
+    for row in rows:
+        base_price = row.discounted_price if row.discounted_price and row.discounted_price > 0 else row.unit_price
+        products[row.id] = PricedProduct(
+            id=row.id,
+            name=row.name,
+            shop_id=shop_id,
+            is_active=row.is_active,
+            base_price=Decimal(base_price),
+            cold_price=Decimal(row.cold_drink_price or 0) if row.has_cold_drink else None,
+            hot_price=Decimal(row.hot_drink_price or 0) if row.has_hot_drink else None
+        )
+
+    toppings = {
+        row.id: PricedTopping(row.id, row.name, Decimal(row.price or 0), row.is_active)
+        for row in db.session.query(
+            Topping.id, Topping.name, Topping.price, Topping.is_active
+        ).filter(Topping.shop_id == shop_id).all()
+    }
+
+    overrides = {}
+    if products:
+        override_rows = db.session.query(
+            product_topping.c.product_id, product_topping.c.topping_id, product_topping.c.price
+        ).join(Product, Product.id == product_topping.c.product_id).filter(
+            Product.shop_id == shop_id
+        ).all()
+        overrides = {(row.product_id, row.topping_id): Decimal(row.price) for row in override_rows}
+
+    for product_id in products:
+        _product_shops[product_id] = shop_id
+    return PricingSnapshot(shop, version, products, toppings, overrides)
+
+
+def get_pricing(shop_id):
+    """
+    取得店鋪計價快照（版本未變時直接使用記憶體中的快照）
+
+    Args:
+        shop_id: 店鋪ID
+
+    Returns:
+        PricingSnapshot 或 None（店鋪不存在或已刪除）
+    """
+    version = _current_version(shop_id)
+    snapshot = _snapshots.get(shop_id)
+    if (snapshot is not None and snapshot.version == version
+            and time.monotonic() - snapshot.built_at < PRICING_SNAPSHOT_MAX_AGE):
+        return snapshot
+
+    if snapshot is not None:
+        # 產品可能已移到其他店鋪，重建前先清掉舊的產品→店鋪對應
+        for product_id in snapshot.products:
+            _product_shops.pop(product_id, None)
+    snapshot = _build_snapshot(shop_id, version) if version is not None else None
+    if snapshot is None:
+        _snapshots.pop(shop_id, None)
+    else:
+        _snapshots[shop_id] = snapshot
+    return snapshot
+
+
+def resolve_product_shops(product_ids):
+    """
+    查出產品所屬店鋪（購物車模式依店鋪分組用；已建過快照的產品不查資料庫）
+
+    記憶體中的對應先以該店鋪目前版本的快照確認（其他 worker 把產品移到別的店鋪後，
+    版本不同會重建快照並清掉舊對應），快照中沒有的產品改查資料庫。
+
+    Args:
+        product_ids: 產品ID列表
+
+    Returns:
+        dict: {product_id: shop_id}（不存在或已刪除的產品不在結果中）
+    """
+    result = {}
+    missing = []
+    current = {}
+    for product_id in product_ids:
+        shop_id = _product_shops.get(product_id)
+        if shop_id is not None and shop_id not in current:
+            current[shop_id] = get_pricing(shop_id)
+        snapshot = current.get(shop_id)
+        if snapshot is not None and product_id in snapshot.products:
+            result[product_id] = shop_id
+        else:
+            missing.append(product_id)
+
+    if missing:
+        rows = db.session.query(Product.id, Product.shop_id).filter(
+            Product.id.in_(missing), Product.deleted_at.is_(None)
+        ).all()
+        for row in rows:
+            result[row.id] = row.shop_id
+    return result
+
+
+def invalidate_pricing(*shop_ids):
+    """
+    使店鋪計價快照失效（產品、配料、店鋪寫入 commit 後呼叫）
+
+    Args:
+        shop_ids: 一個或多個店鋪ID
+    """
+    for shop_id in shop_ids:
+        if shop_id is None:
+            continue
+        cache.set(_version_key(shop_id), uuid.uuid4().hex, timeout=0)
+        snapshot = _snapshots.pop(shop_id, None)
+        if snapshot is not None:
+            for product_id in snapshot.products:
+                _product_shops.pop(product_id, None)
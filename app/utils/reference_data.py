@@ -0,0 +1,190 @@
+"""
+參考資料快取（分類、支付方式、系統設定）
+這些資料很少變動，卻在店鋪頁、產品編輯頁、訪客點餐與每筆訂單中反覆查詢。
+每個 worker 在記憶體中保存一份唯讀副本（namedtuple，不綁定 session），
+以快取標籤的世代作為跨 worker 共享的版本號：任何 worker commit 了相關寫入，
+其他 worker 下次讀取時發現世代不同即重新載入。熱路徑上不查詢資料庫。
+副本最長保存 REFERENCE_DATA_MAX_AGE 秒，作為快取為行程內（CACHE_TYPE=simple）
+或漏失失效通知時的保險。
+
+寫入不需要手動失效：before_flush 監聽器偵測到 Category / PaymentMethod /
+ShopPaymentMethod / SystemSetting 的新增、修改、刪除時，自動登記 commit 後遞增世代。
+以 Query.delete() / update() 批次寫入時不會觸發，需自行呼叫 cache_tags.invalidate_on_commit()。
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Category, PaymentMethod, ShopPaymentMethod, SystemSetting
+from app.utils.cache_tags import tag_generations
+
+CATEGORIES_TAG = 'categories'
+PAYMENT_METHODS_TAG = 'payment_methods'
+SETTINGS_TAG = 'settings'
+
+# 副本最長存活時間（秒），作為漏失失效通知時的保險
+REFERENCE_DATA_MAX_AGE = 60
+
+CategoryRef = namedtuple('CategoryRef', ['id', 'name', 'description'])
+PaymentMethodRef = namedtuple('PaymentMethodRef', ['id', 'name', 'code', 'icon', 'is_active', 'display_order'])
+
+_MODEL_TAGS = {
+    Category: CATEGORIES_TAG,
+    PaymentMethod: PAYMENT_METHODS_TAG,
+    ShopPaymentMethod: PAYMENT_METHODS_TAG,
+    SystemSetting: SETTINGS_TAG,
+}
+
+# {tag: (generation, loaded_at, data)}
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _cached(tag, loader):
+    """
+    取得本行程的副本（世代不同或超過 REFERENCE_DATA_MAX_AGE 時重新載入；
+    先讀世代再載入，載入期間的寫入會在下次讀取時生效）
+    """
+    generation = tag_generations([tag])[0]
+    entry = _loaded.get(tag)
+    if _is_fresh(entry, generation):
+        return entry[2]
+    with _lock:
+        entry = _loaded.get(tag)
+        if not _is_fresh(entry, generation):
+            loaded_at = time.monotonic()
+            entry = (generation, loaded_at, loader())
+            _loaded[tag] = entry
+    return entry[2]
+
+
+def _is_fresh(entry, generation):
+    return (entry is not None and entry[0] == generation
+            and time.monotonic() - entry[1] < REFERENCE_DATA_MAX_AGE)
+
+
+def _load_categories():
+    rows = db.session.query(Category.id, Category.name, Category.description).order_by(Category.id).all()
+    items = tuple(CategoryRef(row.id, row.name, row.description) for row in rows)
+    return items, {item.id: item for item in items}
+
+
+def _load_payment_methods():
+    rows = db.session.query(
+        PaymentMethod.id, PaymentMethod.name, PaymentMethod.code, PaymentMethod.icon,
+        PaymentMethod.is_active, PaymentMethod.display_order
+    ).order_by(PaymentMethod.display_order, PaymentMethod.id).all()
+    methods = tuple(PaymentMethodRef(*row) for row in rows)
+
+    enabled = {}
+    for shop_id, method_id in db.session.query(
+        ShopPaymentMethod.shop_id, ShopPaymentMethod.payment_method_id
+    ).filter(ShopPaymentMethod.is_enabled == True).all():
+        enabled.setdefault(shop_id, set()).add(method_id)
+    return methods, {shop_id: frozenset(ids) for shop_id, ids in enabled.items()}
+
+
+def _convert_setting(setting_type, value):
+    """依設定類型轉換值；無法轉換時返回 None"""
+    if value is None:
+        return None
+    if setting_type == 'boolean':
+        return value.lower() in ['true', '1', 'yes']
+    if setting_type == 'number':
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            return None
+    if setting_type == 'json':
+        try:
+            return json.loads(value)
+        except (ValueError, TypeError):
+            return None
+    return value
+
+
+def _load_settings():
+    rows = db.session.query(
+        SystemSetting.setting_key, SystemSetting.setting_type, SystemSetting.setting_value
+    ).all()
+    return {row.setting_key: _convert_setting(row.setting_type, row.setting_value) for row in rows}
+
+
+def categories():
+    """
+    所有分類（依 ID 排序）
+
+    Returns:
+        tuple: CategoryRef(id, name, description)
+    """
+    return _cached(CATEGORIES_TAG, _load_categories)[0]
+
+
+def get_category(category_id):
+    """
+    依 ID 取得分類
+
+    Returns:
+        CategoryRef 或 None
+    """
+    return _cached(CATEGORIES_TAG, _load_categories)[1].get(category_id)
+
+
+def payment_methods(active_only=True):
+    """
+    系統支付方式（依 display_order 排序）
+
+    Args:
+        active_only: 只返回啟用中的支付方式
+
+    Returns:
+        tuple: PaymentMethodRef
+    """
+    methods = _cached(PAYMENT_METHODS_TAG, _load_payment_methods)[0]
+    if active_only:
+        return tuple(pm for pm in methods if pm.is_active)
+    return methods
+
+
+def shop_payment_methods(shop_id, fallback=False):
+    """
+    店鋪啟用中的支付方式（依 display_order 排序）
+
+    Args:
+        shop_id: 店鋪ID
+        fallback: 店鋪未設定任何支付方式時，是否返回所有啟用中的支付方式
+
+    Returns:
+        tuple: PaymentMethodRef
+    """
+    methods, enabled = _cached(PAYMENT_METHODS_TAG, _load_payment_methods)
+    enabled_ids = enabled.get(shop_id)
+    if not enabled_ids:
+        return tuple(pm for pm in methods if pm.is_active) if fallback else ()
+    return tuple(pm for pm in methods if pm.is_active and pm.id in enabled_ids)
+
+
+def setting(key, default=None):
+    """
+    取得系統設定值（已依 setting_type 轉換）
+
+    Args:
+        key: 設定鍵
+        default: 設定不存在或無法轉換時的預設值
+    """
+    value = _cached(SETTINGS_TAG, _load_settings).get(key)
+    return default if value is None else value
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_reference_writes(session, flush_context, instances):
+    tags = {
+        _MODEL_TAGS[type(obj)]
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if type(obj) in _MODEL_TAGS
+    }
+    if tags:
+        session.info.setdefault('cache_tags', set()).update(tags)
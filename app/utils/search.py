@@ -0,0 +1,406 @@
+"""
+站內搜尋（行程內倒排索引）
+店鋪名稱、產品名稱與描述以二元組（bigram）切詞，中文不需要斷詞詞典；英數字以整個單字為詞。
+每個 worker 在處理第一個請求時於背景建立索引，之後依 'products' / 'shops' 快取標籤的世代
+判斷是否有寫入，只重新索引 updated_at 在水位線之後的產品與店鋪（增量更新）。
+快取為行程內（CACHE_TYPE=simple）時其他 worker 的寫入不會改變本行程看到的世代，
+因此距上次更新超過 SEARCH_REFRESH_INTERVAL 秒時也會做一次增量更新。
+查詢完全在記憶體中完成，不使用 LIKE '%...%' 掃描。
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from datetime import timedelta
+from operator import itemgetter
+from app import db, socketio
+from app.models import Shop, Product
+from app.utils.cache_tags import tag_generations
+
+# 增量更新時往回多看的時間，涵蓋水位線之前開始、之後才 commit 的交易
+DELTA_OVERLAP = timedelta(minutes=2)
+# 標籤世代未變時，最長多久做一次增量更新（秒），涵蓋其他 worker 的寫入與漏失的失效通知
+SEARCH_REFRESH_INTERVAL = 60
+# 各欄位的權重
+NAME_WEIGHT = 3.0
+SHOP_NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 1.0
+# 店鋪結果的加權（店名完全相符時排在產品之前）
+SHOP_BOOST = 1.5
+DESCRIPTION_PREVIEW_LENGTH = 80
+# 先取 limit × RERANK_FACTOR 筆候選再做片語加權
+RERANK_FACTOR = 4
+# 每個行程保留的查詢結果數（索引異動時清空），熱門查詢直接命中
+RESULT_CACHE_SIZE = 1024
+
+_CJK_RUN = r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+'
+_TOKEN_RE = re.compile(f'({_CJK_RUN})|([0-9a-z]+)')
+
+SearchDocument = namedtuple('SearchDocument', [
+    'kind', 'id', 'name', 'shop_id', 'shop_name', 'unit_price', 'discounted_price', 'description'
+])
+
+
+def doc_key(kind, record_id):
+    """文件鍵：產品為正數 ID、店鋪為負數 ID（整數鍵比 tuple 省記憶體）"""
+    return record_id if kind == 'product' else -record_id
+
+
+def normalize(text):
+    """全形轉半形、轉小寫"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text, unigrams=False):
+    """
+    切詞：中日韓文字取相鄰兩字（單一字元的片段保留單字），英數字取整個單字
+
+    Args:
+        text: 文字
+        unigrams: 是否另外輸出中文單字（建索引時使用，讓單字查詢也能命中）
+
+    Returns:
+        list: 詞列表（可能重複）
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(normalize(text)):
+        if word:
+            tokens.append(word)
+            continue
+        if len(cjk) == 1:
+            tokens.append(cjk)
+            continue
+        tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        if unigrams:
+            tokens.extend(cjk)
+    return tokens
+
+
+class SearchIndex:
+    """倒排索引：詞 -> {文件鍵: 權重}"""
+
+    def __init__(self):
+        self.documents = {}   # {doc_key: SearchDocument}
+        self.postings = {}    # {token: {doc_key: weight}}
+        self._doc_tokens = {}  # {doc_key: tokens}，移除文件時使用
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, document, fields):
+        """
+        加入或更新一份文件
+
+        Args:
+            document: SearchDocument
+            fields: [(文字, 權重), ...]
+        """
+        key = doc_key(document.kind, document.id)
+        self.remove(key)
+        weights = {}
+        for text, weight in fields:
+            for token in tokenize(text, unigrams=True):
+                if len(token) == 1 and not token.isascii():
+                    # 中文單字權重較低，避免壓過相鄰兩字的命中
+                    weights[token] = weights.get(token, 0) + weight * 0.5
+                else:
+                    weights[token] = weights.get(token, 0) + weight
+        for token, weight in weights.items():
+            self.postings.setdefault(token, {})[key] = weight
+        self.documents[key] = document
+        self._doc_tokens[key] = tuple(weights)
+
+    def remove(self, key):
+        tokens = self._doc_tokens.pop(key, None)
+        if tokens is None:
+            return
+        self.documents.pop(key, None)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self.postings[token]
+
+    def search(self, query, limit=20, kind=None):
+        """
+        查詢（所有詞都要命中），依 TF-IDF 權重排序
+
+        Returns:
+            list: [(score, SearchDocument), ...]
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        posting_lists = []
+        for token in tokens:
+            posting = self.postings.get(token)
+            if not posting:
+                return []
+            posting_lists.append(posting)
+
+        # 從最短的列表開始取交集
+        posting_lists.sort(key=len)
+        total = len(self.documents) or 1
+        idf = [math.log(1 + total / len(posting)) for posting in posting_lists]
+        phrase = normalize(query).strip()
+
+        first, rest = posting_lists[0], posting_lists[1:]
+        if kind is None:
+            candidates = first.items()
+        else:
+            candidates = ((key, weight) for key, weight in first.items() if (key > 0) == (kind == 'product'))
+
+        if not rest:
+            # 單一詞：分數與權重成正比，直接在 C 層取前幾名
+            top = [(weight * idf[0], key) for key, weight in
+                   heapq.nlargest(limit * RERANK_FACTOR, candidates, key=itemgetter(1))]
+        else:
+            scored = []
+            for key, weight in candidates:
+                score = weight * idf[0]
+                for i, posting in enumerate(rest, start=1):
+                    w = posting.get(key)
+                    if w is None:
+                        break
+                    score += w * idf[i]
+                else:
+                    scored.append((score, key))
+            top = heapq.nlargest(limit * RERANK_FACTOR, scored)
+
+        # 只對前幾名做片語與店鋪加權，避免對每個候選都正規化名稱
+        reranked = []
+        for score, key in top:
+            document = self.documents[key]
+            if phrase and phrase in normalize(document.name):
+                score *= 2
+            if key < 0:
+                score *= SHOP_BOOST
+            reranked.append((score, key))
+        return [(score, self.documents[key]) for score, key in heapq.nlargest(limit, reranked)]
+
+
+def _product_document(row, shop_names):
+    description = (row.description or '')[:DESCRIPTION_PREVIEW_LENGTH]
+    document = SearchDocument(
+        kind='product',
+        id=row.id,
+        name=row.name,
+        shop_id=row.shop_id,
+        shop_name=shop_names.get(row.shop_id),
+        unit_price=float(row.unit_price),
+        discounted_price=float(row.discounted_price) if row.discounted_price else None,
+        description=description
+    )
+    fields = [
+        (row.name, NAME_WEIGHT),
+        (row.description or '', DESCRIPTION_WEIGHT),
+        (shop_names.get(row.shop_id) or '', SHOP_NAME_WEIGHT)
+    ]
+    return document, fields
+
+
+def _shop_document(row):
+    document = SearchDocument(
+        kind='shop',
+        id=row.id,
+        name=row.name,
+        shop_id=row.id,
+        shop_name=row.name,
+        unit_price=None,
+        discounted_price=None,
+        description=(row.description or '')[:DESCRIPTION_PREVIEW_LENGTH]
+    )
+    fields = [(row.name, NAME_WEIGHT), (row.description or '', DESCRIPTION_WEIGHT)]
+    return document, fields
+
+
+_PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.shop_id, Product.unit_price,
+    Product.discounted_price, Product.is_active, Product.deleted_at, Product.updated_at
+)
+_SHOP_COLUMNS = (Shop.id, Shop.name, Shop.description, Shop.status, Shop.deleted_at, Shop.updated_at)
+
+
+def _is_listed_shop(row):
+    return row.status == 'active' and row.deleted_at is None
+
+
+class _SearchState:
+    """每個行程一份：索引、水位線與已套用的標籤世代"""
+
+    def __init__(self):
+        self.index = None
+        self.watermark = None
+        self.generations = None
+        self.refreshed_at = 0.0
+        self.shop_names = {}
+        self.listed_shops = set()
+        self.results = {}
+        self.lock = threading.Lock()
+
+
+_state = _SearchState()
+_builder_pid = None
+_builder_lock = threading.Lock()
+
+
+def _index_products(index, rows):
+    for row in rows:
+        key = doc_key('product', row.id)
+        if row.is_active and row.deleted_at is None and row.shop_id in _state.listed_shops:
+            index.add(*_product_document(row, _state.shop_names))
+        else:
+            index.remove(key)
+
+
+def _rebuild():
+    """完整建立索引（worker 啟動時執行一次）"""
+    generations = tag_generations(['products', 'shops'])
+    index = SearchIndex()
+    watermark = None
+
+    shops = db.session.query(*_SHOP_COLUMNS).all()
+    _state.shop_names = {row.id: row.name for row in shops}
+    _state.listed_shops = {row.id for row in shops if _is_listed_shop(row)}
+    for row in shops:
+        if row.id in _state.listed_shops:
+            index.add(*_shop_document(row))
+        watermark = max(watermark, row.updated_at) if watermark else row.updated_at
+
+    # 分批讀取，避免一次載入全部 ORM 物件
+    last_id = 0
+    while True:
+        rows = db.session.query(*_PRODUCT_COLUMNS).filter(
+            Product.id > last_id,
+            Product.deleted_at.is_(None),
+            Product.is_active == True
+        ).order_by(Product.id).limit(5000).all()
+        if not rows:
+            break
+        _index_products(index, rows)
+        last_id = rows[-1].id
+        batch_max = max(row.updated_at for row in rows)
+        watermark = max(watermark, batch_max) if watermark else batch_max
+
+    _state.index = index
+    _state.watermark = watermark
+    _state.generations = generations
+    _state.refreshed_at = time.monotonic()
+    _state.results = {}
+
+
+def _refresh():
+    """增量更新：只重新索引水位線之後異動的店鋪與產品"""
+    generations = tag_generations(['products', 'shops'])
+    since = _state.watermark - DELTA_OVERLAP if _state.watermark else None
+    index = _state.index
+
+    shop_query = db.session.query(*_SHOP_COLUMNS)
+    if since is not None:
+        shop_query = shop_query.filter(Shop.updated_at >= since)
+    changed_shops = shop_query.all()
+    renamed_or_toggled = set()
+    for row in changed_shops:
+        listed = _is_listed_shop(row)
+        if _state.shop_names.get(row.id) != row.name or (row.id in _state.listed_shops) != listed:
+            renamed_or_toggled.add(row.id)
+        _state.shop_names[row.id] = row.name
+        if listed:
+            _state.listed_shops.add(row.id)
+            index.add(*_shop_document(row))
+        else:
+            _state.listed_shops.discard(row.id)
+            index.remove(doc_key('shop', row.id))
+        _state.watermark = max(_state.watermark, row.updated_at) if _state.watermark else row.updated_at
+
+    product_query = db.session.query(*_PRODUCT_COLUMNS)
+    if since is not None:
+        product_query = product_query.filter(Product.updated_at >= since)
+    rows = product_query.all()
+    if renamed_or_toggled:
+        # 店名或上下架變更時，該店所有產品的文件都要更新
+        rows += db.session.query(*_PRODUCT_COLUMNS).filter(Product.shop_id.in_(renamed_or_toggled)).all()
+    _index_products(index, rows)
+    for row in rows:
+        _state.watermark = max(_state.watermark, row.updated_at) if _state.watermark else row.updated_at
+
+    _state.generations = generations
+    _state.refreshed_at = time.monotonic()
+    _state.results = {}
+
+
+def _is_current():
+    return (tag_generations(['products', 'shops']) == _state.generations
+            and time.monotonic() - _state.refreshed_at < SEARCH_REFRESH_INTERVAL)
+
+
+def get_index():
+    """
+    取得最新的索引（必要時建立或增量更新）
+
+    Returns:
+        SearchIndex
+    """
+    if _state.index is not None and _is_current():
+        return _state.index
+    with _state.lock:
+        if _state.index is None:
+            _rebuild()
+        elif not _is_current():
+            _refresh()
+    return _state.index
+
+
+def search(query, limit=20, kind=None):
+    """
+    搜尋店鋪與產品
+
+    Args:
+        query: 查詢字串
+        limit: 最多返回筆數
+        kind: 'product' / 'shop' / None（全部）
+
+    Returns:
+        list: [(score, SearchDocument), ...]
+    """
+    if not query or not query.strip():
+        return []
+    index = get_index()
+    key = (normalize(query).strip(), limit, kind)
+    results = _state.results.get(key)
+    if results is None:
+        results = index.search(query, limit=limit, kind=kind)
+        if len(_state.results) >= RESULT_CACHE_SIZE:
+            _state.results = {}
+        _state.results[key] = results
+    return results
+
+
+def _build_in_background(app):
+    with app.app_context():
+        try:
+            get_index()
+        except Exception as e:
+            app.logger.error(f'建立搜尋索引失敗: {e}')
+        finally:
+            db.session.remove()
+
+
+def init_search(app):
+    """每個 worker 處理第一個請求時於背景建立搜尋索引（不在 gunicorn master 內建立）"""
+    @app.before_request
+    def start_search_index_build():
+        global _builder_pid
+        pid = os.getpid()
+        if _builder_pid == pid:
+            return
+        with _builder_lock:
+            if _builder_pid == pid:
+                return
+            _builder_pid = pid
+        socketio.start_background_task(_build_in_background, app)
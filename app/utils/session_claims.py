@@ -0,0 +1,108 @@
+"""
+Session 中的頻道成員資格（角色、啟用狀態、擁有的店鋪 ID）
+登入時計算一次存入簽章 session，Socket.IO connect 直接依 session 加入頻道，不查詢資料庫；
+部署後大量客戶端同時重連也不會打到 MySQL。
+
+資料以 user_rooms:<user_id> 快取標籤失效：before_flush 監聽器偵測到店鋪新增、刪除、
+owner_id 變更，或使用者的角色、啟用狀態變更時自動登記，commit 後寫入新的世代。
+其他 worker 無法改寫使用者的 cookie，因此每個已登入的 HTTP 請求比對一次標籤世代
+（一次快取讀取），發現 session 中的資料早於最後一次失效時重新載入。
+快取為行程內（CACHE_TYPE=simple）時其他 worker 的失效看不到，session 中的資料超過
+LOCAL_CLAIMS_MAX_AGE 秒即視為過期，重新從資料庫驗證（降級、停用、移除店鋪最多延遲這段時間）。
+以 Query.update() / delete() 批次修改 owner_id、role、is_active 時不會觸發，需自行呼叫
+cache_tags.invalidate_on_commit(rooms_tag(user_id))。
+"""
+from flask import session, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models import User, Shop
+from app.utils.cache_tags import cache_is_shared, generation_now, tags_changed_since
+
+SESSION_KEY = 'socket_claims'
+# 快取不是共享後端時，session 中的資料最長有效時間（秒）
+LOCAL_CLAIMS_MAX_AGE = 60
+
+
+def rooms_tag(user_id):
+    return f'user_rooms:{user_id}'
+
+
+def load_claims(user_id):
+    """
+    從資料庫計算使用者的頻道成員資格
+
+    Returns:
+        dict: {'role', 'active', 'shop_ids', 'issued_at'}；使用者不存在時 active 為 False
+    """
+    # 先取時間再查詢：查詢之後才 commit 的變更，其失效世代一定晚於 issued_at
+    issued_at = generation_now()
+    row = db.session.query(User.role, User.is_active).filter(User.id == user_id).first()
+    if row is None:
+        return {'role': None, 'active': False, 'shop_ids': [], 'issued_at': issued_at}
+    shop_ids = []
+    if row.role == 'store_admin':
+        shop_ids = [shop_id for shop_id, in db.session.query(Shop.id).filter(Shop.owner_id == user_id).order_by(Shop.id)]
+    return {'role': row.role, 'active': bool(row.is_active), 'shop_ids': shop_ids, 'issued_at': issued_at}
+
+
+def store_claims(user_id):
+    """登入時呼叫：計算並存入 session"""
+    claims = load_claims(user_id)
+    session[SESSION_KEY] = claims
+    return claims
+
+
+def current_claims():
+    """
+    session 中仍有效的頻道成員資格（不查詢資料庫）
+
+    Returns:
+        dict 或 None（未登入、session 中沒有、已被失效，或行程內快取時已超過 LOCAL_CLAIMS_MAX_AGE）
+    """
+    user_id = session.get('user_id')
+    claims = session.get(SESSION_KEY)
+    if not user_id or not claims:
+        return None
+    if not cache_is_shared() and generation_now() - claims['issued_at'] > LOCAL_CLAIMS_MAX_AGE * 1_000_000:
+        return None
+    if tags_changed_since([rooms_tag(user_id)], claims['issued_at']):
+        return None
+    return claims
+
+
+def init_session_claims(app):
+    """已登入的請求中發現 session 資料已失效時重新載入（未登入與靜態文件請求不讀取 session）"""
+
+    @app.before_request
+    def refresh_session_claims():
+        if request.endpoint == 'static' or 'user_id' not in session:
+            return
+        if current_claims() is None:
+            store_claims(session['user_id'])
+
+
+def _changed(obj, *attributes):
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_membership_writes(session, flush_context, instances):
+    user_ids = set()
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, Shop):
+            user_ids.add(obj.owner_id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Shop) and _changed(obj, 'owner_id'):
+            history = inspect(obj).attrs.owner_id.history
+            user_ids.update(history.added)
+            user_ids.update(history.deleted)
+        elif isinstance(obj, User) and _changed(obj, 'role', 'is_active'):
+            user_ids.add(obj.id)
+    tags = {rooms_tag(user_id) for user_id in user_ids if user_id}
+    if tags:
+        session.info.setdefault('cache_tags', set()).update(tags)
@@ -0,0 +1,118 @@
+"""
+Socket.IO 訂單事件合併送出（尖峰時段減少每個客戶端的封包數）
+設定 SOCKETIO_COALESCE_WINDOW_MS（建議 50–200）後，同一個房間在視窗內的 new_order / order_updated /
+orders_updated 合併成一則 orders_batch：
+
+    {
+        'events': [{'event': 'new_order', 'data': {...}}, ...],    # 依原本的送出順序
+        'orders': [{'order_id': 12, 'status': 'process'}, ...],   # 每筆訂單在本批中的最新狀態
+        'seq': 42                                                 # 本批最大的 seq（斷線重連補送用）
+    }
+
+視窗內只有一個事件時照原本的事件名稱送出。其他事件送到同一個房間前，會先送出該房間暫存的訂單事件，
+維持送出順序。未設定（0）時直接送出，行為與 socketio.emit 相同。
+外寄箱派送器在每批結束、標記事件為已派送之前呼叫 flush()，暫存的事件不會只留在記憶體中。
+"""
+import threading
+from app import socketio
+from app.utils.socketio_queue import publish_batch
+
+# 會合併的訂單事件
+COALESCED_EVENTS = ('new_order', 'order_updated', 'orders_updated')
+BATCH_EVENT = 'orders_batch'
+
+
+def _order_statuses(event, data):
+    """事件中的 (order_id, status)"""
+    if event == 'new_order':
+        return [(data.get('order_id'), data.get('status', 'pending'))]
+    if event == 'order_updated':
+        return [(data.get('order_id'), data.get('status'))]
+    return [(order.get('order_id'), order.get('status', data.get('status')))
+            for order in data.get('orders', [])]
+
+
+def build_batch(items):
+    """
+    將同一個房間的多個事件合併成 orders_batch 的內容
+
+    Args:
+        items: [(event, data), ...]，依送出順序
+    """
+    latest = {}
+    seq = None
+    for event, data in items:
+        for order_id, status in _order_statuses(event, data):
+            if order_id is not None:
+                # 先刪除再寫入，讓 orders 依各訂單最後一次變更的順序排列
+                latest.pop(order_id, None)
+                latest[order_id] = status
+        if data.get('seq') is not None:
+            seq = data['seq'] if seq is None else max(seq, data['seq'])
+    batch = {
+        'events': [{'event': event, 'data': data} for event, data in items],
+        'orders': [{'order_id': order_id, 'status': status} for order_id, status in latest.items()]
+    }
+    if seq is not None:
+        batch['seq'] = seq
+    return batch
+
+
+class CoalescingEmitter:
+    """包裝 socketio.emit：訂單事件依房間暫存 window 秒後合併送出"""
+
+    def __init__(self, window=0):
+        self.window = window
+        self._pending = {}  # (namespace, room) -> [(event, data), ...]
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+
+    def emit(self, event, data, room=None, namespace='/'):
+        if self.window <= 0 or room is None:
+            return socketio.emit(event, data, room=room, namespace=namespace)
+        key = (namespace, room)
+        if event not in COALESCED_EVENTS:
+            # 先送出這個房間暫存的訂單事件，維持順序
+            self._flush_keys([key])
+            return socketio.emit(event, data, room=room, namespace=namespace)
+        with self._lock:
+            self._pending.setdefault(key, []).append((event, data))
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        """立即送出所有暫存的事件"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+        self._send(pending)
+
+    def _flush_keys(self, keys):
+        with self._lock:
+            pending = {key: self._pending.pop(key) for key in keys if key in self._pending}
+        self._send(pending)
+
+    def _send(self, pending):
+        if not pending:
+            return
+        with publish_batch():
+            for (namespace, room), items in pending.items():
+                if len(items) == 1:
+                    event, data = items[0]
+                    socketio.emit(event, data, room=room, namespace=namespace)
+                else:
+                    socketio.emit(BATCH_EVENT, build_batch(items), room=room, namespace=namespace)
+
+
+emitter = CoalescingEmitter()
+
+
+def init_coalescing(app):
+    """依 SOCKETIO_COALESCE_WINDOW_MS 設定合併視窗（0 表示不合併）"""
+    emitter.window = app.config.get('SOCKETIO_COALESCE_WINDOW_MS', 0) / 1000.0
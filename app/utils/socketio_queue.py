@@ -0,0 +1,191 @@
+"""
+Socket.IO 跨 worker 訊息佇列
+gunicorn 啟動多個 worker 時，每個 worker 只知道連到自己的客戶端；沒有訊息佇列時，
+處理下單請求（或外寄箱派送）的 worker 送出的 new_order 只有連到同一個 worker 的店家後台收得到。
+設定 SOCKETIO_MESSAGE_QUEUE 後，每次 emit 都會經由 pub/sub 通知其他 worker 轉送給自己的客戶端：
+
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/1           # 正式環境
+    SOCKETIO_MESSAGE_QUEUE=sqlite:////tmp/socketio-queue.db    # 本機 / 測試（不需要 Redis）
+
+兩種後端都支援批次發佈：在 publish_batch() 區塊內的多次 emit 合併成一則 pub/sub 訊息，
+外寄箱派送器每批事件只發佈一次，接收端再逐筆轉送。
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import socketio as python_socketio
+from app import socketio
+from app.utils.socketio_replay import REPLAY_BUFFER_SIZE, ReplayManager, ReplayRecordMixin
+
+# 一則批次訊息最多包含的 emit 數（超過時先發佈一則）
+MAX_BATCH_MESSAGES = 500
+# SQLite 後端：輪詢間隔（秒）、訊息保留時間（秒）、每發佈幾則清理一次舊訊息
+SQLITE_POLL_INTERVAL = 0.05
+SQLITE_RETENTION = 60
+SQLITE_PRUNE_EVERY = 200
+
+
+class BatchPublishMixin:
+    """在 batch() 區塊內暫存要發佈的訊息，離開區塊時合併成一則 {'method': 'batch'} 發佈"""
+
+    def __init__(self, *args, **kwargs):
+        self._batch_state = threading.local()
+        super().__init__(*args, **kwargs)
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._batch_state, 'messages', None) is not None:
+            # 巢狀的 batch() 併入外層
+            yield
+            return
+        self._batch_state.messages = []
+        try:
+            yield
+        finally:
+            messages = self._batch_state.messages
+            self._batch_state.messages = None
+            self._publish_messages(messages)
+
+    def _publish_messages(self, messages):
+        if len(messages) == 1:
+            super()._publish(messages[0])
+        elif messages:
+            super()._publish({'method': 'batch', 'messages': messages, 'host_id': self.host_id})
+
+    def _publish(self, data):
+        messages = getattr(self._batch_state, 'messages', None)
+        if messages is None:
+            return super()._publish(data)
+        messages.append(data)
+        if len(messages) >= MAX_BATCH_MESSAGES:
+            self._publish_messages(messages[:])
+            del messages[:]
+
+    def _listen(self):
+        # 批次訊息展開為原本的訊息（各自帶有發送端的 host_id，自己發出的仍由 PubSubManager 略過）
+        for message in super()._listen():
+            data = message
+            if isinstance(message, bytes):
+                try:
+                    data = pickle.loads(message)
+                except Exception:
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'batch':
+                yield from data.get('messages', [])
+            else:
+                yield data
+
+
+class RedisQueueManager(ReplayRecordMixin, BatchPublishMixin, python_socketio.RedisManager):
+    """Redis pub/sub（需要 redis 套件）"""
+    name = 'redis'
+
+
+class SQLitePubSubManager(python_socketio.PubSubManager):
+    """
+    以 SQLite 檔案作為 pub/sub 的本機替代品（同一台機器的多個行程共用一個檔案，不需要 Redis）
+
+    發佈即寫入一列，各行程以遞增的 id 輪詢新訊息；只用於開發與測試，正式環境請用 Redis。
+    """
+    name = 'sqlite'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=SQLITE_POLL_INTERVAL):
+        self.path = url[len('sqlite:///'):]
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._connection_pid = None
+        self._connection = None
+        self._published = 0
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        with self._lock:
+            self._db().execute(
+                'CREATE TABLE IF NOT EXISTS socketio_messages ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                'data BLOB NOT NULL, created_at REAL NOT NULL)'
+            )
+
+    def _db(self):
+        # gunicorn fork 之後每個行程各自連線
+        pid = os.getpid()
+        if self._connection_pid != pid:
+            self._connection = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                               check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection_pid = pid
+        return self._connection
+
+    def _publish(self, data):
+        with self._lock:
+            db = self._db()
+            now = time.time()
+            db.execute('INSERT INTO socketio_messages (channel, data, created_at) VALUES (?, ?, ?)',
+                       (self.channel, pickle.dumps(data), now))
+            self._published += 1
+            if self._published % SQLITE_PRUNE_EVERY == 0:
+                db.execute('DELETE FROM socketio_messages WHERE created_at < ?', (now - SQLITE_RETENTION,))
+
+    def _sleep(self, seconds):
+        if self.server is not None:
+            self.server.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _listen(self):
+        with self._lock:
+            last_id = self._db().execute('SELECT COALESCE(MAX(id), 0) FROM socketio_messages').fetchone()[0]
+        while True:
+            with self._lock:
+                rows = self._db().execute(
+                    'SELECT id, data FROM socketio_messages WHERE id > ? AND channel = ? ORDER BY id',
+                    (last_id, self.channel)
+                ).fetchall()
+            for row_id, data in rows:
+                last_id = row_id
+                yield data
+            if not rows:
+                self._sleep(self.poll_interval)
+
+
+class SQLiteQueueManager(ReplayRecordMixin, BatchPublishMixin, SQLitePubSubManager):
+    """SQLite 本機 pub/sub（支援批次發佈）"""
+
+
+def create_client_manager(url, channel='flask-socketio', write_only=False, replay_size=REPLAY_BUFFER_SIZE):
+    """
+    依 SOCKETIO_MESSAGE_QUEUE 建立 Socket.IO client manager（都會記錄房間事件供斷線重連補送）
+
+    Args:
+        url: redis:// / rediss:// / sqlite:///<檔案路徑>；空值表示單一行程，不使用訊息佇列
+        replay_size: 每個房間保留的事件數
+
+    Returns:
+        PubSubManager 或 ReplayManager（單一行程）
+    """
+    if not url:
+        return ReplayManager(replay_size=replay_size)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisQueueManager(url, channel=channel, write_only=write_only, replay_size=replay_size)
+    if url.startswith('sqlite:///'):
+        return SQLiteQueueManager(url, channel=channel, write_only=write_only, replay_size=replay_size)
+    raise ValueError(f'不支援的 SOCKETIO_MESSAGE_QUEUE: {url}')
+
+
+def publish_batch():
+    """
+    將區塊內的 socketio.emit 合併成一則 pub/sub 訊息發佈（未設定訊息佇列時不做任何事）
+
+    用法：
+        with publish_batch():
+            for room in rooms:
+                socketio.emit('new_order', data, room=room)
+    """
+    server = getattr(socketio, 'server', None)
+    manager = getattr(server, 'manager', None)
+    if isinstance(manager, BatchPublishMixin):
+        return manager.batch()
+    return nullcontext()
@@ -0,0 +1,148 @@
+"""
+Socket.IO 房間事件補送（斷線重連不漏事件）
+外寄箱送出的每個房間事件都帶有 seq（派送時配發，依送出順序全域遞增，不連續），每個 worker 在送給
+自己的客戶端時把事件記入各房間的環形緩衝區（設定訊息佇列時每個 worker 都會收到所有事件，各自記錄）。
+
+客戶端記住收到的最大 seq，重連後送出 replay {'last_seq': n}，伺服器依序回傳該連線所在房間中
+seq > n 的事件：
+1. 本行程的環形緩衝區涵蓋 n 之後的事件時，直接由記憶體回傳（不查詢資料庫）
+2. 否則（worker 剛啟動、緩衝區已被覆蓋）以 outbox_event.seq 範圍查詢補送
+   （已派送事件保留 OUTBOX_RETENTION_HOURS，更早的事件已被清理時視為無法補齊）
+3. 缺口超過 REPLAY_OUTBOX_LIMIT 筆時回傳 complete=False，頁面才重新載入完整列表
+
+派送器之間以 outbox_sequence 列鎖互斥，seq 依送出順序配發：客戶端收過 seq n 之後，
+之後送出的事件 seq 都大於 n，不會因為較早寫入、較晚 commit 或派送的事件而漏收。
+"""
+import json
+import threading
+import socketio as python_socketio
+from app import db, socketio
+from app.models import OutboxEvent
+
+# 每個房間保留的事件數
+REPLAY_BUFFER_SIZE = 200
+# 記憶體無法涵蓋時，最多從外寄箱補送的事件數（超過時要求客戶端重新載入）
+REPLAY_OUTBOX_LIMIT = 1000
+
+
+class ReplayBuffer:
+    """各房間最近的帶 seq 事件（依 seq 排序）"""
+
+    def __init__(self, size=REPLAY_BUFFER_SIZE):
+        self.size = size
+        self.first_seq = None  # 本行程記錄的第一個 seq，之後的事件都有記錄
+        self.last_seq = None
+        self._rooms = {}
+        self._trimmed = {}  # 房間 -> 已移出緩衝區的最大 seq
+        self._lock = threading.Lock()
+
+    def record(self, namespace, room, seq, event, data):
+        key = (namespace or '/', room)
+        with self._lock:
+            if self.first_seq is None or seq < self.first_seq:
+                self.first_seq = seq
+            if self.last_seq is None or seq > self.last_seq:
+                self.last_seq = seq
+            entries = self._rooms.setdefault(key, [])
+            entries.append((seq, event, data))
+            if len(entries) > 1 and entries[-2][0] > seq:
+                entries.sort(key=lambda entry: entry[0])
+            if len(entries) > self.size:
+                removed = entries.pop(0)
+                self._trimmed[key] = max(self._trimmed.get(key, removed[0]), removed[0])
+
+    def since(self, namespace, rooms, last_seq):
+        """
+        rooms 中 seq > last_seq 的事件
+
+        Returns:
+            list 或 None（本行程無法確定沒有遺漏時）
+        """
+        with self._lock:
+            if self.first_seq is None or last_seq < self.first_seq:
+                # seq 不連續，無法確定 last_seq 與本行程記錄的第一個事件之間沒有其他事件
+                return None
+            events = []
+            for room in rooms:
+                key = (namespace or '/', room)
+                if last_seq < self._trimmed.get(key, last_seq):
+                    return None
+                events.extend(entry for entry in self._rooms.get(key, ()) if entry[0] > last_seq)
+        events.sort(key=lambda entry: entry[0])
+        return [{'seq': seq, 'event': event, 'data': data} for seq, event, data in events]
+
+
+class ReplayRecordMixin:
+    """PubSubManager：本行程與其他 worker 的 emit 都經由 _handle_emit 送給本行程的客戶端，在此記錄"""
+
+    def __init__(self, *args, replay_size=REPLAY_BUFFER_SIZE, **kwargs):
+        self.replay_buffer = ReplayBuffer(replay_size)
+        super().__init__(*args, **kwargs)
+
+    def _record(self, event, data, namespace, room):
+        if room is not None and isinstance(data, dict) and 'seq' in data:
+            self.replay_buffer.record(namespace, room, data['seq'], event, data)
+
+    def _handle_emit(self, message):
+        self._record(message['event'], message['data'], message.get('namespace'), message.get('room'))
+        return super()._handle_emit(message)
+
+
+class ReplayManager(ReplayRecordMixin, python_socketio.Manager):
+    """單一行程（未設定訊息佇列）：emit 直接送給本行程的客戶端，在此記錄"""
+
+    def emit(self, event, data, namespace, room=None, **kwargs):
+        self._record(event, data, namespace, room)
+        return super().emit(event, data, namespace, room=room, **kwargs)
+
+
+def _outbox_since(rooms, last_seq):
+    """以外寄箱補送（已派送的 socketio 事件）；超過 REPLAY_OUTBOX_LIMIT 筆或缺口已被清理時回傳 None"""
+    # 清理保留 seq 最大的一筆；seq 最小的事件之前的事件可能已被刪除（seq 等於 last_seq 的事件仍在時才確定沒有缺口）
+    oldest = db.session.query(db.func.min(OutboxEvent.seq)).scalar()
+    if oldest is not None and last_seq < oldest:
+        return None
+    rows = db.session.query(OutboxEvent.seq, OutboxEvent.payload).filter(
+        OutboxEvent.seq > last_seq,
+        OutboxEvent.dispatched_at.isnot(None)
+    ).order_by(OutboxEvent.seq).limit(REPLAY_OUTBOX_LIMIT + 1).all()
+    if len(rows) > REPLAY_OUTBOX_LIMIT:
+        return None
+    rooms = set(rooms)
+    events = []
+    for seq, payload in rows:
+        payload = json.loads(payload)
+        if rooms.intersection(payload['rooms']):
+            events.append({'seq': seq, 'event': payload['event'],
+                           'data': dict(payload['data'], seq=seq)})
+    return events
+
+
+def _latest_seq():
+    # 還沒有派送過任何事件時以 0 作為起點（之後的事件 seq 都大於 0）
+    return db.session.query(db.func.max(OutboxEvent.seq)).scalar() or 0
+
+
+def replay_events(rooms, last_seq, namespace='/'):
+    """
+    連線所在房間中 seq > last_seq 的事件
+
+    Args:
+        rooms: 連線所在的房間
+        last_seq: 客戶端收到的最大 seq；None 表示首次連線，只回傳目前的 seq 作為起點
+
+    Returns:
+        dict: {'events': [{'seq', 'event', 'data'}], 'complete': bool, 'last_seq': 目前的 seq}
+    """
+    buffer = getattr(getattr(socketio.server, 'manager', None), 'replay_buffer', None)
+    head = buffer.last_seq if buffer is not None else None
+    if last_seq is None:
+        return {'events': [], 'complete': True, 'last_seq': head if head is not None else _latest_seq()}
+
+    events = buffer.since(namespace, rooms, last_seq) if buffer is not None else None
+    if events is None:
+        events = _outbox_since(rooms, last_seq)
+    if events is None:
+        return {'events': [], 'complete': False, 'last_seq': head if head is not None else _latest_seq()}
+    seqs = [event['seq'] for event in events] + [last_seq] + ([head] if head is not None else [])
+    return {'events': events, 'complete': True, 'last_seq': max(seqs)}
@@ -0,0 +1,181 @@
+"""
+靜態文件指紋（內容雜湊網址）
+模板以 static_url('css/store.css') 取得帶內容雜湊的網址（/static/css/store.3f2a9c1b0e.css），
+內容改變網址才改變，因此帶雜湊的網址可以回應 Cache-Control: public, max-age=31536000, immutable，
+瀏覽器重複載入頁面時不再發出任何靜態文件請求。
+
+部署時執行建置步驟（python build_static.py）：為 static 目錄下每個文件寫出帶雜湊的副本與
+manifest.json，啟動時只讀取 manifest，nginx 也能直接提供帶雜湊的副本。
+未執行建置步驟時（開發環境）依文件修改時間在記憶體中計算雜湊，帶雜湊的網址由 static 路由
+對應回原始文件，修改 CSS / JS 後不需要重新啟動。
+
+建置步驟同時在每個 CSS / JS 旁寫出 .gz / .br，static 路由依 Accept-Encoding 直接送出，
+worker 不再為靜態文件即時壓縮。
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from flask import current_app, url_for, send_from_directory
+from app.utils.compression import PRECOMPRESSED_SUFFIXES, write_compressed_siblings, precompressed_file
+
+MANIFEST_NAME = 'manifest.json'
+# 網址中雜湊的長度（md5 十六進位的前幾位）
+HASH_LENGTH = 10
+# 帶雜湊網址的瀏覽器快取時間（秒）：一年
+IMMUTABLE_MAX_AGE = 31536000
+
+_HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+
+
+def file_digest(path):
+    """文件內容的雜湊（前 HASH_LENGTH 位）"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    return md5.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(filename, digest):
+    """css/store.css → css/store.<digest>.css"""
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext}'
+
+
+def iter_source_files(static_folder):
+    """static 目錄下的原始文件（相對路徑，以 / 分隔；略過 manifest 與帶雜湊的副本）"""
+    for root, dirs, files in os.walk(static_folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.startswith('.') or _HASHED_NAME.match(name):
+                continue
+            if name.endswith(tuple(suffix for _, suffix in PRECOMPRESSED_SUFFIXES)):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            if rel_path == MANIFEST_NAME:
+                continue
+            yield rel_path
+
+
+def build_manifest(static_folder):
+    """
+    建置步驟：寫出帶雜湊的副本、.gz / .br 壓縮文件與 manifest.json
+
+    舊版本的副本保留不刪（已快取的頁面可能仍引用舊網址）。
+
+    Returns:
+        dict: {原始路徑: 帶雜湊的路徑}
+    """
+    manifest = {}
+    for rel_path in iter_source_files(static_folder):
+        source = os.path.join(static_folder, rel_path)
+        target_name = hashed_name(rel_path, file_digest(source))
+        target = os.path.join(static_folder, target_name)
+        if not os.path.exists(target):
+            shutil.copy2(source, target)
+        write_compressed_siblings(source)
+        write_compressed_siblings(target)
+        manifest[rel_path] = target_name
+
+    manifest_path = os.path.join(static_folder, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+class StaticAssets:
+    """static 目錄的雜湊對照（manifest 模式或依修改時間計算的開發模式）"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.manifest = None
+        self.sources = {}
+        # 開發模式：{原始路徑: (修改時間, 雜湊)}
+        self._digests = {}
+
+        manifest_path = os.path.join(static_folder, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            self.sources = {hashed: source for source, hashed in self.manifest.items()}
+
+    def _current_digest(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._digests.get(filename)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, file_digest(path))
+            self._digests[filename] = cached
+        return cached[1]
+
+    def url_name(self, filename):
+        """原始路徑 → 帶雜湊的路徑（不存在的文件原樣返回）"""
+        if self.manifest is not None:
+            return self.manifest.get(filename, filename)
+        digest = self._current_digest(filename)
+        return hashed_name(filename, digest) if digest else filename
+
+    def source_of(self, filename):
+        """帶雜湊的路徑 → 原始路徑（不是目前版本的帶雜湊路徑時返回 None）"""
+        if self.manifest is not None:
+            return self.sources.get(filename)
+        directory, name = os.path.split(filename)
+        match = _HASHED_NAME.match(name)
+        if not match:
+            return None
+        source = os.path.join(directory, match.group('stem') + match.group('ext')).replace(os.sep, '/')
+        if self._current_digest(source) != match.group('digest'):
+            return None
+        return source
+
+
+def static_url(filename, **values):
+    """模板用：帶內容雜湊的靜態文件網址（參數同 url_for('static', ...)）"""
+    assets = current_app.extensions.get('static_assets')
+    if assets is not None:
+        filename = assets.url_name(filename)
+    return url_for('static', filename=filename, **values)
+
+
+def _send_file(folder, filename, max_age):
+    """送出文件；有建置步驟寫出的 .br / .gz 且客戶端接受時送出壓縮文件"""
+    compressed, encoding = precompressed_file(folder, filename)
+    if compressed is None:
+        return send_from_directory(folder, filename, max_age=max_age)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(folder, compressed, max_age=max_age, mimetype=mimetype)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _send_static(filename):
+    assets = current_app.extensions['static_assets']
+    source = assets.source_of(filename)
+    if source is None:
+        # 未帶雜湊的網址：快取時間沿用 Flask 的設定（SEND_FILE_MAX_AGE_DEFAULT）
+        return _send_file(assets.static_folder, filename, current_app.get_send_file_max_age(filename))
+    # 建置步驟寫出的副本存在時直接送出，否則送出原始文件（內容相同）
+    if not os.path.isfile(os.path.join(assets.static_folder, filename)):
+        filename = source
+    response = _send_file(assets.static_folder, filename, IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_static_assets(app):
+    """載入雜湊對照、接管 static 路由並註冊模板函數 static_url"""
+    if not app.static_folder:
+        return
+    app.extensions['static_assets'] = StaticAssets(app.static_folder)
+    app.view_functions['static'] = _send_static
+    app.add_template_global(static_url)
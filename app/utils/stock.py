@@ -0,0 +1,101 @@
+"""
+庫存預留工具
+以單一條件式 UPDATE 原子扣減整張訂單的庫存，避免「先查後扣」造成的超賣
+"""
+from sqlalchemy import case, update
+from app import db
+from app.models import Product
+from app.utils.cache_tags import invalidate_on_commit
+
+
+class InsufficientStockError(ValueError):
+    """庫存不足錯誤（failures 記錄每一個扣減失敗的產品）"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        names = '、'.join(str(f.get('product_name') or f['product_id']) for f in failures)
+        super().__init__(f'產品 {names} 庫存不足')
+
+
+def collect_quantities(lines):
+    """
+    合併訂單項的數量（同一產品出現多次時加總）
+
+    Args:
+        lines: 可迭代的 (product_id, quantity)
+
+    Returns:
+        dict: {product_id: total_quantity}
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + int(quantity)
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    原子扣減庫存（整張訂單一條 UPDATE）
+
+    UPDATE product
+       SET stock_quantity = stock_quantity - CASE id WHEN :id THEN :q ... END
+     WHERE id IN (...) AND stock_quantity >= CASE id WHEN :id THEN :q ... END
+
+    若受影響行數少於產品數，回滾到 savepoint（不會部分扣減），
+    再查出實際不足的產品並拋出 InsufficientStockError。
+    呼叫者負責 commit / rollback 外層交易。
+
+    Args:
+        quantities: {product_id: quantity}
+
+    Returns:
+        int: 扣減的產品數量
+
+    Raises:
+        InsufficientStockError: 任一產品庫存不足
+    """
+    quantities = {pid: qty for pid, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return 0
+
+    product_ids = list(quantities.keys())
+    requested = case(quantities, value=Product.id, else_=0)
+    stmt = update(Product).where(
+        Product.id.in_(product_ids),
+        Product.stock_quantity >= requested
+    ).values(
+        stock_quantity=Product.stock_quantity - requested
+    ).execution_options(synchronize_session=False)
+
+    savepoint = db.session.begin_nested()
+    result = db.session.execute(stmt)
+    if result.rowcount == len(product_ids):
+        savepoint.commit()
+        # 產品列表與詳情的快取含庫存，外層交易 commit 後失效
+        invalidate_on_commit(*(f'stock:{pid}' for pid in product_ids))
+        return result.rowcount
+
+    savepoint.rollback()
+    raise InsufficientStockError(_find_failures(quantities))
+
+
+def _find_failures(quantities):
+    """找出庫存不足的訂單行（僅在扣減失敗時執行）"""
+    rows = db.session.query(
+        Product.id, Product.name, Product.stock_quantity
+    ).filter(Product.id.in_(list(quantities.keys()))).all()
+    stock_map = {row.id: row for row in rows}
+
+    failures = []
+    for product_id, qty in quantities.items():
+        row = stock_map.get(product_id)
+        available = row.stock_quantity if row else 0
+        failures.append({
+            'product_id': product_id,
+            'product_name': row.name if row else None,
+            'requested': qty,
+            'available': available
+        })
+    # 併發下其他交易可能剛好歸還庫存，無法判定時回報全部訂單行
+    insufficient = [f for f in failures if f['available'] < f['requested']]
+    return insufficient or failures
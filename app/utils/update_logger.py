@@ -19,51 +19,9 @@ def log_update(action, table_name, record_id=None, old_data=None, new_data=None,
         description: 操作描述
     """
     try:
-        # 安全获取 session 和 request
-        try:
-            user_id = session.get('user_id') if session else None
-        except:
-            user_id = None
-        
-        try:
-            ip_address = request.remote_addr if request else None
-        except:
-            ip_address = None
-        
-        # 將數據轉換為JSON字符串
-        old_data_json = json.dumps(old_data, ensure_ascii=False) if old_data else None
-        new_data_json = json.dumps(new_data, ensure_ascii=False) if new_data else None
-        
-        # 如果沒有描述，自動生成
-        if not description:
-            action_map = {
-                'create': '新增',
-                'update': '更新',
-                'delete': '刪除'
-            }
-            table_map = {
-                'user': '使用者',
-                'shop': '店鋪',
-                'product': '產品',
-                'order': '訂單',
-                'topping': 'Topping',
-                'category': '分類'
-            }
-            action_text = action_map.get(action, action)
-            table_text = table_map.get(table_name, table_name)
-            description = f'{action_text}{table_text} #{record_id}' if record_id else f'{action_text}{table_text}'
-        
-        # 創建日誌記錄
-        log = UpdateLog(
-            user_id=user_id,
-            action=action,
-            table_name=table_name,
-            record_id=record_id,
-            old_data=old_data_json,
-            new_data=new_data_json,
-            description=description,
-            ip_address=ip_address
-        )
+        user_id, ip_address = get_request_actor()
+        log = build_update_log(action, table_name, record_id, old_data, new_data, description,
+                               user_id=user_id, ip_address=ip_address)
         
         db.session.add(log)
         db.session.commit()
@@ -75,6 +33,69 @@ def log_update(action, table_name, record_id=None, old_data=None, new_data=None,
         db.session.rollback()
         return None
 
+def get_request_actor():
+    """
+    取得目前請求的操作者（請求外呼叫時返回 (None, None)）
+    
+    Returns:
+        tuple: (user_id, ip_address)
+    """
+    # 安全获取 session 和 request
+    try:
+        user_id = session.get('user_id') if session else None
+    except:
+        user_id = None
+    
+    try:
+        ip_address = request.remote_addr if request else None
+    except:
+        ip_address = None
+    
+    return user_id, ip_address
+
+def build_update_log(action, table_name, record_id=None, old_data=None, new_data=None, description=None,
+                     user_id=None, ip_address=None):
+    """
+    建立（不寫入）更新日誌物件，供不在請求內的呼叫者使用（如外寄箱派送器）
+    
+    Returns:
+        UpdateLog
+    """
+    # 將數據轉換為JSON字符串
+    old_data_json = json.dumps(old_data, ensure_ascii=False) if old_data else None
+    new_data_json = json.dumps(new_data, ensure_ascii=False) if new_data else None
+    
+    # 如果沒有描述，自動生成
+    if not description:
+        action_map = {
+            'create': '新增',
+            'update': '更新',
+            'delete': '刪除'
+        }
+        table_map = {
+            'user': '使用者',
+            'shop': '店鋪',
+            'product': '產品',
+            'order': '訂單',
+            'topping': 'Topping',
+            'category': '分類'
+        }
+        action_text = action_map.get(action, action)
+        table_text = table_map.get(table_name, table_name)
+        description = f'{action_text}{table_text} #{record_id}' if record_id else f'{action_text}{table_text}'
+    
+    # 創建日誌記錄
+    return UpdateLog(
+        user_id=user_id,
+        action=action,
+        table_name=table_name,
+        record_id=record_id,
+        old_data=old_data_json,
+        new_data=new_data_json,
+        description=description,
+        ip_address=ip_address
+    )
+
 def get_logs(limit=100, table_name=None, action=None, user_id=None):
     """
     獲取更新日誌
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Socket.IO 閒置連線基準測試
+比較 polling 與 WebSocket 傳輸在 N 個閒置店家後台（預設 100 個）下，
+伺服器每秒處理的 HTTP 請求數與 CPU 使用量
+
+使用方法：
+    python benchmark_socketio.py --clients 100 --duration 60
+    python benchmark_socketio.py --modes polling --ping-interval 5 --duration 30
+
+伺服器以 eventlet 在獨立行程中執行 create_app（與 gunicorn eventlet worker 相同的 async_mode），
+客戶端為 python-socketio 的 Client（需要 requests 與 websocket-client）。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+STATS_PATH = '/__bench__/stats'
+
+
+def print_header(text):
+    """打印標題"""
+    print("\n" + "="*60)
+    print(text)
+    print("="*60)
+
+
+def free_port():
+    """取得一個可用的本機埠號"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(port):
+    """伺服器行程：eventlet WSGI 伺服器，外層計算請求數並提供統計"""
+    import eventlet
+    eventlet.monkey_patch()
+    import eventlet.wsgi
+
+    from app import create_app, db
+    from app.config import Config
+
+    class BenchConfig(Config):
+        """基準測試配置"""
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_socketio.db')
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        CACHE_TYPE = 'null'
+        OUTBOX_DISPATCHER_ENABLED = False
+        SOCKETIO_ASYNC_MODE = 'eventlet'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SOCKETIO_LOGGER = False
+        SOCKETIO_PING_INTERVAL = int(os.environ.get('BENCH_PING_INTERVAL', '25'))
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+
+    stats = {'requests': 0}
+
+    def counting_app(environ, start_response):
+        if environ['PATH_INFO'] == STATS_PATH:
+            body = json.dumps({'requests': stats['requests'], 'cpu': time.process_time()}).encode()
+            start_response('200 OK', [('Content-Type', 'application/json')])
+            return [body]
+        stats['requests'] += 1
+        return app(environ, start_response)
+
+    eventlet.wsgi.server(eventlet.listen(('127.0.0.1', port)), counting_app, log_output=False)
+
+
+def read_stats(base_url):
+    with urllib.request.urlopen(base_url + STATS_PATH, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return read_stats(base_url)
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('伺服器啟動逾時')
+
+
+def run_mode(mode, clients, duration, ping_interval):
+    """啟動伺服器、連上 clients 個閒置客戶端，量測 duration 秒內的請求數與 CPU 時間"""
+    import socketio
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, BENCH_PING_INTERVAL=str(ping_interval))
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], env=env)
+    try:
+        wait_for_server(base_url)
+        connected = []
+        for _ in range(clients):
+            client = socketio.Client(reconnection=False)
+            client.connect(base_url, transports=[mode])
+            connected.append(client)
+        # 連線建立完成後才開始量測（只量閒置時的開銷）
+        time.sleep(2)
+        before = read_stats(base_url)
+        time.sleep(duration)
+        after = read_stats(base_url)
+        for client in connected:
+            client.disconnect()
+    finally:
+        server.terminate()
+        server.wait()
+
+    # 讀取統計本身不計入請求數
+    requests = after['requests'] - before['requests']
+    cpu = after['cpu'] - before['cpu']
+    return {
+        'mode': mode,
+        'requests_per_sec': requests / duration,
+        'cpu_percent': cpu / duration * 100,
+        'cpu_ms_per_client_min': cpu * 1000 / clients / (duration / 60),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO 閒置連線基準測試')
+    parser.add_argument('--clients', type=int, default=100, help='閒置客戶端數')
+    parser.add_argument('--duration', type=float, default=60, help='量測秒數')
+    parser.add_argument('--ping-interval', type=int, default=25, help='心跳間隔（秒，與 SOCKETIO_PING_INTERVAL 相同）')
+    parser.add_argument('--modes', default='polling,websocket', help='要比較的傳輸方式')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return True
+
+    print_header('Socket.IO 閒置連線基準測試')
+    print(f"客戶端: {args.clients}，量測: {args.duration:.0f} 秒，心跳間隔: {args.ping_interval} 秒")
+
+    results = [run_mode(mode, args.clients, args.duration, args.ping_interval)
+               for mode in args.modes.split(',')]
+
+    print_header('結果')
+    print(f"{'傳輸方式':<12}{'請求/秒':>12}{'CPU %':>10}{'CPU ms/客戶端/分':>20}")
+    for result in results:
+        print(f"{result['mode']:<12}{result['requests_per_sec']:>12.2f}{result['cpu_percent']:>10.2f}"
+              f"{result['cpu_ms_per_client_min']:>20.2f}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+建置靜態文件：為 static 目錄下每個文件寫出帶內容雜湊的副本、.gz / .br 壓縮文件與 manifest.json
+部署時（每次更新 CSS / JS 之後、重新啟動 gunicorn 之前）執行：
+
+    python build_static.py
+
+模板中的 static_url('css/store.css') 會輸出 /static/css/store.<雜湊>.css，
+這些網址以 Cache-Control: public, max-age=31536000, immutable 回應；
+客戶端接受 br / gzip 時直接送出預先壓縮的文件（brotli 需安裝 brotli 套件）。
+"""
+import sys
+
+from app import create_app
+from app.utils.static_assets import build_manifest
+
+
+def main():
+    app = create_app()
+    static_folder = app.static_folder
+    print(f"靜態文件目錄: {static_folder}")
+
+    manifest = build_manifest(static_folder)
+    for source, hashed in sorted(manifest.items()):
+        print(f"  {source} -> {hashed}")
+    print(f"✓ 共 {len(manifest)} 個文件，已寫出壓縮文件與 manifest.json")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
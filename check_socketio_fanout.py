@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Socket.IO 跨 worker 訊息佇列整合檢查
+啟動多個獨立的 Socket.IO 伺服器行程（模擬 gunicorn worker），每個行程各連上數個店家後台客戶端，
+再由另一個行程經訊息佇列批次送出 new_order，檢查每個客戶端都依序收到每一筆事件。
+
+使用方法：
+    python check_socketio_fanout.py                                  # 預設使用 SQLite 本機佇列
+    python check_socketio_fanout.py --queue redis://localhost:6379/15 --workers 4 --events 500
+
+需要 python-socketio 的客戶端相依套件（websocket-client）；--queue 指向 Redis 時需要 redis 套件。
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+ROOM = '/shop/1'
+
+
+def print_header(text):
+    """打印標題"""
+    print("\n" + "="*60)
+    print(text)
+    print("="*60)
+
+
+def free_port():
+    """取得一個可用的本機埠號"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_worker(queue_url, port, ready):
+    """worker 行程：Socket.IO 伺服器，連線的客戶端都加入店鋪頻道"""
+    import logging
+    import socketio
+    from werkzeug.serving import make_server
+    from app.utils.socketio_queue import create_client_manager
+
+    # 開發伺服器的存取紀錄與 websocket 關閉時的錯誤訊息不影響檢查結果
+    logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+    sio = socketio.Server(async_mode='threading', client_manager=create_client_manager(queue_url))
+
+    @sio.event
+    def connect(sid, environ):
+        sio.enter_room(sid, ROOM)
+
+    server = make_server('127.0.0.1', port, socketio.WSGIApp(sio), threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def run_dashboard(url, received, expected, done):
+    """店家後台客戶端：記錄收到的 new_order 序號"""
+    import socketio
+    client = socketio.Client(reconnection=False)
+
+    @client.on('new_order')
+    def on_new_order(data):
+        received.append(data['seq'])
+        if len(received) >= expected:
+            done.set()
+
+    # Python 版客戶端的 polling 在一次回應含多個封包時會中斷連線，這裡只用 websocket
+    client.connect(url, transports=['websocket'])
+    return client
+
+
+def publish_orders(queue_url, events, batch_size):
+    """模擬外寄箱派送器：每批事件合併成一則訊息發佈到佇列"""
+    from app.utils.socketio_queue import create_client_manager
+
+    manager = create_client_manager(queue_url, write_only=True)
+    for start in range(0, events, batch_size):
+        with manager.batch():
+            for seq in range(start, min(start + batch_size, events)):
+                manager.emit('new_order', {'seq': seq, 'order_id': 1000 + seq}, namespace='/', room=ROOM)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO 跨 worker 訊息佇列整合檢查')
+    parser.add_argument('--queue', help='SOCKETIO_MESSAGE_QUEUE（預設為暫存目錄中的 SQLite 檔案）')
+    parser.add_argument('--workers', type=int, default=3, help='伺服器行程數')
+    parser.add_argument('--clients', type=int, default=2, help='每個行程的客戶端數')
+    parser.add_argument('--events', type=int, default=200, help='送出的 new_order 事件數')
+    parser.add_argument('--batch-size', type=int, default=50, help='每批合併發佈的事件數')
+    parser.add_argument('--timeout', type=float, default=30, help='等待所有事件送達的秒數')
+    args = parser.parse_args()
+
+    queue_url = args.queue or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'socketio-queue.db')
+    print_header('Socket.IO 跨 worker 訊息佇列整合檢查')
+    print(f"訊息佇列: {queue_url}")
+    print(f"worker: {args.workers}，每個 worker 客戶端: {args.clients}，事件: {args.events}（每批 {args.batch_size}）")
+
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    urls = []
+    for _ in range(args.workers):
+        port = free_port()
+        ready = context.Event()
+        process = context.Process(target=run_worker, args=(queue_url, port, ready), daemon=True)
+        process.start()
+        if not ready.wait(15):
+            print("✗ worker 啟動逾時")
+            return False
+        workers.append(process)
+        urls.append(f'http://127.0.0.1:{port}')
+
+    dashboards = []
+    for url in urls:
+        for _ in range(args.clients):
+            received = []
+            done = threading.Event()
+            client = run_dashboard(url, received, args.events, done)
+            dashboards.append((url, client, received, done))
+    # 等待各 worker 的佇列監聽開始（第一個客戶端連線時啟動）
+    time.sleep(1)
+
+    started = time.time()
+    publish_orders(queue_url, args.events, args.batch_size)
+    deadline = started + args.timeout
+    for _, _, _, done in dashboards:
+        done.wait(max(0, deadline - time.time()))
+    elapsed = time.time() - started
+
+    success = True
+    expected = list(range(args.events))
+    for i, (url, client, received, _) in enumerate(dashboards):
+        if received == expected:
+            status = '✓'
+        else:
+            status = '✗'
+            success = False
+        print(f"  {status} 客戶端 {i + 1}（{url}）收到 {len(received)}/{args.events}"
+              + ('' if received == sorted(received) else '（順序錯誤）'))
+        client.disconnect()
+
+    for process in workers:
+        process.terminate()
+
+    print_header('結果')
+    print(f"耗時: {elapsed:.2f} 秒")
+    print("✓ 所有客戶端都依序收到所有事件" if success else "✗ 有客戶端漏收事件")
+    return success
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
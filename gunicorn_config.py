@@ -7,8 +7,11 @@ bind = "127.0.0.1:8000"
 backlog = 2048
 
 # Worker 配置
+# 多個 worker 時必須設定 SOCKETIO_MESSAGE_QUEUE（如 redis://localhost:6379/1），
+# 否則 Socket.IO 事件只會送到與送出者同一個 worker 的客戶端
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "eventlet"  # 支援 SocketIO，使用 eventlet
+worker_class = "eventlet"  # 支援 SocketIO 的 WebSocket 傳輸（每個 WebSocket 連線佔用一個 greenlet）
+# 每個 worker 同時保持的連線數上限（含閒置的店家後台 WebSocket 長連線）
 worker_connections = 1000
 timeout = 120
 keepalive = 5
@@ -43,7 +46,12 @@ pidfile = "logs/gunicorn.pid"
 # 環境變數
 raw_env = [
     "LANG=en_US.UTF-8",
+    # Socket.IO 的 async_mode 必須與 worker_class 一致，WebSocket 才能運作
+    f"SOCKETIO_ASYNC_MODE={worker_class}",
 ]
+# 前端預設直接以 WebSocket 連線，無法連線時才退回 polling（SOCKETIO_TRANSPORTS）。
+# 注意：polling 在多個 worker 時需要黏著連線（同一客戶端的請求要到同一個 worker），
+# 只靠 WebSocket 的部署不受影響。
 
 # 創建日誌目錄
 if not os.path.exists('logs'):
@@ -0,0 +1,51 @@
+"""add_order_sequence_table
+
+Revision ID: a3f1c9d2e4b7
+Revises: 51b0df6e1f1b
+Create Date: 2026-10-18 09:40:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2e4b7'
+down_revision = '51b0df6e1f1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    # 创建 order_sequence 表（每店每日一行）
+    if 'order_sequence' not in inspector.get_table_names():
+        op.create_table('order_sequence',
+        sa.Column('shop_id', sa.Integer(), nullable=False),
+        sa.Column('seq_date', sa.Date(), nullable=False),
+        sa.Column('last_seq', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['shop_id'], ['shop.id'], ),
+        sa.PrimaryKeyConstraint('shop_id', 'seq_date')
+        )
+    
+    # 以最近兩天已發出的最大流水號初始化计数器，避免与旧订单编号冲突
+    # 订单编号格式：前缀 + 商店编码 + Ymd(8) + 流水号(5)
+    # 旧版 shop_id 路径可能留下 NULL 编号，其他格式的编号也略过（NOT NULL 主键在 strict 模式下会中止迁移）
+    connection.execute(sa.text(
+        "INSERT INTO order_sequence (shop_id, seq_date, last_seq, updated_at) "
+        "SELECT shop_id, STR_TO_DATE(SUBSTRING(order_number, -13, 8), '%Y%m%d') AS seq_date, "
+        "MAX(CAST(RIGHT(order_number, 5) AS UNSIGNED)), NOW() "
+        "FROM `order` WHERE created_at >= DATE_SUB(NOW(), INTERVAL 2 DAY) "
+        "AND shop_id IS NOT NULL AND order_number IS NOT NULL "
+        "AND order_number REGEXP '(19|20)[0-9]{2}(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])[0-9]{5}$' "
+        "GROUP BY shop_id, seq_date "
+        "HAVING seq_date IS NOT NULL "
+        "ON DUPLICATE KEY UPDATE last_seq = GREATEST(last_seq, VALUES(last_seq))"
+    ))
+
+
+def downgrade():
+    op.drop_table('order_sequence')
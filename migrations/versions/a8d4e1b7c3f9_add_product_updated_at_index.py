@@ -0,0 +1,35 @@
+"""add_product_updated_at_index
+
+Revision ID: a8d4e1b7c3f9
+Revises: f2a6c9d3e8b1
+Create Date: 2026-10-18 14:32:09.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4e1b7c3f9'
+down_revision = 'f2a6c9d3e8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    existing = {index['name'] for index in inspector.get_indexes('product')}
+    
+    # 搜尋索引增量更新（updated_at >= 水位線）
+    if 'ix_product_updated_at' not in existing:
+        op.create_index('ix_product_updated_at', 'product', ['updated_at'], unique=False)
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    existing = {index['name'] for index in inspector.get_indexes('product')}
+    
+    if 'ix_product_updated_at' in existing:
+        op.drop_index('ix_product_updated_at', table_name='product')
@@ -0,0 +1,52 @@
+"""add_outbox_dispatch_sequence
+
+Revision ID: b6e3f9a2d7c4
+Revises: a8d4e1b7c3f9
+Create Date: 2026-10-18 22:55:41.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3f9a2d7c4'
+down_revision = 'a8d4e1b7c3f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    # 房間事件序號改在派送時配發（依派送順序遞增），既有事件沒有序號，不會被補送
+    columns = {column['name'] for column in inspector.get_columns('outbox_event')}
+    if 'seq' not in columns:
+        op.add_column('outbox_event', sa.Column('seq', sa.BigInteger(), nullable=True))
+    existing = {index['name'] for index in inspector.get_indexes('outbox_event')}
+    if 'uq_outbox_seq' not in existing:
+        op.create_index('uq_outbox_seq', 'outbox_event', ['seq'], unique=True)
+    
+    # 派送序號計數器（單一行，派送器以列鎖互斥）
+    if 'outbox_sequence' not in inspector.get_table_names():
+        op.create_table('outbox_sequence',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('last_seq', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.execute('INSERT INTO outbox_sequence (id, last_seq) VALUES (1, 0)')
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    if 'outbox_sequence' in inspector.get_table_names():
+        op.drop_table('outbox_sequence')
+    existing = {index['name'] for index in inspector.get_indexes('outbox_event')}
+    if 'uq_outbox_seq' in existing:
+        op.drop_index('uq_outbox_seq', table_name='outbox_event')
+    columns = {column['name'] for column in inspector.get_columns('outbox_event')}
+    if 'seq' in columns:
+        op.drop_column('outbox_event', 'seq')
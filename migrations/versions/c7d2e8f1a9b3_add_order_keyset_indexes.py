@@ -0,0 +1,44 @@
+"""add_order_keyset_indexes
+
+Revision ID: c7d2e8f1a9b3
+Revises: a3f1c9d2e4b7
+Create Date: 2026-10-18 11:05:27.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e8f1a9b3'
+down_revision = 'a3f1c9d2e4b7'
+branch_labels = None
+depends_on = None
+
+
+ORDER_INDEXES = {
+    'idx_order_user_created': ['user_id', 'created_at', 'id'],
+    'idx_order_shop_created': ['shop_id', 'created_at', 'id'],
+    'idx_order_created': ['created_at', 'id'],
+}
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    existing = {index['name'] for index in inspector.get_indexes('order')}
+    
+    # 订单游标分页用的复合索引 (筛选字段, created_at, id)
+    for name, columns in ORDER_INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'order', columns, unique=False)
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    existing = {index['name'] for index in inspector.get_indexes('order')}
+    
+    for name in ORDER_INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name='order')
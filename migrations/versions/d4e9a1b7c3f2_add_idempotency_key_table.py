@@ -0,0 +1,46 @@
+"""add_idempotency_key_table
+
+Revision ID: d4e9a1b7c3f2
+Revises: c7d2e8f1a9b3
+Create Date: 2026-10-18 11:32:50.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e9a1b7c3f2'
+down_revision = 'c7d2e8f1a9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    # 创建 idempotency_key 表（下单请求幂等记录）
+    if 'idempotency_key' not in inspector.get_table_names():
+        op.create_table('idempotency_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('uq_idempotency_scope_key', 'idempotency_key', ['scope', 'key'], unique=True)
+        op.create_index(op.f('ix_idempotency_key_created_at'), 'idempotency_key', ['created_at'], unique=False)
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    if 'idempotency_key' in inspector.get_table_names():
+        op.drop_index(op.f('ix_idempotency_key_created_at'), table_name='idempotency_key')
+        op.drop_index('uq_idempotency_scope_key', table_name='idempotency_key')
+        op.drop_table('idempotency_key')
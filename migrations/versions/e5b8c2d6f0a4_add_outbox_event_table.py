@@ -0,0 +1,44 @@
+"""add_outbox_event_table
+
+Revision ID: e5b8c2d6f0a4
+Revises: d4e9a1b7c3f2
+Create Date: 2026-10-18 12:10:03.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8c2d6f0a4'
+down_revision = 'd4e9a1b7c3f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    # 创建 outbox_event 表（交易外寄箱）
+    if 'outbox_event' not in inspector.get_table_names():
+        op.create_table('outbox_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('dispatched_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('idx_outbox_pending', 'outbox_event', ['dispatched_at', 'id'], unique=False)
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    if 'outbox_event' in inspector.get_table_names():
+        op.drop_index('idx_outbox_pending', table_name='outbox_event')
+        op.drop_table('outbox_event')
@@ -0,0 +1,37 @@
+"""add_shop_menu_version
+
+Revision ID: f2a6c9d3e8b1
+Revises: e5b8c2d6f0a4
+Create Date: 2026-10-18 13:48:26.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c9d3e8b1'
+down_revision = 'e5b8c2d6f0a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    # 店鋪菜單文件版本號（單調遞增，作為 ETag）
+    columns = [col['name'] for col in inspector.get_columns('shop')]
+    if 'menu_version' not in columns:
+        with op.batch_alter_table('shop', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('menu_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    
+    columns = [col['name'] for col in inspector.get_columns('shop')]
+    if 'menu_version' in columns:
+        with op.batch_alter_table('shop', schema=None) as batch_op:
+            batch_op.drop_column('menu_version')
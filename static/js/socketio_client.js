@@ -3,18 +3,124 @@
     let socket = null;
     let reconnectAttempts = 0;
     const MAX_RECONNECT_ATTEMPTS = 5;
+    // 服务器支持的传输方式（由 base/app.html 依 SOCKETIO_TRANSPORTS 输出），依序尝试
+    const TRANSPORTS = window.SOCKETIO_TRANSPORTS || ['polling'];
+    // WebSocket 连不上（代理不支持升级等）时记住改用 polling，本次浏览期间不再尝试
+    const POLLING_FALLBACK_KEY = 'socketio_polling_fallback';
+    // 收到的最大事件序号（房间事件带有 seq），重连后据此向服务器补收断线期间错过的事件
+    let lastSeq = null;
+    // 本次连接已收到的序号：补送的事件若已实时收到则跳过
+    let deliveredSeqs = {};
+    let deliveredCount = 0;
+    // 只保留最近收到的这么多个序号（序号依送出顺序递增但不连续，补送只会带来最新的事件），记录数超过两倍时清理
+    const DELIVERED_SEQ_WINDOW = 500;
+    // 事件名称 -> 处理函数（实时事件与补送事件共用）
+    const handlers = {};
+    
+    function preferredTransports() {
+        if (TRANSPORTS[0] !== 'websocket') {
+            return ['polling'];
+        }
+        try {
+            if (window.sessionStorage.getItem(POLLING_FALLBACK_KEY)) {
+                return ['polling'];
+            }
+        } catch (e) {
+            // 无法使用 sessionStorage（隐私模式等）时照常尝试 WebSocket
+        }
+        return ['websocket'];
+    }
+    
+    function fallBackToPolling() {
+        if (socket.io.opts.transports[0] !== 'websocket' || TRANSPORTS.indexOf('polling') === -1) {
+            return;
+        }
+        console.warn('Socket.IO WebSocket unavailable, falling back to polling');
+        socket.io.opts.transports = ['polling'];
+        try {
+            window.sessionStorage.setItem(POLLING_FALLBACK_KEY, '1');
+        } catch (e) {
+            // 忽略
+        }
+    }
+    
+    function trackSeq(data) {
+        if (!data || typeof data.seq !== 'number') {
+            return true;
+        }
+        if (deliveredSeqs[data.seq]) {
+            return false;
+        }
+        deliveredSeqs[data.seq] = true;
+        if (lastSeq === null || data.seq > lastSeq) {
+            lastSeq = data.seq;
+        }
+        deliveredCount++;
+        if (deliveredCount > DELIVERED_SEQ_WINDOW * 2) {
+            pruneDeliveredSeqs();
+        }
+        return true;
+    }
+    
+    function pruneDeliveredSeqs() {
+        const seqs = Object.keys(deliveredSeqs).map(Number).sort(function(a, b) {
+            return b - a;
+        });
+        deliveredSeqs = {};
+        seqs.slice(0, DELIVERED_SEQ_WINDOW).forEach(function(seq) {
+            deliveredSeqs[seq] = true;
+        });
+        deliveredCount = Object.keys(deliveredSeqs).length;
+    }
+    
+    // 实时事件与补送事件共用：合并事件（orders_batch）按其中每个事件的序号去重
+    function deliver(event, data) {
+        const handler = handlers[event];
+        if (handler && (event === 'orders_batch' || trackSeq(data))) {
+            handler(data);
+        }
+    }
+    
+    function on(event, handler) {
+        handlers[event] = handler;
+        socket.on(event, function(data) {
+            deliver(event, data);
+        });
+    }
+    
+    function requestReplay() {
+        deliveredSeqs = {};
+        deliveredCount = 0;
+        socket.emit('replay', { last_seq: lastSeq }, function(result) {
+            if (!result) {
+                return;
+            }
+            (result.events || []).forEach(function(item) {
+                deliver(item.event, item.data);
+            });
+            if (!result.complete) {
+                // 断线期间的事件无法补齐，由页面重新加载完整数据
+                console.warn('Socket.IO missed events could not be replayed, resync required');
+                window.dispatchEvent(new CustomEvent('socketResync', { detail: result }));
+            }
+            if (typeof result.last_seq === 'number' && (lastSeq === null || result.last_seq > lastSeq)) {
+                lastSeq = result.last_seq;
+            }
+        });
+    }
     
     function initSocket() {
         // 初始化Socket.IO连接，添加重连配置和超时处理
-        // 注意：在 uWSGI/Gunicorn WSGI 环境中，只使用 polling 传输，避免 WebSocket 升级失败
+        // 优先直接以 WebSocket 连接（一条长连接，没有 polling 的反复 HTTP 请求），失败时改用 polling；
+        // 不做 polling → WebSocket 升级，避免多 worker 时升级请求落到其他 worker
         socket = io({
             reconnection: true,
             reconnectionDelay: 1000,
             reconnectionDelayMax: 5000,
             reconnectionAttempts: MAX_RECONNECT_ATTEMPTS,
             timeout: 10000,  // 减少超时时间到10秒
-            transports: ['polling'],  // 只使用 polling，避免 WebSocket 升级失败
-            upgrade: false,  // 禁用升级到 WebSocket
+            transports: preferredTransports(),
+            upgrade: false,
             autoConnect: true,  // 自动连接
             forceNew: false  // 复用连接
         });
@@ -29,8 +135,10 @@
         
         socket.on('connect', function() {
             clearTimeout(connectTimeout);
-            console.log('Socket.IO connected');
+            console.log('Socket.IO connected via', socket.io.engine.transport.name);
             reconnectAttempts = 0;
+            // 首次连接取得目前序号；重连时补收断线期间的房间事件
+            requestReplay();
         });
         
         socket.on('disconnect', function(reason) {
@@ -43,6 +151,7 @@
         
         socket.on('connect_error', function(error) {
             reconnectAttempts++;
+            fallBackToPolling();
             // 安全地获取错误信息：error 可能是 Error 对象、字符串或其他类型
             const errorMessage = error && typeof error === 'object' && error.message 
                 ? error.message 
@@ -83,26 +192,62 @@
         });
         
         // 订单更新事件
-        socket.on('order_updated', function(data) {
+        on('order_updated', function(data) {
             console.log('Order updated:', data);
             // 触发自定义事件，让页面可以监听
             window.dispatchEvent(new CustomEvent('orderUpdated', { detail: data }));
         });
         
+        // 批次订单状态更新（每个频道一个事件，内含多笔订单）
+        on('orders_updated', function(data) {
+            console.log('Orders updated:', data);
+            window.dispatchEvent(new CustomEvent('ordersUpdated', { detail: data }));
+            // 逐笔转发，让只监听 orderUpdated 的页面无需修改
+            (data.orders || []).forEach(function(order) {
+                window.dispatchEvent(new CustomEvent('orderUpdated', { detail: order }));
+            });
+        });
+        
+        // 合并的订单事件（服务器设置 SOCKETIO_COALESCE_WINDOW_MS 时，同一频道短时间内的订单事件合并为一则）
+        // data.events 依原顺序逐笔转发为 newOrder / orderUpdated / ordersUpdated，data.orders 为每笔订单的最新状态
+        on('orders_batch', function(data) {
+            console.log('Orders batch:', data);
+            window.dispatchEvent(new CustomEvent('ordersBatch', { detail: data }));
+            (data.events || []).forEach(function(item) {
+                deliver(item.event, item.data);
+            });
+        });
+        
         // 产品更新事件
-        socket.on('product_updated', function(data) {
+        on('product_updated', function(data) {
             console.log('Product updated:', data);
             window.dispatchEvent(new CustomEvent('productUpdated', { detail: data }));
         });
         
         // 产品状态变更事件
-        socket.on('product_status_changed', function(data) {
+        on('product_status_changed', function(data) {
             console.log('Product status changed:', data);
             window.dispatchEvent(new CustomEvent('productStatusChanged', { detail: data }));
         });
         
+        // 批次产品更新（每个店铺一个事件，内含多个产品的库存或上架状态）
+        on('products_updated', function(data) {
+            console.log('Products updated:', data);
+            window.dispatchEvent(new CustomEvent('productsUpdated', { detail: data }));
+            // 逐笔转发，让只监听 productUpdated / productStatusChanged 的页面无需修改
+            (data.products || []).forEach(function(change) {
+                var detail = Object.assign({ shop_id: data.shop_id }, change);
+                window.dispatchEvent(new CustomEvent('productUpdated', { detail: detail }));
+                if (data.field === 'is_active') {
+                    window.dispatchEvent(new CustomEvent('productStatusChanged', {
+                        detail: Object.assign({ old_status: change.old_is_active }, detail)
+                    }));
+                }
+            });
+        });
+        
         // 新订单通知
-        socket.on('new_order', function(data) {
+        on('new_order', function(data) {
             console.log('New order:', data);
             window.dispatchEvent(new CustomEvent('newOrder', { detail: data }));
         });